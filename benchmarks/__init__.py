@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：性能基准测试的公共方法
+# 创建日期：2026/10/18
+# 说明：基准测试以脚本方式运行，如 python -m benchmarks.bench_msgtodict
+# -------------------------------------------------------------------------
+
+import time
+
+
+def measure(func, number=10000, repeat=5):
+    """
+    多次执行函数，返回单次调用的最佳耗时
+    :param func: 无参数的被测函数
+    :param number: 每轮执行的次数
+    :param repeat: 执行的轮数
+    :return: 单次调用的最佳耗时，单位为微秒
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number * 1e6
+
+
+def report(title, rows):
+    """
+    以表格形式输出基准测试结果
+    :param title: 测试标题
+    :param rows: 结果列表，每一项为(名称, 单次耗时微秒)
+    """
+    print(title)
+    baseline = rows[0][1] if rows else None
+    for name, cost in rows:
+        ratio = baseline / cost if cost else 0
+        print("  {0:<40} {1:>10.2f} us  x{2:.2f}".format(name, cost, ratio))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比立即创建与延迟创建公众号时，SimpleWxService的启动耗时和内存占用
+# 创建日期：2026/10/18
+# 说明：python -m benchmarks.bench_cold_start
+# -------------------------------------------------------------------------
+
+import logging
+import time
+import tracemalloc
+
+from weixin.logger import log
+from weixin.wechat import SimpleWxService
+
+ACCOUNT_COUNTS = (10, 100, 500)
+AES_KEY = "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J"
+
+TEXT_XML = "<xml><ToUserName><![CDATA[gh_bench]]></ToUserName>" \
+           "<FromUserName><![CDATA[openid]]></FromUserName>" \
+           "<CreateTime>1515935965</CreateTime><MsgType><![CDATA[text]]></MsgType>" \
+           "<Content><![CDATA[hello]]></Content><MsgId>6510895392933538073</MsgId></xml>"
+
+
+def make_settings(count):
+    return {"bench%d" % i: {
+        "appid": "wxbench%010d" % i,
+        "token": "token%d" % i,
+        "secret": "secret%d" % i,
+        "encodingAESKey": AES_KEY,
+        "handlers": ["weixin.wechat.EchoHandler"],
+    } for i in range(count)}
+
+
+def start_service(settings, lazy):
+    """
+    :return: (服务对象, 启动耗时毫秒, 启动后占用的内存KB)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    service = SimpleWxService(settings, lazy=lazy)
+    elapsed = (time.perf_counter() - start) * 1000
+    size = tracemalloc.get_traced_memory()[0] / 1024.0
+    tracemalloc.stop()
+    return service, elapsed, size
+
+
+def first_request(service, key):
+    start = time.perf_counter()
+    service.do_post(key, TEXT_XML)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    log.setLevel(logging.WARNING)
+    print("{0:>8} {1:>6} {2:>12} {3:>12} {4:>16} {5:>16}".format(
+        "公众号数", "方式", "启动ms", "内存KB", "首个请求ms", "后续请求ms"))
+    for count in ACCOUNT_COUNTS:
+        settings = make_settings(count)
+        for lazy in (False, True):
+            service, elapsed, size = start_service(settings, lazy)
+            first = first_request(service, "bench0")
+            second = first_request(service, "bench0")
+            print("{0:>10} {1:>8} {2:>14.2f} {3:>14.1f} {4:>19.3f} {5:>19.3f}".format(
+                count, "延迟" if lazy else "立即", elapsed, size, first, second))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：统计安全模式下每条消息的加解密耗时
+# 创建日期：2026/10/18
+# 说明：与每次创建密钥和加密器、逐段拼接字节串的常见实现进行对比
+# -------------------------------------------------------------------------
+
+import base64
+import string
+import struct
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from benchmarks import measure, report
+from weixin.crypto import PrpCrypt, MessageCryptor
+from weixin.utils import rand_str
+
+AES_KEY = "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J"
+APPID = "wxff1ec8c09ae8c622"
+
+TEXT_REPLY = r"<xml>" \
+             r"<ToUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></ToUserName>" \
+             r"<FromUserName><![CDATA[gh_153407c191e4]]></FromUserName>" \
+             r"<CreateTime>1515935965</CreateTime>" \
+             r"<MsgType><![CDATA[text]]></MsgType>" \
+             r"<Content><![CDATA[收到来自o-Qi-1Or0HmcnUyGqjXkhB4A6qqw的消息。]]></Content>" \
+             r"</xml>"
+NEWS_REPLY = TEXT_REPLY.replace("收到来自o-Qi-1Or0HmcnUyGqjXkhB4A6qqw的消息。", "图文消息" * 200)
+
+
+class LegacyPrpCrypt(object):
+    """
+    每次调用都重新解码密钥、创建加密器，并逐段拼接字节串
+    """
+
+    def __init__(self, encoding_aes_key):
+        self.encoding_aes_key = encoding_aes_key
+
+    def encrypt(self, text, appid):
+        key = base64.b64decode(self.encoding_aes_key + "=")
+        text = text.encode("utf-8")
+        text = rand_str(16, string.ascii_letters).encode() + struct.pack("!I", len(text)) + text + appid.encode()
+        pad = 32 - len(text) % 32
+        text = text + (chr(pad) * pad).encode()
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(key[:16]), backend=default_backend()).encryptor()
+        return base64.b64encode(encryptor.update(text) + encryptor.finalize()).decode()
+
+    def decrypt(self, text, appid):
+        key = base64.b64decode(self.encoding_aes_key + "=")
+        decryptor = Cipher(algorithms.AES(key), modes.CBC(key[:16]), backend=default_backend()).decryptor()
+        plain = decryptor.update(base64.b64decode(text)) + decryptor.finalize()
+        content = plain[16:-plain[-1]]
+        length = struct.unpack("!I", content[:4])[0]
+        if content[4 + length:].decode() != appid:
+            raise ValueError("appid")
+        return content[4:4 + length].decode("utf-8")
+
+
+def main():
+    pc = PrpCrypt(base64.b64decode(AES_KEY + "="))
+    legacy = LegacyPrpCrypt(AES_KEY)
+    cryptor = MessageCryptor(APPID, "token", AES_KEY)
+    for title, text in (("文本回复(%d字节)" % len(TEXT_REPLY.encode()), TEXT_REPLY),
+                        ("长回复(%d字节)" % len(NEWS_REPLY.encode()), NEWS_REPLY)):
+        encrypted = pc.encrypt(text, APPID)
+        report(title + "，加密", [
+            ("每次创建加密器并拼接字节串", measure(lambda: legacy.encrypt(text, APPID))),
+            ("PrpCrypt.encrypt", measure(lambda: pc.encrypt(text, APPID))),
+            ("MessageCryptor.encrypt_msg", measure(lambda: cryptor.encrypt_msg(text, "1320562132", "1409735669"))),
+        ])
+        envelope = cryptor.encrypt_msg(text, "1320562132", "1409735669")
+        signature = envelope.split("<MsgSignature><![CDATA[", 1)[1].split("]]>", 1)[0]
+        encrypt = envelope.split("<Encrypt><![CDATA[", 1)[1].split("]]>", 1)[0]
+        report(title + "，解密", [
+            ("每次创建加密器并拼接字节串", measure(lambda: legacy.decrypt(encrypted, APPID))),
+            ("PrpCrypt.decrypt", measure(lambda: pc.decrypt(encrypted, APPID))),
+            ("MessageCryptor.decrypt_msg",
+             measure(lambda: cryptor.decrypt_msg(encrypt, signature, "1409735669", "1320562132"))),
+        ])
+
+
+if __name__ == '__main__':
+    main()
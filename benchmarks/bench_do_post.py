@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：SimpleWxService.do_post的端到端基准测试
+# 创建日期：2026/10/18
+# 说明：多个公众号按实际比例处理文本、图片、位置和事件消息，分别测试明文和加密模式，
+#      输出吞吐量、延迟分位数和每条消息的内存分配，结果可保存为JSON用于对比
+#      python -m benchmarks.bench_do_post --output before.json
+#      python -m benchmarks.bench_do_post --compare before.json
+# -------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from weixin.logger import log
+from weixin.render import render_text
+from weixin.wechat import SimpleWxService, Handler, CONCURRENCY
+from wxbot.management.traffic import MIX, TEMPLATES, CONTENTS
+
+ACCOUNTS = 3
+AES_KEY = "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J"
+
+# 每个请求使用不同的消息标识和随机数，避免被当作重试或重放的请求
+_sequence = itertools.count()
+
+
+# ---------------------------------------------------------------------------
+#   合成的消息处理器
+# ---------------------------------------------------------------------------
+
+class TextReplyHandler(Handler):
+    msg_types = ("text",)
+    concurrency = CONCURRENCY.THREAD_SAFE
+
+    def reply(self, record):
+        msg = record.msg
+        return render_text(msg.fromUserName, msg.toUserName, "收到:" + msg.content)
+
+
+class MediaHandler(Handler):
+    msg_types = ("image", "location")
+    concurrency = CONCURRENCY.THREAD_SAFE
+
+    def reply(self, record):
+        msg = record.msg
+        return render_text(msg.fromUserName, msg.toUserName, "收到%s消息" % msg.msgType)
+
+
+class MenuHandler(Handler):
+    msg_types = ("event",)
+    events = ("CLICK", "subscribe")
+    concurrency = CONCURRENCY.PER_USER
+
+    def reply(self, record):
+        msg = record.msg
+        session = record.session
+        session["clicks"] = session.get("clicks", 0) + 1
+        return render_text(msg.fromUserName, msg.toUserName, "菜单%s" % getattr(msg, "eventKey", ""))
+
+
+# ---------------------------------------------------------------------------
+#   负载
+# ---------------------------------------------------------------------------
+
+def build_service(encrypted):
+    settings = {}
+    for i in range(ACCOUNTS):
+        settings["bench%d" % i] = {
+            "appid": "wxbench%010d" % i,
+            "token": "token%d" % i,
+            "secret": "secret%d" % i,
+            "encodingAESKey": AES_KEY,
+        }
+    # 基准测试不输出日志
+    service = SimpleWxService(settings, lazy=False)
+    log.setLevel(logging.WARNING)
+    for account in service.accounts.values():
+        account.handler_list = [TextReplyHandler(), MediaHandler(), MenuHandler()]
+    return service
+
+
+def signed_params(token, nonce):
+    timestamp = str(int(time.time()))
+    signature = hashlib.sha1("".join(sorted([token, timestamp, nonce])).encode("utf-8")).hexdigest()
+    return {"signature": signature, "timestamp": timestamp, "nonce": nonce}
+
+
+def make_requests(service, count, encrypted, seed):
+    """
+    生成请求列表，每一项为(公众号标识, 消息类型, 请求数据, 请求参数)
+    """
+    rnd = random.Random(seed)
+    kinds = [k for k, weight in MIX for _ in range(weight)]
+    ids = sorted(service.accounts.keys())
+    requests = []
+    for i in range(count):
+        seq = next(_sequence)
+        account = service.accounts[ids[i % len(ids)]]
+        kind = rnd.choice(kinds)
+        xml = TEMPLATES[kind].format(openid="openid-%d" % rnd.randint(0, 199), ts=1515935965 + seq,
+                                     msgid=6510895392933538073 + seq, content=rnd.choice(CONTENTS))
+        params = signed_params(account.token, "n%d" % seq)
+        if encrypted:
+            xml = account.crypto.encrypt_msg(xml, params["nonce"], params["timestamp"])
+            params["msg_signature"] = xml_field(xml, "MsgSignature")
+            params["encrypt_type"] = "aes"
+        requests.append((account.id, kind, xml, params))
+    return requests
+
+
+def xml_field(xml, tag):
+    start = xml.index("<%s><![CDATA[" % tag) + len(tag) + 11
+    return xml[start:xml.index("]]>", start)]
+
+
+def can_encrypt():
+    """
+    检查消息加解密器能否完成一次加密和解密
+    """
+    service = build_service(True)
+    try:
+        requests = make_requests(service, 1, True, 0)
+        account_id, kind, xml, params = requests[0]
+        return bool(service.do_post(account_id, xml, params))
+    except Exception as e:
+        print("加密模式无法运行，跳过:%s" % e)
+        return False
+
+
+# ---------------------------------------------------------------------------
+#   测试
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_scenario(name, encrypted, count, seed):
+    service = build_service(encrypted)
+    warmup = make_requests(service, min(200, count), encrypted, seed + 1)
+    for account_id, kind, xml, params in warmup:
+        service.do_post(account_id, xml, params)
+
+    # 吞吐量和延迟
+    requests = make_requests(service, count, encrypted, seed)
+    latencies = {}
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for account_id, kind, xml, params in requests:
+        t0 = perf_counter()
+        service.do_post(account_id, xml, params)
+        latencies.setdefault(kind, []).append(perf_counter() - t0)
+    elapsed = perf_counter() - start
+
+    # 内存分配：每条消息处理过程中的峰值内存和处理完成后保留的内存
+    requests = make_requests(service, min(count, 2000), encrypted, seed + 2)
+    tracemalloc.start()
+    peaks = 0
+    before = tracemalloc.take_snapshot()
+    for account_id, kind, xml, params in requests:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        service.do_post(account_id, xml, params)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    all_latencies = sorted(v for values in latencies.values() for v in values)
+    result = {
+        "name": name,
+        "messages": count,
+        "throughput": count / elapsed,
+        "latency_us": summarize(all_latencies),
+        "by_type_us": {kind: summarize(sorted(values)) for kind, values in sorted(latencies.items())},
+        "peak_bytes_per_msg": peaks / len(requests),
+        "retained_bytes_per_msg": retained / len(requests),
+    }
+    return result
+
+
+def summarize(sorted_values):
+    return {
+        "p50": percentile(sorted_values, 0.50) * 1e6,
+        "p95": percentile(sorted_values, 0.95) * 1e6,
+        "p99": percentile(sorted_values, 0.99) * 1e6,
+        "max": (sorted_values[-1] if sorted_values else 0.0) * 1e6,
+    }
+
+
+def print_result(result, baseline=None):
+    print("%s: %d条消息" % (result["name"], result["messages"]))
+    line = "  吞吐量 {0:>10.1f} msg/s".format(result["throughput"])
+    if baseline:
+        line += "  x{0:.2f}".format(result["throughput"] / baseline["throughput"])
+    print(line)
+    latency = result["latency_us"]
+    print("  延迟   p50 {p50:>8.1f} us  p95 {p95:>8.1f} us  p99 {p99:>8.1f} us  max {max:>9.1f} us".format(**latency))
+    for kind, values in result["by_type_us"].items():
+        print("    {0:<16} p50 {p50:>8.1f} us  p99 {p99:>8.1f} us".format(kind, **values))
+    line = "  内存   峰值 {0:>8.0f} B/msg  保留 {1:>8.1f} B/msg".format(result["peak_bytes_per_msg"],
+                                                                  result["retained_bytes_per_msg"])
+    if baseline:
+        line += "  峰值x{0:.2f}".format(baseline["peak_bytes_per_msg"] / (result["peak_bytes_per_msg"] or 1))
+    print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SimpleWxService.do_post基准测试")
+    parser.add_argument("--messages", type=int, default=5000, help="每个场景处理的消息数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="保存结果的JSON文件")
+    parser.add_argument("--compare", help="用于对比的历史结果JSON文件")
+    args = parser.parse_args(argv)
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baselines = {r["name"]: r for r in json.load(f)["results"]}
+
+    scenarios = [("plaintext", False)]
+    if can_encrypt():
+        scenarios.append(("encrypted", True))
+    results = []
+    for name, encrypted in scenarios:
+        result = run_scenario(name, encrypted, args.messages, args.seed)
+        print_result(result, baselines.get(name))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "revision": git_revision(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "accounts": ACCOUNTS,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print("结果已保存到%s" % args.output)
+
+
+if __name__ == '__main__':
+    main()
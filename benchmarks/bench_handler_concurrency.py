@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比消息处理器在不同并发方式下的多线程吞吐量
+# 创建日期：2026/10/18
+# 说明：模拟多线程WSGI服务器，消息处理器中的等待模拟数据库或HTTP调用
+# -------------------------------------------------------------------------
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from weixin.utils import msgtodict, parse_message
+from weixin.wechat import Handler, CONCURRENCY, MsgRecord
+
+THREADS = 16
+MESSAGES = 800
+USERS = 50
+REPLY_SECONDS = 0.005
+
+
+class SleepHandler(Handler):
+    def reply(self, record):
+        time.sleep(REPLY_SECONDS)
+        return "ok"
+
+
+def make_records():
+    records = []
+    for i in range(MESSAGES):
+        xml = r"<xml>" \
+              r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+              r"<FromUserName><![CDATA[openid-%d]]></FromUserName>" \
+              r"<CreateTime>1515935965</CreateTime>" \
+              r"<MsgType><![CDATA[text]]></MsgType>" \
+              r"<Content><![CDATA[hello]]></Content>" \
+              r"<MsgId>%d</MsgId>" \
+              r"</xml>" % (i % USERS, i)
+        records.append(MsgRecord("appid", None, parse_message(msgtodict(xml)), None))
+    return records
+
+
+def run(concurrency, records):
+    handler = SleepHandler()
+    handler.concurrency = concurrency
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        list(executor.map(handler.handle, records))
+    return len(records) / (time.perf_counter() - start)
+
+
+def main():
+    records = make_records()
+    print("%d个线程处理%d条消息(%d个用户)，每条消息处理耗时%.1fms" % (THREADS, MESSAGES, USERS, REPLY_SECONDS * 1000))
+    baseline = None
+    for concurrency in (CONCURRENCY.SERIAL, CONCURRENCY.PER_USER, CONCURRENCY.THREAD_SAFE):
+        throughput = run(concurrency, records)
+        baseline = baseline or throughput
+        print("  {0:<12} {1:>10.1f} msg/s  x{2:.2f}".format(concurrency.name, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
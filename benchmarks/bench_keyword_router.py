@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比关键字数量增长时，逐个判断关键字与使用KeywordRouter的匹配耗时
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import random
+
+from benchmarks import measure, report
+from weixin.keywords import KeywordRouter
+
+RULE_COUNTS = (10, 100, 1000, 5000)
+ALPHABET = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可也你说"
+
+
+def make_keywords(count, rnd):
+    keywords = set()
+    while len(keywords) < count:
+        keywords.add("".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(3, 6))))
+    return sorted(keywords)
+
+
+def make_messages(keywords, rnd):
+    messages = []
+    for i in range(50):
+        text = "".join(rnd.choice(ALPHABET) for _ in range(40))
+        if i % 5 == 0:
+            text = text[:20] + rnd.choice(keywords) + text[20:]
+        messages.append(text)
+    return messages
+
+
+def naive_match(rules, text):
+    best = None
+    for keyword, target in rules:
+        if keyword in text and (best is None or len(keyword) > len(best[0])):
+            best = (keyword, target)
+    return best
+
+
+def main():
+    rnd = random.Random(0)
+    for count in RULE_COUNTS:
+        keywords = make_keywords(count, rnd)
+        messages = make_messages(keywords, rnd)
+        rules = [(k, k) for k in keywords]
+        router = KeywordRouter(rules)
+
+        def naive():
+            for text in messages:
+                naive_match(rules, text)
+
+        def automaton():
+            for text in messages:
+                router.match(text)
+
+        number = max(1, 20000 // count)
+        report("%d条关键字，每次匹配%d条消息" % (count, len(messages)), [
+            ("逐个判断关键字", measure(naive, number=number)),
+            ("KeywordRouter", measure(automaton, number=number)),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：统计每条消息解析后的内存分配
+# 创建日期：2026/10/18
+# 说明：与原有的使用实例字典并在构造时复制全部字段的消息类型进行对比
+# -------------------------------------------------------------------------
+
+import tracemalloc
+
+from benchmarks import measure, report
+from weixin.utils import msgtodict, parse_message
+from weixin.wechat import MsgRecord
+
+COUNT = 10000
+
+PAYLOADS = {
+    "text": r"<xml>"
+            r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+            r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>"
+            r"<CreateTime>1515935965</CreateTime>"
+            r"<MsgType><![CDATA[text]]></MsgType>"
+            r"<Content><![CDATA[hello]]></Content>"
+            r"<MsgId>6510895392933538073</MsgId>"
+            r"</xml>",
+    "location": r"<xml>"
+                r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+                r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>"
+                r"<CreateTime>1515935965</CreateTime>"
+                r"<MsgType><![CDATA[location]]></MsgType>"
+                r"<Location_X>23.134521</Location_X>"
+                r"<Location_Y>113.358803</Location_Y>"
+                r"<Scale>20</Scale>"
+                r"<Label><![CDATA[位置信息]]></Label>"
+                r"<MsgId>1234567890123456</MsgId>"
+                r"</xml>",
+    "event": r"<xml>"
+             r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+             r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>"
+             r"<CreateTime>1515935965</CreateTime>"
+             r"<MsgType><![CDATA[event]]></MsgType>"
+             r"<Event><![CDATA[LOCATION]]></Event>"
+             r"<Latitude>23.137466</Latitude>"
+             r"<Longitude>113.352425</Longitude>"
+             r"<Precision>119.385040</Precision>"
+             r"</xml>",
+}
+
+
+class LegacyMessage(object):
+    """
+    原有的消息类型：使用实例字典，构造时复制全部字段
+    """
+
+    def __init__(self, dic):
+        self.toUserName = dic['ToUserName']
+        self.fromUserName = dic['FromUserName']
+        self.createTime = dic['CreateTime']
+        self.msgType = dic['MsgType']
+
+
+class LegacyText(LegacyMessage):
+    def __init__(self, dic):
+        super().__init__(dic)
+        self.msgId = dic['MsgId']
+        self.content = dic['Content']
+
+
+class LegacyLocation(LegacyMessage):
+    def __init__(self, dic):
+        super().__init__(dic)
+        self.msgId = dic['MsgId']
+        self.location_x = dic['Location_X']
+        self.location_y = dic['Location_Y']
+        self.scale = dic.get('Scale', '1')
+        self.label = dic['Label']
+
+
+class LegacyLocationEvent(LegacyMessage):
+    def __init__(self, dic):
+        super().__init__(dic)
+        self.event = dic["Event"]
+        self.latitude = dic["Latitude"]
+        self.longitude = dic["Longitude"]
+        self.precision = dic["Precision"]
+
+
+LEGACY_TYPES = {"text": LegacyText, "location": LegacyLocation, "event": LegacyLocationEvent}
+
+
+class LegacyRecord(object):
+    def __init__(self, appid, kind, msg, client):
+        self.appid = appid
+        self.kind = kind
+        self.msg = msg
+        self.client = client
+
+
+def build_slotted(xml):
+    return MsgRecord("appid", None, parse_message(msgtodict(xml)), None)
+
+
+def build_legacy(xml):
+    dic = msgtodict(xml)
+    return LegacyRecord("appid", None, LEGACY_TYPES[dic["MsgType"]](dic), None)
+
+
+def allocations(build, xml):
+    """
+    统计每条消息保留的内存块数量和字节数
+    """
+    build(xml)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [build(xml) for _ in range(COUNT)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(s.count_diff for s in stats)
+    size = sum(s.size_diff for s in stats)
+    del records
+    return blocks / COUNT, size / COUNT
+
+
+def main():
+    for name, xml in PAYLOADS.items():
+        print("%s消息:" % name)
+        for label, build in (("实例字典", build_legacy), ("__slots__", build_slotted)):
+            blocks, size = allocations(build, xml)
+            print("  {0:<12} {1:>6.1f} 块/消息 {2:>8.1f} 字节/消息".format(label, blocks, size))
+        report("  构造耗时", [
+            ("实例字典", measure(lambda: build_legacy(xml))),
+            ("__slots__", measure(lambda: build_slotted(xml))),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比单遍扫描与ElementTree解析消息XML的性能
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+from benchmarks import measure, report
+from weixin.utils import msgtodict, _msgtodict_etree
+
+TEXT_XML = r"<xml>" \
+           r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+           r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+           r"<CreateTime>1515935965</CreateTime>" \
+           r"<MsgType><![CDATA[text]]></MsgType>" \
+           r"<Content><![CDATA[欢迎开启公众号开发者模式]]></Content>" \
+           r"<MsgId>6510895392933538073</MsgId>" \
+           r"</xml>"
+
+EVENT_XML = r"<xml>" \
+            r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+            r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+            r"<CreateTime>1515935965</CreateTime>" \
+            r"<MsgType><![CDATA[event]]></MsgType>" \
+            r"<Event><![CDATA[LOCATION]]></Event>" \
+            r"<Latitude>23.137466</Latitude>" \
+            r"<Longitude>113.352425</Longitude>" \
+            r"<Precision>119.385040</Precision>" \
+            r"</xml>"
+
+ENCRYPT_XML = r"<xml>" \
+              r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+              r"<Encrypt><![CDATA[" + "A" * 512 + r"]]></Encrypt>" \
+              r"</xml>"
+
+
+def main():
+    for name, xml in (("text", TEXT_XML), ("event", EVENT_XML), ("encrypt", ENCRYPT_XML)):
+        data = xml.encode("utf-8")
+        assert msgtodict(xml) == _msgtodict_etree(xml)
+        assert msgtodict(data) == _msgtodict_etree(data)
+        report("msgtodict - %s消息" % name, [
+            ("ElementTree(str)", measure(lambda: _msgtodict_etree(xml))),
+            ("单遍扫描(str)", measure(lambda: msgtodict(xml))),
+            ("ElementTree(bytes)", measure(lambda: _msgtodict_etree(data))),
+            ("单遍扫描(bytes)", measure(lambda: msgtodict(data))),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比使用str.format格式化整个模板与拼接预先计算的片段输出回复消息的耗时
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+from benchmarks import measure, report
+from weixin.render import Article, Renderer, render_text
+
+# 原来的文本消息模板
+_LEGACY_TEXT_XML = r"<xml>" \
+                   r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
+                   r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
+                   r"<CreateTime>{2}</CreateTime>" \
+                   r"<MsgType><![CDATA[text]]></MsgType>" \
+                   r"<Content><![CDATA[{3}]]></Content>" \
+                   r"</xml>"
+
+_LEGACY_IMAGE_XML = r"<xml>" \
+                    r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
+                    r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
+                    r"<CreateTime>{2}</CreateTime>" \
+                    r"<MsgType><![CDATA[image]]></MsgType>" \
+                    r"<Image><MediaId><![CDATA[{3}]]></MediaId></Image>" \
+                    r"</xml>"
+
+_LEGACY_NEWS_XML = r"<xml>" \
+                   r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
+                   r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
+                   r"<CreateTime>{2}</CreateTime>" \
+                   r"<MsgType><![CDATA[news]]></MsgType>" \
+                   r"<ArticleCount>{3}</ArticleCount>" \
+                   r"<Articles>{4}</Articles>" \
+                   r"</xml>"
+
+_LEGACY_ARTICLE_XML = r"<item>" \
+                      r"<Title><![CDATA[{0}]]></Title>" \
+                      r"<Description><![CDATA[{1}]]></Description>" \
+                      r"<PicUrl><![CDATA[{2}]]></PicUrl>" \
+                      r"<Url><![CDATA[{3}]]></Url>" \
+                      r"</item>"
+
+OPENID = "oUpF8uMuAJO_M2pxb1Q9zNjWeS6o"
+USERID = "gh_1234567890ab"
+TIMESTAMP = "1500000000"
+CONTENTS = {
+    "短文本": "你好",
+    "长文本": "您好，您的订单已经发货，预计三天内送达，请注意查收。" * 10,
+}
+
+
+def main():
+    renderer = Renderer(USERID)
+    for name, content in CONTENTS.items():
+        report("文本消息(%s)" % name, [
+            ("str.format模板", measure(lambda: _LEGACY_TEXT_XML.format(OPENID, USERID, TIMESTAMP, content),
+                                     number=100000)),
+            ("render_text", measure(lambda: render_text(OPENID, USERID, content, TIMESTAMP), number=100000)),
+            ("Renderer.render_text", measure(lambda: renderer.render_text(OPENID, content, TIMESTAMP),
+                                             number=100000)),
+        ])
+
+    report("图片消息", [
+        ("str.format模板", measure(lambda: _LEGACY_IMAGE_XML.format(OPENID, USERID, TIMESTAMP, "media_id"),
+                                 number=100000)),
+        ("Renderer.render_image", measure(lambda: renderer.render_image(OPENID, "media_id", TIMESTAMP),
+                                          number=100000)),
+    ])
+
+    articles = [Article("标题%d" % i, "描述%d" % i, "http://example.com/%d.jpg" % i, "http://example.com/%d" % i)
+                for i in range(8)]
+
+    def legacy_news():
+        items = "".join(_LEGACY_ARTICLE_XML.format(a.title, a.desc, a.picurl, a.url) for a in articles)
+        return _LEGACY_NEWS_XML.format(OPENID, USERID, TIMESTAMP, len(articles), items)
+
+    report("图文消息(8条)", [
+        ("str.format模板", measure(legacy_news, number=20000)),
+        ("Renderer.render_news", measure(lambda: renderer.render_news(OPENID, articles, TIMESTAMP), number=20000)),
+    ])
+
+
+if __name__ == "__main__":
+    main()
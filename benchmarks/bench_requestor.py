@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比每次调用API都新建连接与使用DefaultRequstor连接池的调用耗时
+# 创建日期：2026/10/18
+# 说明：在本机启动使用自签名证书的HTTPS服务器代替api.weixin.qq.com，python -m benchmarks.bench_requestor
+# -------------------------------------------------------------------------
+
+import datetime
+import ipaddress
+import json
+import os
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from weixin.api.client import DefaultRequstor
+
+CALLS = 300
+THREADS = 8
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = json.dumps({"errcode": 0, "errmsg": "ok", "ip_list": ["127.0.0.1"]}).encode("utf-8")
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_certificate(directory):
+    """
+    生成127.0.0.1的自签名证书
+    :return: (证书文件, 私钥文件)
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1)) \
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+                       critical=False) \
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True) \
+        .sign(key, hashes.SHA256())
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_file, key_file
+
+
+def start_server(cert_file, key_file):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ApiHandler)
+    server.daemon_threads = True
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(call, threads):
+    """
+    多个线程并发调用，返回单次调用的平均耗时，单位为毫秒
+    """
+    per_thread = CALLS // threads
+
+    def worker():
+        for _ in range(per_thread):
+            call()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * threads * 1000
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        cert_file, key_file = make_certificate(directory)
+        server = start_server(cert_file, key_file)
+        url = "https://127.0.0.1:%d/cgi-bin/getcallbackip" % server.server_address[1]
+
+        def fresh_connection():
+            r = requests.get(url, verify=cert_file, timeout=10)
+            r.json()
+
+        requestor = DefaultRequstor(pool_maxsize=THREADS)
+
+        def pooled():
+            # 环境变量REQUESTS_CA_BUNDLE会覆盖Session.verify，因此在每次调用时指定证书
+            requestor.get(url, verify=cert_file)
+
+        print("本机HTTPS服务器，每种方式调用%d次" % CALLS)
+        for threads in (1, THREADS):
+            legacy = run(fresh_connection, threads)
+            cost = run(pooled, threads)
+            print("  {0}个线程: 每次新建连接 {1:8.3f} ms/次  连接池 {2:8.3f} ms/次  x{3:.1f}".format(
+                threads, legacy, cost, legacy / cost))
+        requestor.close()
+        server.shutdown()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
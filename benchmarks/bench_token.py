@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：对比每次读取令牌都加锁与无锁读取的耗时，以及令牌过期时调用方等待grant_token的时间
+# 创建日期：2026/10/18
+# 说明：python -m benchmarks.bench_token
+# -------------------------------------------------------------------------
+
+import threading
+import time
+
+from benchmarks import measure, report
+from weixin.api.client import WxClient, Requestor
+from weixin.api.models import AccessToken
+from weixin.api.token import TokenRefresher
+
+THREADS = 8
+GRANT_DELAY = 0.1
+
+
+class _Requestor(Requestor):
+    def get(self, url, params=None):
+        time.sleep(GRANT_DELAY)
+        return {"access_token": "new", "expires_in": 7200}
+
+
+class LegacyClient(WxClient):
+    """
+    原来的实现：每次读取令牌都加锁检查
+    """
+
+    @property
+    def token(self):
+        self.check_token()
+        return self.access_token.token
+
+    def check_token(self):
+        try:
+            self.acquire_lock()
+            if (self.access_token is None) or (self.access_token.is_expired()):
+                self.access_token = self.grant_token()
+        finally:
+            self.release_lock()
+
+
+def read_threads(client, reads=20000):
+    def worker():
+        for _ in range(reads):
+            client.token
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return (time.perf_counter() - start) / (reads * THREADS) * 1e6
+
+
+def expiry_stall(client):
+    """
+    令牌即将过期时各线程读取令牌的最长等待时间，单位为微秒
+    """
+    stalls = []
+
+    def worker():
+        worst = 0.0
+        for _ in range(50):
+            start = time.perf_counter()
+            client.token
+            worst = max(worst, time.perf_counter() - start)
+            time.sleep(0.005)
+        stalls.append(worst)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return max(stalls) * 1e6
+
+
+def expiring():
+    # 还有61秒过期，1秒后进入提前60秒过期的时间
+    return AccessToken("old", 7200, time.time() - 7200 + 61)
+
+
+def main():
+    token = AccessToken("t", 7200)
+    legacy = LegacyClient("appid", "secret", requestor=_Requestor(), access_token=token)
+    client = WxClient("appid", "secret", requestor=_Requestor(), access_token=token)
+    report("读取有效令牌(单线程)", [
+        ("加锁读取", measure(lambda: legacy.token, number=100000)),
+        ("无锁读取", measure(lambda: client.token, number=100000)),
+    ])
+    report("读取有效令牌(%d线程)" % THREADS, [
+        ("加锁读取", read_threads(legacy)),
+        ("无锁读取", read_threads(client)),
+    ])
+
+    legacy = LegacyClient("appid", "secret", requestor=_Requestor(), access_token=expiring())
+    time.sleep(1)
+    refresher = TokenRefresher(lead=300, jitter=0)
+    client = WxClient("appid", "secret", requestor=_Requestor(), access_token=expiring(), refresher=refresher)
+    time.sleep(1)
+    report("令牌过期时的最长等待(grant_token耗时%dms)" % (GRANT_DELAY * 1000), [
+        ("过期后在调用时刷新", expiry_stall(legacy)),
+        ("后台提前刷新", expiry_stall(client)),
+    ])
+    refresher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试异步调用微信API的AsyncWxClient
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import asyncio
+import io
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import IsolatedAsyncioTestCase
+from urllib.parse import urlparse, parse_qs
+
+from weixin.api.async_client import AsyncRequestor, AsyncWxClient, HttpxRequestor
+from weixin.api.models import AccessToken
+from weixin.exceptions import check_api_error, WxApiException
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+USER = {"subscribe": 1, "openid": "o1", "nickname": "Band", "sex": 1, "language": "zh_CN", "city": "广州",
+        "province": "广东", "country": "中国", "headimgurl": "", "subscribe_time": 1382694957,
+        "unionid": "u1", "remark": "", "groupid": 0, "tagid_list": [], "subscribe_scene": "ADD_SCENE_QR_CODE",
+        "qr_scene": 0, "qr_scene_str": ""}
+
+
+def fake_api(path, query):
+    """
+    模拟微信API的返回结果
+    """
+    if path == "/cgi-bin/token":
+        return {"access_token": "token-" + query["appid"][0], "expires_in": 7200}
+    if query.get("access_token") != ["token-appid"]:
+        return {"errcode": 40001, "errmsg": "invalid credential"}
+    if path == "/cgi-bin/user/info":
+        if query["openid"] == ["nobody"]:
+            return {"errcode": 46004, "errmsg": "user not exist"}
+        return dict(USER, openid=query["openid"][0])
+    if path == "/cgi-bin/menu/get":
+        return {"errcode": 46003, "errmsg": "menu no exist"}
+    if path == "/cgi-bin/getcallbackip":
+        return {"ip_list": ["127.0.0.1"]}
+    return {"errcode": 0, "errmsg": "ok"}
+
+
+class MemoryRequestor(AsyncRequestor):
+    """
+    不经过网络的异步请求处理器，记录请求的路径和同时进行的请求数
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.active = 0
+        self.peak = 0
+
+    async def get(self, url, params=None):
+        u = urlparse(url)
+        query = parse_qs(u.query)
+        query.update({k: [v] for k, v in (params or {}).items()})
+        self.paths.append(u.path)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            r = fake_api(u.path, query)
+        finally:
+            self.active -= 1
+        check_api_error(r)
+        return r
+
+    async def post(self, url, params=None, data=None, files=None, headers=None, **kwargs):
+        return await self.get(url, params)
+
+
+class TestAsyncWxClient(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.requestor = MemoryRequestor()
+        self.client = AsyncWxClient("appid", "secret", requestor=self.requestor)
+
+    async def test_userinfo(self):
+        user = await self.client.get_userinfo("o2")
+        self.assertEqual(user.openid, "o2")
+        self.assertEqual(self.requestor.paths, ["/cgi-bin/token", "/cgi-bin/user/info"])
+
+    async def test_grant_token_once(self):
+        users = await asyncio.gather(*[self.client.get_userinfo("o%d" % i) for i in range(50)])
+        self.assertEqual([u.openid for u in users], ["o%d" % i for i in range(50)])
+        # 并发调用时只获取一次令牌
+        self.assertEqual(self.requestor.paths.count("/cgi-bin/token"), 1)
+        self.assertGreater(self.requestor.peak, 1)
+
+    async def test_error(self):
+        with self.assertRaises(WxApiException) as cm:
+            await self.client.get_userinfo("nobody")
+        self.assertEqual(cm.exception.errcode, 46004)
+
+    async def test_token_retry(self):
+        self.client.access_token = AccessToken("stale", 7200)
+        results = await asyncio.gather(*[self.client.get_ip_list() for _ in range(10)])
+        self.assertEqual(results, [{"ip_list": ["127.0.0.1"]}] * 10)
+        # 同时失败的调用只刷新一次令牌
+        self.assertEqual(self.requestor.paths.count("/cgi-bin/token"), 1)
+        self.assertEqual(self.client.access_token.token, "token-appid")
+
+    async def test_empty_menu(self):
+        menu = await self.client.get_menus()
+        self.assertIsNotNone(menu)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    ports = set()
+
+    def do_GET(self):
+        self.ports.add(self.client_address[1])
+        u = urlparse(self.path)
+        if u.path == "/media":
+            body, content_type = b"binary-content", "application/octet-stream"
+        else:
+            body, content_type = json.dumps(fake_api(u.path, parse_qs(u.query))).encode("utf-8"), "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(httpx is None, "没有安装httpx")
+class TestHttpxRequestor(IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeApiHandler.ports = set()
+        self.requestor = HttpxRequestor(concurrency=4, max_connections=4, timeout=5)
+        self.client = AsyncWxClient("appid", "secret", requestor=self.requestor, api_base=self.base)
+
+    async def asyncTearDown(self):
+        await self.requestor.aclose()
+
+    async def test_pooled(self):
+        users = await asyncio.gather(*[self.client.get_userinfo("o%d" % i) for i in range(20)])
+        self.assertEqual(len(users), 20)
+        # 并发数不超过concurrency，连接由连接池复用
+        self.assertLessEqual(len(FakeApiHandler.ports), 4)
+
+    async def test_error(self):
+        with self.assertRaises(WxApiException):
+            await self.client.get_userinfo("nobody")
+
+    async def test_token_retry(self):
+        self.client.access_token = AccessToken("stale", 7200)
+        self.assertEqual(await self.client.get_ip_list(), {"ip_list": ["127.0.0.1"]})
+
+    async def test_download(self):
+        writer = io.BytesIO()
+        await self.requestor.download_file(self.base + "/media", writer, stream=True)
+        self.assertEqual(writer.getvalue(), b"binary-content")
+
+
+@unittest.skipIf(httpx is not None, "已经安装httpx")
+class TestWithoutHttpx(unittest.TestCase):
+    def test_missing(self):
+        with self.assertRaises(RuntimeError):
+            HttpxRequestor()
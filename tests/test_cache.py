@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试weixin.cache中的缓存
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+import threading
+import time
+from unittest import TestCase
+
+from weixin.cache import LRUCache, MessageDeduplicator, RotatingBloomFilter
+
+
+class TestLRUCache(TestCase):
+    def test_lru(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        # b是最久未使用的缓存项，将被淘汰
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 2, "misses": 1, "evictions": 1})
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=60)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertNotIn("a", cache)
+
+
+class TestMessageDeduplicator(TestCase):
+    def test_message_key(self):
+        self.assertEqual(MessageDeduplicator.message_key({"MsgId": "123", "FromUserName": "u"}), "123")
+        self.assertEqual(MessageDeduplicator.message_key({"FromUserName": "u", "CreateTime": "1"}), "u#1")
+        self.assertIsNone(MessageDeduplicator.message_key({}))
+
+    def test_cached_reply(self):
+        dedup = MessageDeduplicator()
+        entry, owner = dedup.begin("m1")
+        self.assertTrue(owner)
+        dedup.complete("m1", entry, "reply")
+        entry2, owner2 = dedup.begin("m1")
+        self.assertFalse(owner2)
+        self.assertEqual(dedup.wait(entry2), "reply")
+        self.assertEqual(dedup.stats()["hits"], 1)
+        self.assertEqual(dedup.stats()["misses"], 1)
+
+    def test_wait_in_flight(self):
+        dedup = MessageDeduplicator()
+        entry, owner = dedup.begin("m1")
+        results = []
+
+        def retry():
+            e, o = dedup.begin("m1")
+            results.append((o, dedup.wait(e)))
+
+        t = threading.Thread(target=retry)
+        t.start()
+        time.sleep(0.05)
+        dedup.complete("m1", entry, "reply")
+        t.join()
+        self.assertEqual(results, [(False, "reply")])
+
+    def test_fail(self):
+        dedup = MessageDeduplicator()
+        entry, owner = dedup.begin("m1")
+        dedup.fail("m1", entry)
+        self.assertEqual(dedup.wait(entry), "")
+        # 失败的消息仍可查到，重试请求不被当作重放
+        self.assertIs(dedup.peek("m1"), entry)
+        # 处理失败后，重试的消息需要重新处理
+        entry, owner = dedup.begin("m1")
+        self.assertTrue(owner)
+
+    def test_memory_cap(self):
+        dedup = MessageDeduplicator(max_size=10, max_bytes=10)
+        for key in ("m1", "m2", "m3"):
+            entry, owner = dedup.begin(key)
+            dedup.complete(key, entry, "12345")
+        stats = dedup.stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["bytes"], 10)
+        self.assertEqual(stats["evictions"], 1)
+
+
+class TestRotatingBloomFilter(TestCase):
+    def test_add(self):
+        bloom = RotatingBloomFilter(capacity=1000)
+        self.assertFalse(bloom.add("1515935965:nonce"))
+        self.assertTrue(bloom.add("1515935965:nonce"))
+        self.assertIn("1515935965:nonce", bloom)
+        false_positives = sum(bloom.add("n%d" % i) for i in range(900))
+        self.assertLess(false_positives, 5)
+
+    def test_rotate(self):
+        bloom = RotatingBloomFilter(capacity=10)
+        bloom.add("a")
+        for i in range(10):
+            bloom.add("b%d" % i)
+        # 上一代的元素仍然可以识别
+        self.assertTrue(bloom.add("a"))
+        for i in range(20):
+            bloom.add("c%d" % i)
+        self.assertNotIn("a", bloom)
@@ -1,5 +1,92 @@
 # -*- coding: utf-8 -*-
 # -------------------------------------------------------------------------
-# 文件目的：测试wenxin.message中的方法
+# 文件目的：测试wenxin.crypto中的消息加解密
 # 创建日期：2018/1/3
-# -------------------------------------------------------------------------
\ No newline at end of file
+# -------------------------------------------------------------------------
+import base64
+import struct
+from unittest import TestCase
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from weixin.crypto import PrpCrypt, MessageCryptor, _get_signature
+from weixin.exceptions import AppIdValidationError, InvalidSignature, DecryptError
+from weixin.utils import msgtodict
+
+AES_KEY = "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J"
+APPID = "wxff1ec8c09ae8c622"
+
+XML = r"<xml>" \
+      r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+      r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+      r"<CreateTime>1515935965</CreateTime>" \
+      r"<MsgType><![CDATA[text]]></MsgType>" \
+      r"<Content><![CDATA[广告画]]></Content>" \
+      r"<MsgId>6510895392933538073</MsgId>" \
+      r"</xml>"
+
+
+class TestPrpCrypt(TestCase):
+    def setUp(self):
+        self.key = base64.b64decode(AES_KEY + "=")
+        self.pc = PrpCrypt(self.key)
+
+    def test_layout(self):
+        encrypted = self.pc.encrypt(XML, APPID)
+        decryptor = Cipher(algorithms.AES(self.key), modes.CBC(self.key[:16]), backend=default_backend()).decryptor()
+        plain = decryptor.update(base64.b64decode(encrypted)) + decryptor.finalize()
+        self.assertEqual(len(plain) % 32, 0)
+        pad = plain[-1]
+        self.assertEqual(plain[-pad:], bytes((pad,)) * pad)
+        msg = XML.encode("utf-8")
+        self.assertEqual(struct.unpack("!I", plain[16:20])[0], len(msg))
+        self.assertEqual(plain[20:20 + len(msg)], msg)
+        self.assertEqual(plain[20 + len(msg):-pad], APPID.encode())
+
+    def test_round_trip(self):
+        for text in ("", "a", "x" * 12, XML, XML * 10):
+            self.assertEqual(self.pc.decrypt(self.pc.encrypt(text, APPID), APPID), text)
+        # 随机前缀使相同的消息每次加密的结果不同
+        self.assertNotEqual(self.pc.encrypt(XML, APPID), self.pc.encrypt(XML, APPID))
+
+    def test_appid(self):
+        with self.assertRaises(AppIdValidationError):
+            self.pc.decrypt(self.pc.encrypt(XML, APPID), "wxother")
+
+    def test_corrupt(self):
+        with self.assertRaises(DecryptError):
+            self.pc.decrypt(base64.b64encode(b"x" * 31).decode(), APPID)
+        other = PrpCrypt(base64.b64decode("B" * 43 + "="))
+        with self.assertRaises((DecryptError, AppIdValidationError)):
+            other.decrypt(self.pc.encrypt(XML, APPID), APPID)
+
+    def test_invalid_utf8(self):
+        for msg, appid in ((b"\xff\xfe", APPID.encode()), (XML.encode(), b"\xff" + APPID.encode())):
+            length = 20 + len(msg) + len(appid)
+            pad = 32 - length % 32
+            plain = b"r" * 16 + struct.pack("!I", len(msg)) + msg + appid + bytes((pad,)) * pad
+            encryptor = self.pc._cipher.encryptor()
+            text = base64.b64encode(encryptor.update(plain) + encryptor.finalize()).decode()
+            with self.assertRaises(DecryptError):
+                self.pc.decrypt(text, APPID)
+
+
+class TestMessageCryptor(TestCase):
+    def setUp(self):
+        self.cryptor = MessageCryptor(APPID, "resplendsky", AES_KEY)
+
+    def test_signature(self):
+        self.assertEqual(_get_signature("b", "c", "a"), "a9993e364706816aba3e25717850c26c9cd0d89d")
+
+    def test_encrypt_decrypt_msg(self):
+        envelope = msgtodict(self.cryptor.encrypt_msg(XML, "1320562132", "1409735669"))
+        self.assertEqual(envelope["Nonce"], "1320562132")
+        self.assertEqual(envelope["MsgSignature"],
+                         _get_signature("resplendsky", "1409735669", "1320562132", envelope["Encrypt"]))
+        text = self.cryptor.decrypt_msg(envelope["Encrypt"], envelope["MsgSignature"], "1409735669", "1320562132")
+        self.assertEqual(text, XML)
+        with self.assertRaises(InvalidSignature):
+            self.cryptor.decrypt_msg(envelope["Encrypt"], "0" * 40, "1409735669", "1320562132")
+        with self.assertRaises(InvalidSignature):
+            self.cryptor.decrypt_msg(envelope["Encrypt"], "签名", "1409735669", "1320562132")
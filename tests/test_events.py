@@ -6,7 +6,58 @@
 from unittest import TestCase
 
 from weixin.events import *
-from weixin.utils import msgtodict
+from weixin.messages import UnknownMessage
+from weixin.utils import msgtodict, parse_message
+
 
 class TestEvents(TestCase):
-    pass
\ No newline at end of file
+    def test_click_event(self):
+        xmldata = r"<xml>" \
+                  r"<ToUserName><![CDATA[toUser]]></ToUserName>" \
+                  r"<FromUserName><![CDATA[FromUser]]></FromUserName>" \
+                  r"<CreateTime>123456789</CreateTime>" \
+                  r"<MsgType><![CDATA[event]]></MsgType>" \
+                  r"<Event><![CDATA[CLICK]]></Event>" \
+                  r"<EventKey><![CDATA[EVENTKEY]]></EventKey>" \
+                  r"</xml>"
+        event = parse_message(msgtodict(xmldata))
+        self.assertTrue(isinstance(event, ClickEvent), "类型不是菜单点击事件")
+        self.assertEqual(event.eventKey, "EVENTKEY")
+
+    def test_subscribe_event(self):
+        xmldata = r"<xml>" \
+                  r"<ToUserName><![CDATA[toUser]]></ToUserName>" \
+                  r"<FromUserName><![CDATA[FromUser]]></FromUserName>" \
+                  r"<CreateTime>123456789</CreateTime>" \
+                  r"<MsgType><![CDATA[event]]></MsgType>" \
+                  r"<Event><![CDATA[subscribe]]></Event>" \
+                  r"<EventKey><![CDATA[]]></EventKey>" \
+                  r"</xml>"
+        event = parse_message(msgtodict(xmldata))
+        self.assertTrue(isinstance(event, SubscribeEvent), "类型不是关注事件")
+
+    def test_location_event(self):
+        xmldata = r"<xml>" \
+                  r"<ToUserName><![CDATA[toUser]]></ToUserName>" \
+                  r"<FromUserName><![CDATA[fromUser]]></FromUserName>" \
+                  r"<CreateTime>123456789</CreateTime>" \
+                  r"<MsgType><![CDATA[event]]></MsgType>" \
+                  r"<Event><![CDATA[LOCATION]]></Event>" \
+                  r"<Latitude>23.137466</Latitude>" \
+                  r"<Longitude>113.352425</Longitude>" \
+                  r"<Precision>119.385040</Precision>" \
+                  r"</xml>"
+        event = parse_message(msgtodict(xmldata))
+        self.assertTrue(isinstance(event, LocationEvent), "类型不是地理位置事件")
+        self.assertEqual(event.latitude, "23.137466")
+
+    def test_unknown_event(self):
+        xmldata = r"<xml>" \
+                  r"<ToUserName><![CDATA[toUser]]></ToUserName>" \
+                  r"<FromUserName><![CDATA[fromUser]]></FromUserName>" \
+                  r"<CreateTime>123456789</CreateTime>" \
+                  r"<MsgType><![CDATA[event]]></MsgType>" \
+                  r"<Event><![CDATA[TEMPLATESENDJOBFINISH]]></Event>" \
+                  r"</xml>"
+        event = parse_message(msgtodict(xmldata))
+        self.assertTrue(isinstance(event, UnknownMessage), "类型不是未知消息")
\ No newline at end of file
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：检查导入weixin包时没有加载requests、cryptography等较重的依赖，避免工作进程和命令行工具的启动变慢
+# 创建日期：2026/10/18
+# 说明：在子进程中以python -X importtime导入模块，按输出统计加载的模块和耗时
+# -------------------------------------------------------------------------
+
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在首次使用时才导入的依赖
+HEAVY_MODULES = ("requests", "urllib3", "cryptography", "sqlite3", "weixin.api.client", "weixin.crypto")
+
+
+def import_times(statement):
+    """
+    在子进程中执行导入语句，获取各模块的导入耗时
+    :param statement: 导入语句，如"import weixin.wechat"
+    :return: 模块名称 -> (自身耗时, 累计耗时)的字典，单位为微秒
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative))
+    return times
+
+
+def report(times, limit=10):
+    """
+    输出累计耗时最长的weixin模块
+    """
+    rows = sorted(((c, name) for name, (_, c) in times.items() if name.startswith("weixin")), reverse=True)
+    return "\n".join("  {0:<30} {1:>8.1f} ms".format(name, c / 1000.0) for c, name in rows[:limit])
+
+
+class TestImport(TestCase):
+    def assertNotLoaded(self, statement, modules=HEAVY_MODULES):
+        times = import_times(statement)
+        loaded = [m for m in modules if m in times]
+        self.assertEqual(loaded, [], "%s加载了%s，各模块的导入耗时为:\n%s" % (statement, loaded, report(times)))
+        return times
+
+    def test_wechat(self):
+        times = self.assertNotLoaded("import weixin.wechat")
+        self.assertIn("weixin.wechat", times)
+
+    def test_light_modules(self):
+        self.assertNotLoaded("import weixin.utils, weixin.render, weixin.messages, weixin.keywords")
+
+    def test_deferred_loading(self):
+        account = "from weixin.wechat import WxAccount;" \
+                  "a = WxAccount('id', 'appid', 'token', 'secret', 'ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J');"
+        # 处理未加密的消息不需要API层和加解密模块
+        self.assertNotLoaded(account + "a.response_message(None, '<xml><ToUserName>gh</ToUserName>"
+                                       "<FromUserName>openid</FromUserName><CreateTime>1</CreateTime>"
+                                       "<MsgType>text</MsgType><Content>hi</Content><MsgId>1</MsgId></xml>')")
+        # 首次使用时才加载
+        times = import_times(account + "a.crypto; a.client")
+        self.assertIn("weixin.crypto", times)
+        self.assertIn("weixin.api.client", times)
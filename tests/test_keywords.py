@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试weixin.keywords中的关键字回复处理器
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+import threading
+from unittest import TestCase
+
+from weixin.keywords import KeywordRouter, KeywordRule, MATCH
+from weixin.utils import msgtodict, parse_message
+from weixin.wechat import MsgRecord
+
+
+def text_record(content):
+    xml = r"<xml>" \
+          r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+          r"<FromUserName><![CDATA[openid]]></FromUserName>" \
+          r"<CreateTime>1515935965</CreateTime>" \
+          r"<MsgType><![CDATA[text]]></MsgType>" \
+          r"<Content><![CDATA[%s]]></Content>" \
+          r"<MsgId>6510745151654702645</MsgId>" \
+          r"</xml>" % content
+    return MsgRecord("appid", None, parse_message(msgtodict(xml)), None)
+
+
+class TestKeywordRouter(TestCase):
+    def test_match_kinds(self):
+        router = KeywordRouter([
+            ("帮助", "help", MATCH.EXACT),
+            ("天气", "weather", MATCH.PREFIX),
+            ("优惠", "sale", MATCH.CONTAINS),
+        ])
+        self.assertEqual(router.match("帮助").target, "help")
+        self.assertIsNone(router.match("需要帮助"))
+        self.assertEqual(router.match("天气 北京").target, "weather")
+        self.assertIsNone(router.match("北京天气"))
+        self.assertEqual(router.match("今天有什么优惠吗").target, "sale")
+        self.assertIsNone(router.match("你好"))
+        self.assertIsNone(router.match(""))
+
+    def test_overlapping_keywords(self):
+        router = KeywordRouter([("he", "he"), ("she", "she"), ("his", "his"), ("hers", "hers")])
+        self.assertEqual(router.match("ushers").target, "hers")
+        self.assertEqual(router.match("xshex").target, "she")
+        self.assertEqual(router.match("ahisb").target, "his")
+
+    def test_priority(self):
+        router = KeywordRouter([
+            ("价格", "price"),
+            ("会员价格", "member", MATCH.CONTAINS, 10),
+            ("会员", "vip", MATCH.EXACT),
+        ])
+        self.assertEqual(router.match("请问会员价格多少").target, "member")
+        # 优先级相同时完全匹配优先
+        self.assertEqual(router.match("会员").target, "vip")
+        router.add_rule("会员", "vip-prefix", MATCH.PREFIX, 20)
+        self.assertEqual(router.match("会员").target, "vip-prefix")
+
+    def test_ignore_case(self):
+        router = KeywordRouter([("VIP", "vip")])
+        self.assertEqual(router.match("i am a vip").target, "vip")
+        router = KeywordRouter([("VIP", "vip")], ignore_case=False)
+        self.assertIsNone(router.match("i am a vip"))
+
+    def test_rebuild(self):
+        router = KeywordRouter([("a", "a")])
+        old = router._automaton
+        router.add_rule("b", "b")
+        self.assertIsNot(router._automaton, old)
+        # 原有的匹配器不受影响
+        self.assertIsNone(old.search("b"))
+        self.assertEqual(router.match("b").target, "b")
+        router.remove_rule("a")
+        self.assertIsNone(router.match("a"))
+        router.set_rules([KeywordRule("c", "c")])
+        self.assertIsNone(router.match("b"))
+        self.assertEqual(len(router.rules), 1)
+
+    def test_set_rules_once(self):
+        router = KeywordRouter([("a", "a")])
+        version = router.reply_version
+        installed = []
+        install = router._install
+
+        def recording_install(rules):
+            installed.append([r.keyword for r in rules])
+            install(rules)
+
+        router._install = recording_install
+        router.set_rules([("b", "b"), ("c", "c")])
+        # 只编译一次完整的规则列表，不会出现空的匹配器
+        self.assertEqual(installed, [["b", "c"]])
+        self.assertEqual(router.reply_version, version + 1)
+        self.assertEqual(router.match("c").target, "c")
+
+    def test_rebuild_concurrent(self):
+        router = KeywordRouter([("kw%d" % i, i) for i in range(200)])
+        errors = []
+
+        def reader():
+            for _ in range(2000):
+                if router.match("xx kw7 yy") is None:
+                    errors.append("miss")
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for i in range(200, 220):
+            router.add_rule("kw%d" % i, i)
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(router.match("kw219").target, 219)
+
+    def test_reply(self):
+        router = KeywordRouter([("你好", "您好"), ("菜单", lambda record: "menu:" + record.openid)])
+        reply = router.handle(text_record("你好"))
+        self.assertIn("<ToUserName><![CDATA[openid]]></ToUserName>", reply)
+        self.assertIn("<Content><![CDATA[您好]]></Content>", reply)
+        self.assertEqual(router.handle(text_record("菜单")), "menu:openid")
+        self.assertEqual(router.handle(text_record("其它")), "")
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试weixin.logger中的日志设置
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+import logging
+import os
+import tempfile
+from unittest import TestCase
+
+from weixin import logger
+from weixin.logger import log, set_logger, shutdown_logger, log_body
+
+
+class TestLogger(TestCase):
+    def setUp(self):
+        self.handlers = list(log.handlers)
+        self.level = log.level
+        shutdown_logger()
+
+    def tearDown(self):
+        shutdown_logger()
+        for h in list(log.handlers):
+            log.removeHandler(h)
+        for h in self.handlers:
+            log.addHandler(h)
+        log.setLevel(self.level)
+        logger._body_sample_rate = 1.0
+
+    def read_log(self, config, emit):
+        path = os.path.join(tempfile.mkdtemp(), "wx.log")
+        config = dict(config, handler={"rotating-file": {"file": path}})
+        set_logger(config)
+        emit()
+        shutdown_logger()
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_level(self):
+        def emit():
+            log.debug("调试信息")
+            log.warning("警告信息%s", 1)
+
+        text = self.read_log({"level": "WARNING"}, emit)
+        self.assertNotIn("调试信息", text)
+        self.assertIn("警告信息1", text)
+        self.assertEqual(log.level, logging.WARNING)
+
+    def test_queue_handler(self):
+        set_logger({"level": "INFO", "handler": {}})
+        handlers = list(log.handlers)
+        self.assertEqual(len(handlers), 1)
+        self.assertIsInstance(handlers[0], logging.handlers.QueueHandler)
+        # 未指定配置参数时不修改已有的设置
+        set_logger()
+        self.assertEqual(log.handlers, handlers)
+
+    def test_body_sampling(self):
+        def emit():
+            for i in range(10):
+                log_body(logging.INFO, "消息内容%d", i)
+            log.info("其它日志")
+
+        text = self.read_log({"level": "INFO", "body_sample_rate": 0}, emit)
+        self.assertNotIn("消息内容", text)
+        self.assertIn("其它日志", text)
+
+    def test_lazy_format(self):
+        class Unprintable(object):
+            def __str__(self):
+                raise AssertionError("日志级别未启用时不应格式化")
+
+        set_logger({"level": "INFO", "handler": {}})
+        log.debug("%s", Unprintable())
+        log_body(logging.DEBUG, "%s", Unprintable())
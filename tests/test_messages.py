@@ -24,6 +24,9 @@ class TestMessages(TestCase):
         text_message = parse_message(dic)
         self.assertTrue(isinstance(text_message, TextInputMessage), "类型不是文本消息")
         self.assertEqual(text_message.content, "这是测试数据")
+        # 消息对象使用__slots__，不创建实例字典
+        self.assertFalse(hasattr(text_message, "__dict__"))
+        self.assertEqual(text_message.msgId, "1234567890123456")
 
     def test_imagemesage(self):
         xmldata = r"<xml>" \
@@ -115,6 +118,7 @@ class TestMessages(TestCase):
         self.assertEqual(location_message.location_y, "113.358803")
         self.assertEqual(location_message.scale, "20")
         self.assertEqual(location_message.label, "位置信息")
+        self.assertEqual(location_message.location(), ("23.134521", "113.358803"))
 
     def test_linkmessage(self):
         xmldata = r"<xml>" \
@@ -150,3 +154,11 @@ class TestMessages(TestCase):
         dic = msgtodict(xmldata)
         unkown_message = parse_message(dic)
         self.assertTrue(isinstance(unkown_message, UnknownMessage), "类型不是未知消息")
+
+    def test_missing_field(self):
+        # 缺少必需的节点时抛出KeyError，可选节点使用默认值
+        self.assertRaises(KeyError, TextInputMessage, {"ToUserName": "toUser", "FromUserName": "fromUser",
+                                                       "CreateTime": "1348831860", "MsgType": "text"})
+        dic = {"ToUserName": "toUser", "FromUserName": "fromUser", "CreateTime": "1348831860",
+               "MsgType": "voice", "MediaId": "media_id", "Format": "amr", "MsgId": "1"}
+        self.assertEqual(VoiceInputMessage(dic).recognition, "")
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试weixin.metrics中的耗时统计
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+import time
+from unittest import TestCase
+
+from weixin.metrics import Histogram, PipelineMetrics, StageTimer, message_label
+from weixin.wechat import WxAccount, Handler
+
+
+class TestHistogram(TestCase):
+    def test_percentile(self):
+        h = Histogram()
+        for i in range(1, 101):
+            h.record(i / 1000.0)
+        snapshot = h.snapshot()
+        self.assertEqual(snapshot["count"], 100)
+        self.assertAlmostEqual(snapshot["avg_ms"], 50.5)
+        self.assertAlmostEqual(snapshot["max_ms"], 100)
+        # 分桶的相对误差小于10%
+        self.assertTrue(50 <= snapshot["p50_ms"] <= 55, snapshot)
+        self.assertTrue(95 <= snapshot["p95_ms"] <= 100, snapshot)
+        self.assertTrue(99 <= snapshot["p99_ms"] <= 100, snapshot)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().snapshot()["p99_ms"], 0.0)
+
+
+class TestPipelineMetrics(TestCase):
+    def test_deadline_warning(self):
+        metrics = PipelineMetrics("test", deadline_warning=0.01)
+        timer = StageTimer()
+        time.sleep(0.02)
+        timer.mark("handle")
+        with self.assertLogs("weixin", "WARNING"):
+            metrics.observe("text", timer)
+        self.assertEqual(metrics.snapshot()["text"]["handle"]["count"], 1)
+
+    def test_message_label(self):
+        self.assertEqual(message_label({"MsgType": "text"}), "text")
+        self.assertEqual(message_label({"MsgType": "event", "Event": "CLICK"}), "event:click")
+        # 伪造的消息类型和事件类型不产生新的统计项
+        self.assertEqual(message_label({"MsgType": "x" * 100}), "other")
+        self.assertEqual(message_label({"MsgType": "event", "Event": "forged-1"}), "event:other")
+        self.assertEqual(message_label({}), "other")
+
+
+class SlowTextHandler(Handler):
+    def reply(self, record):
+        time.sleep(0.005)
+        return "ok"
+
+
+class TestAccountMetrics(TestCase):
+    def test_stages(self):
+        account = WxAccount("test", "appid", "token", "secret", "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J",
+                            handler_list=[SlowTextHandler()], dedup=False)
+        xml = r"<xml><ToUserName>a</ToUserName><FromUserName>b</FromUserName><CreateTime>1</CreateTime>" \
+              r"<MsgType>text</MsgType><Content>x</Content><MsgId>1</MsgId></xml>"
+        account.response_message(None, xml)
+        account.response_message({"signature": "x", "timestamp": "1", "nonce": "n"}, xml)
+        snapshot = account.metrics.snapshot()
+        self.assertEqual(set(snapshot["text"]), {"parse", "message", "handle", "total"})
+        self.assertGreaterEqual(snapshot["text"]["handle"]["avg_ms"], 5)
+        self.assertEqual(snapshot["rejected"]["verify"]["count"], 1)
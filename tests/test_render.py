@@ -6,7 +6,7 @@
 
 from unittest import TestCase
 
-from weixin.render import Renderer
+from weixin.render import Et, Article, Renderer, render_news, render_text, to_custom_message
 from weixin.utils import msgtodict
 
 
@@ -15,10 +15,54 @@ class TestResonse(TestCase):
 
     def test_render_test(self):
 
-        resp = Renderer(self.account.appid)
+        resp = Renderer("appid")
         response_xml = resp.render_text("openid", "回复微信服务器的内容：content")
         dic = msgtodict(response_xml)
         self.assertEqual(dic["ToUserName"], "openid")
         self.assertEqual(dic["FromUserName"], "appid")
         self.assertEqual(dic["MsgType"], "text")
         self.assertEqual(dic["Content"], "回复微信服务器的内容：content")
+
+    def test_to_custom_message(self):
+        message = to_custom_message(render_text("openid", "appid", "内容"))
+        self.assertEqual(message, {"touser": "openid", "msgtype": "text", "text": {"content": "内容"}})
+        resp = Renderer("appid")
+        message = to_custom_message(resp.render_image("openid", "media_id"))
+        self.assertEqual(message, {"touser": "openid", "msgtype": "image", "image": {"media_id": "media_id"}})
+
+    def test_escape_cdata(self):
+        content = "a]]>b<xml>"
+        tree = Et.fromstring(render_text("open]]>id", "appid", content, 1500000000))
+        self.assertEqual(tree.find("Content").text, content)
+        self.assertEqual(tree.find("ToUserName").text, "open]]>id")
+        self.assertEqual(tree.find("CreateTime").text, "1500000000")
+
+    def test_render_media(self):
+        resp = Renderer("appid")
+        tree = Et.fromstring(resp.render_voice("openid", "voice_id", 1500000000))
+        self.assertEqual(tree.find("MsgType").text, "voice")
+        self.assertEqual(tree.find("Voice/MediaId").text, "voice_id")
+        self.assertEqual(tree.find("CreateTime").text, "1500000000")
+
+        tree = Et.fromstring(resp.render_video("openid", "标题", "描述", "video_id"))
+        self.assertEqual(tree.find("Video/MediaId").text, "video_id")
+        self.assertEqual(tree.find("Video/Title").text, "标题")
+        self.assertEqual(tree.find("Video/Description").text, "描述")
+
+        reply = resp.render_music("openid", "标题", "描述", "thumb_id", "http://m/1.mp3", "http://m/1hq.mp3")
+        self.assertEqual(to_custom_message(reply), {
+            "touser": "openid", "msgtype": "music",
+            "music": {"title": "标题", "description": "描述", "musicurl": "http://m/1.mp3",
+                      "hqmusicurl": "http://m/1hq.mp3", "thumb_media_id": "thumb_id"}})
+
+    def test_render_news(self):
+        resp = Renderer("appid")
+        articles = [Article("标题1", "描述1", "http://p/1.jpg", "http://u/1"),
+                    {"title": "标题2", "description": "描述2", "picurl": "http://p/2.jpg", "url": "http://u/2"}]
+        reply = resp.render_news("openid", articles)
+        self.assertEqual(Et.fromstring(reply).find("ArticleCount").text, "2")
+        self.assertEqual(to_custom_message(reply)["news"]["articles"], [
+            {"title": "标题1", "description": "描述1", "url": "http://u/1", "picurl": "http://p/1.jpg"},
+            {"title": "标题2", "description": "描述2", "url": "http://u/2", "picurl": "http://p/2.jpg"}])
+        self.assertRaises(ValueError, render_news, "openid", "appid", [])
+        self.assertRaises(ValueError, render_news, "openid", "appid", articles * 5)
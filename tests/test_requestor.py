@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：使用本机HTTP服务器测试DefaultRequstor的连接池
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from weixin.api.client import DefaultRequstor, WxClient, default_requestor
+from weixin.exceptions import WxApiException
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """
+    记录客户端连接端口的API服务器
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    ports = set()
+
+    def do_GET(self):
+        self.ports.add(self.client_address[1])
+        if self.path.startswith("/error"):
+            self.reply({"errcode": 40013, "errmsg": "invalid appid"})
+        elif self.path.startswith("/media"):
+            self.reply(b"binary-content", "application/octet-stream")
+        else:
+            self.reply({"errcode": 0, "errmsg": "ok"})
+
+    def reply(self, data, content_type="application/json"):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDefaultRequestor(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeApiHandler.ports = set()
+        self.requestor = DefaultRequstor(pool_maxsize=4, timeout=5)
+
+    def tearDown(self):
+        self.requestor.close()
+
+    def test_keep_alive(self):
+        for _ in range(5):
+            self.assertEqual(self.requestor.get(self.base + "/cgi-bin/getcallbackip")["errmsg"], "ok")
+        # 所有调用复用同一个连接
+        self.assertEqual(len(FakeApiHandler.ports), 1)
+
+    def test_error(self):
+        with self.assertRaises(WxApiException):
+            self.requestor.get(self.base + "/error")
+
+    def test_download(self):
+        writer = io.BytesIO()
+        self.requestor.download_file(self.base + "/media", writer, stream=True)
+        self.assertEqual(writer.getvalue(), b"binary-content")
+        self.requestor.get(self.base + "/cgi-bin/getcallbackip")
+        # 流式下载的连接已放回连接池
+        self.assertEqual(len(FakeApiHandler.ports), 1)
+
+    def test_shared(self):
+        self.assertIs(WxClient("a", "b").requestor, WxClient("c", "d").requestor)
+        self.assertIs(WxClient("a", "b").requestor, default_requestor())
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试weixin.session中的会话存储
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from weixin.session import Session, MemorySessionStore, SQLiteSessionStore, create_session_store
+from weixin.wechat import WxAccount, Handler, SimpleWxService
+
+AES_KEY = "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J"
+
+
+class TestSession(TestCase):
+    def test_modified(self):
+        session = Session("k", {"a": 1})
+        self.assertFalse(session.modified)
+        self.assertEqual(session.get("a"), 1)
+        self.assertFalse(session.modified)
+        session["b"] = 2
+        self.assertTrue(session.modified)
+
+    def test_memory_store(self):
+        store = MemorySessionStore(max_size=2)
+        for key in ("a", "b", "c"):
+            session = store.open(key)
+            session["step"] = key
+            store.commit(session)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.open("a").to_dict(), {})
+        self.assertEqual(store.open("c")["step"], "c")
+        # 清空的会话从存储中删除
+        session = store.open("c")
+        session.clear()
+        store.commit(session)
+        self.assertEqual(len(store), 1)
+
+    def test_memory_store_copy(self):
+        store = MemorySessionStore()
+        session = store.open("a")
+        session["items"] = [1]
+        store.commit(session)
+        # 未提交的嵌套修改不影响存储中的会话
+        store.open("a")["items"].append(2)
+        session["items"].append(3)
+        self.assertEqual(store.open("a")["items"], [1])
+
+    def test_memory_store_ttl(self):
+        store = MemorySessionStore(ttl=0.01)
+        session = store.open("a")
+        session["x"] = 1
+        store.commit(session)
+        time.sleep(0.02)
+        self.assertEqual(len(store.open("a")), 0)
+
+    def test_sqlite_store(self):
+        path = os.path.join(tempfile.mkdtemp(), "session.db")
+        store = SQLiteSessionStore(path)
+        other = SQLiteSessionStore(path)
+        session = store.open("a")
+        session["step"] = 1
+        store.commit(session)
+        # 提交后其它进程立即可以读取
+        self.assertEqual(other.open("a")["step"], 1)
+        session = other.open("a")
+        session["step"] = "中文"
+        other.commit(session)
+        self.assertEqual(store.open("a")["step"], "中文")
+        self.assertEqual(len(store), 1)
+        store.delete("a")
+        self.assertEqual(len(other.open("a")), 0)
+        store.close()
+        # 关闭后的修改不会被静默丢弃
+        session = Session("b", {"step": 1})
+        session.mark_modified()
+        with self.assertRaises(RuntimeError):
+            store.commit(session)
+        store.close()
+        other.close()
+
+    def test_sqlite_group_commit(self):
+        path = os.path.join(tempfile.mkdtemp(), "session.db")
+        store = SQLiteSessionStore(path)
+        commit = store._commit
+
+        def slow_commit(items):
+            time.sleep(0.05)
+            commit(items)
+
+        store._commit = slow_commit
+
+        def worker(key):
+            session = store.open(key)
+            session["step"] = key
+            store.commit(session)
+
+        threads = [threading.Thread(target=worker, args=("k%d" % i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 写入期间提交的修改合并为一个事务，提交返回时其它进程已经可以读取
+        self.assertEqual(store.writes, 8)
+        self.assertLess(store.batches, 8)
+        other = SQLiteSessionStore(path)
+        self.assertEqual([other.open("k%d" % i)["step"] for i in range(8)], ["k%d" % i for i in range(8)])
+        store.close()
+        other.close()
+
+    def test_create_session_store(self):
+        self.assertIsNone(create_session_store(False))
+        self.assertIsInstance(create_session_store(None), MemorySessionStore)
+        store = create_session_store({"backend": "memory", "max_size": 10})
+        self.assertEqual(store._cache.max_size, 10)
+        with self.assertRaises(ValueError):
+            create_session_store({"backend": "redis"})
+
+
+class StepHandler(Handler):
+    def reply(self, record):
+        step = record.session.get("step", 0) + 1
+        record.session["step"] = step
+        return str(step)
+
+
+class TestAccountSession(TestCase):
+    def test_session_between_messages(self):
+        account = WxAccount("test", "appid", "token", "secret", AES_KEY, handler_list=[StepHandler()], dedup=False)
+        xml = r"<xml>" \
+              r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+              r"<FromUserName><![CDATA[openid]]></FromUserName>" \
+              r"<CreateTime>1515935965</CreateTime>" \
+              r"<MsgType><![CDATA[text]]></MsgType>" \
+              r"<Content><![CDATA[next]]></Content>" \
+              r"<MsgId>%d</MsgId>" \
+              r"</xml>"
+        self.assertEqual(account.response_message(None, xml % 1), "1")
+        self.assertEqual(account.response_message(None, xml % 2), "2")
+        self.assertEqual(account.session_store.open("appid:openid")["step"], 2)
+
+    def test_session_not_loaded(self):
+        account = WxAccount("test", "appid", "token", "secret", AES_KEY, handler_list=[lambda record: "ok"], dedup=False)
+        xml = r"<xml><ToUserName>a</ToUserName><FromUserName>b</FromUserName><CreateTime>1</CreateTime>" \
+              r"<MsgType>text</MsgType><Content>x</Content><MsgId>1</MsgId></xml>"
+        self.assertEqual(account.response_message(None, xml), "ok")
+        self.assertEqual(account.session_store.stats()["misses"], 0)
+
+    def test_service_session_store(self):
+        service = SimpleWxService({"main": {"appid": "appid", "token": "token", "secret": "secret",
+                                            "encodingAESKey": AES_KEY}})
+        self.assertIsInstance(service.get_account("main").session_store, MemorySessionStore)
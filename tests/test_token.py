@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试weixin.api.token中的访问令牌存储
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import asyncio
+import gc
+import io
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from weixin.api.client import WxClient, Requestor
+from weixin.api.models import AccessToken, MediaType
+from weixin.api.token import MemoryTokenStore, FileTokenStore, SQLiteTokenStore, RedisTokenStore, \
+    RespConnection, TokenRefresher, create_token_store
+from weixin.exceptions import TokenUnavailable, WxApiException, check_api_error
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """
+    只支持GET、SET(NX、PX)和DEL命令的RESP服务器，代替Redis用于测试
+    """
+    data = {}
+    lock = threading.Lock()
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2])
+            self.wfile.write(self.execute(args[0].upper(), args[1:]))
+
+    def execute(self, cmd, args):
+        now = time.time()
+        with self.lock:
+            for key in [k for k, (v, expire_at) in self.data.items() if expire_at and expire_at <= now]:
+                del self.data[key]
+            if cmd == b"GET":
+                item = self.data.get(args[0])
+                return b"$-1\r\n" if item is None else b"$%d\r\n%s\r\n" % (len(item[0]), item[0])
+            if cmd == b"SET":
+                options = [a.upper() for a in args[2:]]
+                if b"NX" in options and args[0] in self.data:
+                    return b"$-1\r\n"
+                expire_at = None
+                if b"PX" in options:
+                    expire_at = now + int(args[2 + options.index(b"PX") + 1]) / 1000.0
+                self.data[args[0]] = (args[1], expire_at)
+                return b"+OK\r\n"
+            if cmd == b"DEL":
+                return b":%d\r\n" % (1 if self.data.pop(args[0], None) else 0)
+        return b"-ERR unknown command\r\n"
+
+
+class CountingGrant(object):
+    """
+    记录调用次数的grant_token，每次调用耗时delay秒
+    """
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.count += 1
+            n = self.count
+        time.sleep(self.delay)
+        return AccessToken("token-%d" % n, 7200)
+
+
+class TokenStoreTests(object):
+    """
+    各类令牌存储的公共测试，create_store每次调用返回连接同一存储的新对象，模拟不同的工作进程
+    """
+
+    def create_store(self, **kwargs):
+        raise NotImplementedError()
+
+    def test_fetch(self):
+        store = self.create_store()
+        grant = CountingGrant(0)
+        token = store.fetch("appid", grant)
+        self.assertEqual(token.token, "token-1")
+        self.assertEqual(store.fetch("appid", grant).token, "token-1")
+        self.assertEqual(self.create_store().load("appid").token, "token-1")
+        self.assertEqual(grant.count, 1)
+
+    def test_single_flight(self):
+        grant = CountingGrant(0.1)
+        results = []
+
+        def worker():
+            results.append(self.create_store().fetch("appid", grant).token)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 只有一个工作进程调用grant_token，其余等待新令牌发布
+        self.assertEqual(grant.count, 1)
+        self.assertEqual(results, ["token-1"] * 8)
+
+    def test_keep_old_token(self):
+        store = self.create_store()
+        other = self.create_store(wait_timeout=0.1)
+        # 令牌即将过期(提前60秒视为过期)，另一个进程正在刷新
+        old = AccessToken("old", 30)
+        store.save("appid", old)
+        self.assertTrue(store.acquire("appid"))
+        try:
+            self.assertEqual(other.fetch("appid", CountingGrant(0)).token, "old")
+        finally:
+            store.release("appid")
+
+    def test_wait_timeout(self):
+        store = self.create_store()
+        other = self.create_store(wait_timeout=0.1)
+        self.assertTrue(store.acquire("appid"))
+        try:
+            with self.assertRaises(TokenUnavailable):
+                other.fetch("appid", CountingGrant(0))
+        finally:
+            store.release("appid")
+        self.assertEqual(other.fetch("appid", CountingGrant(0)).token, "token-1")
+
+    def test_async_fetch(self):
+        store = self.create_store()
+        threads = set()
+        load = store.load
+
+        def recording_load(appid):
+            threads.add(threading.get_ident())
+            return load(appid)
+
+        store.load = recording_load
+        count = []
+
+        async def grant():
+            count.append(1)
+            await asyncio.sleep(0.05)
+            return AccessToken("token-%d" % len(count), 7200)
+
+        async def fetch_all():
+            return await asyncio.gather(*[store.async_fetch("appid", grant) for _ in range(8)])
+
+        self.assertEqual([t.token for t in asyncio.run(fetch_all())], ["token-1"] * 8)
+        self.assertEqual(len(count), 1)
+        # 会阻塞的存储在线程池中读写，不占用事件循环所在的线程
+        self.assertEqual(threading.get_ident() in threads, not store.blocking)
+
+
+class TestMemoryTokenStore(TokenStoreTests, TestCase):
+    def setUp(self):
+        self.store = MemoryTokenStore()
+
+    def create_store(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self.store, name, value)
+        return self.store
+
+
+class TestFileTokenStore(TokenStoreTests, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def create_store(self, **kwargs):
+        return FileTokenStore(self.directory, **kwargs)
+
+
+class TestSQLiteTokenStore(TokenStoreTests, TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "token.db")
+
+    def create_store(self, **kwargs):
+        return SQLiteTokenStore(self.path, **kwargs)
+
+    def test_lock_expired(self):
+        store = self.create_store(lock_ttl=0.05)
+        self.assertTrue(store.acquire("appid"))
+        # 持有锁的进程异常退出，租约到期后其它进程可以取得锁
+        self.assertFalse(self.create_store().acquire("appid"))
+        time.sleep(0.06)
+        self.assertTrue(self.create_store().acquire("appid"))
+
+
+class TestRedisTokenStore(TokenStoreTests, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeRedisHandler.data = {}
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+
+    def create_store(self, **kwargs):
+        store = RedisTokenStore(port=self.server.server_address[1], **kwargs)
+        self.stores.append(store)
+        return store
+
+    def test_reconnect(self):
+        store = self.create_store()
+        store.save("appid", AccessToken("t", 7200))
+        store.connection._sock.close()
+        self.assertEqual(store.load("appid").token, "t")
+
+
+class TokenRequestor(Requestor):
+    def __init__(self):
+        self.grants = 0
+
+    def get(self, url, params=None):
+        if "/cgi-bin/token" in url:
+            self.grants += 1
+            time.sleep(0.05)
+            return {"access_token": "token-%d" % self.grants, "expires_in": 7200}
+        return {"ip_list": [url.split("access_token=")[1]]}
+
+
+class TestSharedToken(TestCase):
+    def test_clients(self):
+        directory = tempfile.mkdtemp()
+        requestor = TokenRequestor()
+        clients = [WxClient("appid", "secret", requestor=requestor, token_store=FileTokenStore(directory))
+                   for _ in range(4)]
+        results = []
+        threads = [threading.Thread(target=lambda c=c: results.append(c.get_ip_list()["ip_list"][0]))
+                   for c in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(requestor.grants, 1)
+        self.assertEqual(results, ["token-1"] * 4)
+
+    def test_create(self):
+        self.assertIsInstance(create_token_store(None), MemoryTokenStore)
+        store = create_token_store({"backend": "sqlite", "path": ":memory:"})
+        self.assertIsInstance(store, SQLiteTokenStore)
+        self.assertIsInstance(create_token_store({"backend": "redis", "port": 1}).connection, RespConnection)
+        with self.assertRaises(ValueError):
+            create_token_store({"backend": "mysql"})
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class FailingRequestor(Requestor):
+    def get(self, url, params=None):
+        raise WxApiException(-1, "system error")
+
+
+class TestTokenRefresher(TestCase):
+    def setUp(self):
+        self.refresher = TokenRefresher(lead=300, jitter=60, retry_interval=0.05)
+
+    def tearDown(self):
+        self.refresher.stop()
+
+    def test_prefetch(self):
+        requestor = TokenRequestor()
+        client = WxClient("appid", "secret", requestor=requestor, refresher=self.refresher)
+        # 尚未调用API时在后台获取令牌
+        self.assertTrue(wait_for(lambda: client.access_token is not None))
+        self.assertEqual(client.token, "token-1")
+        self.assertEqual(requestor.grants, 1)
+
+    def test_refresh_ahead(self):
+        requestor = TokenRequestor()
+        # 令牌还有200秒过期，仍然可以使用，但已经进入提前刷新的时间
+        old = AccessToken("old", 7200, time.time() - 7000)
+        client = WxClient("appid", "secret", requestor=requestor, access_token=old, refresher=self.refresher)
+        self.assertEqual(client.token, "old")
+        self.assertTrue(wait_for(lambda: client.access_token is not old))
+        self.assertEqual(client.token, "token-1")
+        snapshot = self.refresher.snapshot()
+        self.assertEqual(snapshot["refreshes"], 1)
+        self.assertEqual(snapshot["latency"]["count"], 1)
+        self.assertGreater(snapshot["accounts"]["appid"]["expires_in"], 7000)
+
+    def test_failure(self):
+        client = WxClient("appid", "secret", requestor=FailingRequestor(), refresher=self.refresher)
+        # 失败后按retry_interval重试
+        self.assertTrue(wait_for(lambda: self.refresher.failures >= 2))
+        self.assertIsNone(client.access_token)
+        self.assertIn("system error", self.refresher.snapshot()["accounts"]["appid"]["last_error"])
+
+    def test_lock_free_read(self):
+        client = WxClient("appid", "secret", requestor=TokenRequestor(), access_token=AccessToken("t", 7200))
+        locked = threading.Event()
+        done = threading.Event()
+
+        def hold():
+            client.acquire_lock()
+            locked.set()
+            done.wait(2)
+            client.release_lock()
+
+        t = threading.Thread(target=hold)
+        t.start()
+        locked.wait()
+        try:
+            # 其它线程持有锁时仍然可以读取有效的令牌
+            self.assertEqual(client.token, "t")
+        finally:
+            done.set()
+            t.join()
+
+    def test_weak_reference(self):
+        client = WxClient("appid", "secret", requestor=TokenRequestor(), access_token=AccessToken("t", 7200),
+                          refresher=self.refresher)
+        self.assertEqual(len(self.refresher._clients), 1)
+        del client
+        gc.collect()
+        self.assertEqual(len(self.refresher._clients), 0)
+
+
+class RevokingRequestor(Requestor):
+    """
+    只接受最新令牌的请求处理器，模拟其它系统获取新令牌后原令牌失效
+    """
+
+    def __init__(self):
+        self.grants = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None):
+        if "/cgi-bin/token" in url:
+            with self.lock:
+                self.grants += 1
+                n = self.grants
+            time.sleep(0.05)
+            return {"access_token": "token-%d" % n, "expires_in": 7200}
+        return self.post(url)
+
+    def post(self, url, params=None, data=None, files=None, headers=None, **kwargs):
+        self.calls += 1
+        if files:
+            self.uploaded = files["media"].read()
+        token = url.split("access_token=")[1].split("&")[0]
+        if token != "token-%d" % self.grants:
+            check_api_error({"errcode": 40001, "errmsg": "invalid credential"})
+        return {"ip_list": [token], "media_id": "m1"}
+
+
+class TestTokenRetry(TestCase):
+    def setUp(self):
+        self.requestor = RevokingRequestor()
+        self.client = WxClient("appid", "secret", requestor=self.requestor, access_token=AccessToken("revoked", 7200))
+
+    def test_retry(self):
+        self.assertEqual(self.client.get_ip_list()["ip_list"], ["token-1"])
+        self.assertEqual(self.requestor.grants, 1)
+        self.assertEqual(self.requestor.calls, 2)
+
+    def test_coalesce(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.client.get_ip_list()["ip_list"][0]))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 同时失败的调用方只刷新一次令牌
+        self.assertEqual(self.requestor.grants, 1)
+        self.assertEqual(results, ["token-1"] * 8)
+
+    def test_retry_once(self):
+        # 新令牌仍然无效时不再重试
+        self.requestor.grants = 1
+        self.client.token_store.fetch = lambda appid, grant, current=None, min_ttl=60, invalid=None: \
+            AccessToken("still-bad", 7200)
+        with self.assertRaises(WxApiException) as cm:
+            self.client.get_ip_list()
+        self.assertEqual(cm.exception.errcode, 40001)
+        self.assertEqual(self.requestor.calls, 2)
+
+    def test_other_error(self):
+        self.requestor.post = lambda url, **kwargs: check_api_error({"errcode": 45009, "errmsg": "limit"})
+        with self.assertRaises(WxApiException):
+            self.client.get_ip_list()
+        self.assertEqual(self.requestor.grants, 0)
+
+    def test_upload_rewind(self):
+        media = io.BytesIO(b"image")
+        self.assertEqual(self.client.upload_material(MediaType.Voice, media), "m1")
+        # 重试时从头上传文件
+        self.assertEqual(self.requestor.uploaded, b"image")
+
+    def test_shared_store(self):
+        # 另一个工作进程已经获取并发布了新令牌
+        store = MemoryTokenStore()
+        store.save("appid", AccessToken("token-1", 7200))
+        self.requestor.grants = 1
+        self.client.token_store = store
+        self.assertEqual(self.client.get_ip_list()["ip_list"], ["token-1"])
+        self.assertEqual(self.requestor.grants, 1)
@@ -9,6 +9,7 @@ from unittest import TestCase
 from xml.etree.ElementTree import ParseError
 
 from weixin.utils import *
+from weixin.utils import _msgtodict_etree as Et_msgtodict
 from hashlib import sha1
 
 class TestUtils(TestCase):
@@ -29,6 +30,9 @@ class TestUtils(TestCase):
         timestamp = "1515914909"
         nonce = "691998230"
         self.assertTrue(check_signature("resplendsky", timestamp, nonce, signature))
+        # 含非ASCII字符的伪造签名按校验失败处理
+        self.assertFalse(check_signature("resplendsky", timestamp, nonce, "é"))
+        self.assertFalse(check_signature("resplendsky", timestamp, nonce, "\udcff"))
 
     def test_msgtodict(self):
         xmldata = r"<xml>" \
@@ -78,6 +82,38 @@ class TestUtils(TestCase):
         except ParseError as e:
             print('解析错误XML文件捕捉到的异常信息为:', e)
 
+    def test_msgtodict_bytes(self):
+        xmldata = r"<xml>" \
+                  r"<ToUserName><![CDATA[公众号]]></ToUserName>" \
+                  r"<FromUserName><![CDATA[粉丝号]]></FromUserName>" \
+                  r"<CreateTime>1460537339</CreateTime>" \
+                  r"<MsgType><![CDATA[event]]></MsgType>" \
+                  r"<Event><![CDATA[subscribe]]></Event>" \
+                  r"<EventKey><![CDATA[]]></EventKey>" \
+                  r"</xml>"
+        dic = msgtodict(xmldata.encode("utf-8"))
+        self.assertEqual(dic, msgtodict(xmldata))
+        self.assertEqual(dic["ToUserName"], '公众号')
+        self.assertEqual(dic["CreateTime"], '1460537339')
+        # 与ElementTree保持一致，空节点的值为None
+        self.assertIsNone(dic["EventKey"])
+
+    def test_msgtodict_fallback(self):
+        # 以下文档不符合单遍扫描的格式，需要交给ElementTree解析，解析结果应保持一致
+        xmllist = [
+            '<?xml version="1.0" encoding="utf-8"?><xml><ToUserName><![CDATA[a]]></ToUserName></xml>',
+            '<xml><Content>a &amp; b</Content></xml>',
+            '<xml><Content><![CDATA[a]]>b</Content></xml>',
+            '<xml><Content><![CDATA[a\r\nb]]></Content></xml>',
+            '<xml><Content type="text">a</Content><Empty/></xml>',
+            '<xml>\n  <ToUserName><![CDATA[a]]></ToUserName>\n</xml>\n',
+        ]
+        for xmldata in xmllist:
+            self.assertEqual(msgtodict(xmldata), Et_msgtodict(xmldata), xmldata)
+            self.assertEqual(msgtodict(xmldata.encode("utf-8")), Et_msgtodict(xmldata.encode("utf-8")), xmldata)
+        self.assertEqual(msgtodict(xmllist[1])["Content"], "a & b")
+        self.assertEqual(msgtodict(xmllist[3])["Content"], "a\nb")
+
     def test_rand_str(self):
         print(rand_str(10, string.digits))
         print(rand_str(10, string.digits + string.ascii_letters))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：测试wxbot中统计接口的访问限制
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import json
+import unittest
+from unittest import TestCase
+
+from weixin.utils import check_signature
+
+try:
+    import django
+    from django.conf import settings
+except ImportError:
+    django = None
+
+
+def setup_django():
+    """
+    使用wxbot的URL配置和CSRF中间件初始化Django，不读取wxbot.settings中的日志文件等部署配置
+    """
+    if not settings.configured:
+        settings.configure(
+            SECRET_KEY="tests",
+            ROOT_URLCONF="wxbot.urls",
+            INSTALLED_APPS=["django.contrib.admin", "django.contrib.auth", "django.contrib.contenttypes",
+                            "django.contrib.sessions", "django.contrib.messages"],
+            MIDDLEWARE=["django.middleware.csrf.CsrfViewMiddleware"],
+            WX_SETTINGS={},
+        )
+        django.setup()
+
+
+class StaffUser(object):
+    is_staff = True
+
+
+@unittest.skipIf(django is None, "没有安装Django")
+class TestMetricsViews(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_django()
+        from django.test import RequestFactory
+        cls.factory = RequestFactory()
+
+    def test_internal_ip(self):
+        from wxbot.views import wx_metrics, wx_token_metrics
+        for view in (wx_metrics, wx_token_metrics):
+            response = view(self.factory.get("/wechat-metrics/", REMOTE_ADDR="127.0.0.1"))
+            self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(json.loads(response.content.decode("utf-8")), dict)
+
+    def test_external(self):
+        from wxbot.views import wx_metrics, wx_token_metrics
+        for view in (wx_metrics, wx_token_metrics):
+            # 伪造的X-Forwarded-For不影响判断
+            request = self.factory.get("/wechat-metrics/", REMOTE_ADDR="203.0.113.5",
+                                       HTTP_X_FORWARDED_FOR="127.0.0.1")
+            self.assertEqual(view(request).status_code, 403)
+            request = self.factory.get("/wechat-metrics/", REMOTE_ADDR="203.0.113.5")
+            request.user = StaffUser()
+            self.assertEqual(view(request).status_code, 200)
+
+
+@unittest.skipIf(django is None, "没有安装Django")
+class TestAsyncView(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_django()
+
+    def setUp(self):
+        from django.test import Client
+        from wxbot.settings import WX_SETTINGS
+        # 微信服务器的请求不带CSRF令牌
+        self.client = Client(enforce_csrf_checks=True)
+        self.token = WX_SETTINGS["main"]["token"]
+
+    def signed(self, path, **params):
+        import hashlib
+        params.update(timestamp="1515935965", nonce="1320562132")
+        params["signature"] = hashlib.sha1("".join(sorted([self.token, params["timestamp"], params["nonce"]]))
+                                           .encode("utf-8")).hexdigest()
+        self.assertTrue(check_signature(self.token, params["timestamp"], params["nonce"], params["signature"]))
+        return path + "?" + "&".join("%s=%s" % item for item in params.items())
+
+    def test_get(self):
+        response = self.client.get(self.signed("/wechat-async/main/", echostr="hello"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"hello")
+
+    def test_post(self):
+        # 签名错误的消息被拒绝，回复空字符串
+        response = self.client.post("/wechat-async/main/?signature=x&timestamp=1&nonce=n", data="<xml></xml>",
+                                    content_type="text/xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        response = self.client.post(self.signed("/wechat-async/main/"), data="<xml></xml>", content_type="text/xml")
+        self.assertEqual(response.status_code, 200)
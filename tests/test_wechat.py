@@ -3,9 +3,17 @@
 # 文件目的：
 # 创建日期：2018/1/6
 # -------------------------------------------------------------------------
+import asyncio
+import hashlib
+import threading
+import time
 from unittest import TestCase
 
-from weixin.wechat import SimpleWxService
+from weixin.cache import MessageDeduplicator
+from weixin.utils import msgtodict, parse_message
+from weixin.wechat import SimpleWxService, Handler, ACK_REPLY, WxAccount, MsgRecord, route, CONCURRENCY, EchoHandler
+from weixin.render import render_text
+from weixin.worker import WorkerPool
 
 WX_SETTINGS = {
     "ycx": {
@@ -26,6 +34,185 @@ WX_SETTINGS = {
 }
 
 
+class CountingHandler(Handler):
+    """
+    记录被调用次数的消息处理器
+    """
+
+    def __init__(self):
+        Handler.__init__(self)
+        self.count = 0
+
+    def reply(self, record):
+        self.count += 1
+        return "reply-%d" % self.count
+
+
+class FailingOnceHandler(Handler):
+    """
+    第一次调用时抛出异常的消息处理器
+    """
+
+    def __init__(self):
+        Handler.__init__(self)
+        self.count = 0
+
+    def reply(self, record):
+        self.count += 1
+        if self.count == 1:
+            raise RuntimeError("处理失败")
+        return "retried"
+
+
+class SlowHandler(Handler):
+    """
+    在后台线程中处理消息的处理器
+    """
+    asynchronous = True
+
+    def reply(self, record):
+        return render_text(record.msg.fromUserName, record.msg.toUserName, "处理完成")
+
+
+class CoroutineHandler(Handler):
+    """
+    协程类型的消息处理器
+    """
+
+    async def reply(self, record):
+        await asyncio.sleep(0)
+        return render_text(record.msg.fromUserName, record.msg.toUserName, "协程处理完成")
+
+
+class FakeClient(object):
+    """
+    记录客服消息的API客户端
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def send_custom_message(self, message):
+        self.messages.append(message)
+
+
+class NamedHandler(Handler):
+    """
+    回复自身名称的消息处理器
+    """
+
+    def __init__(self, name, msg_types=None, events=None, event_keys=None):
+        Handler.__init__(self)
+        self.name = name
+        self.msg_types = msg_types
+        self.events = events
+        self.event_keys = event_keys
+
+    def reply(self, record):
+        return self.name
+
+
+def click_xml(key):
+    return r"<xml>" \
+           r"<ToUserName><![CDATA[toUser]]></ToUserName>" \
+           r"<FromUserName><![CDATA[FromUser]]></FromUserName>" \
+           r"<CreateTime>123456789</CreateTime>" \
+           r"<MsgType><![CDATA[event]]></MsgType>" \
+           r"<Event><![CDATA[CLICK]]></Event>" \
+           r"<EventKey><![CDATA[" + key + r"]]></EventKey>" \
+           r"</xml>"
+
+
+class TestRouteTable(TestCase):
+    def setUp(self):
+        self.account = WxAccount("test", "appid", "token", "secret",
+                                 "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J", dedup=False)
+
+    def record(self, xmldata):
+        return MsgRecord(self.account.appid, self.account.kind, parse_message(msgtodict(xmldata)), None)
+
+    def test_route(self):
+        text = NamedHandler("text", msg_types=("text",))
+        menu = NamedHandler("menu", events=("click",), event_keys=("menu_",))
+        click = NamedHandler("click", events=("CLICK",))
+        wildcard = NamedHandler("wildcard")
+        self.account.handler_list = [text, menu, click, wildcard]
+
+        label, handlers = self.account.route_handlers(self.record(click_xml("menu_1")))
+        self.assertEqual(label, "event:click")
+        self.assertEqual(handlers, [menu, click, wildcard])
+        label, handlers = self.account.route_handlers(self.record(click_xml("other")))
+        self.assertEqual(handlers, [click, wildcard])
+        self.assertEqual(self.account.handle(self.record(click_xml("menu_1"))), "menu")
+        self.assertEqual(self.account.handle(self.record(click_xml("other"))), "click")
+        self.assertIn("event:click", self.account.route_timings())
+
+        # 移除处理器后重新建立索引
+        self.account.remove_handler(click)
+        label, handlers = self.account.route_handlers(self.record(click_xml("other")))
+        self.assertEqual(handlers, [wildcard])
+
+    def test_route_function(self):
+        @route(msg_types=("image",))
+        def on_image(record):
+            return "image"
+
+        self.account.handler_list = [on_image]
+        label, handlers = self.account.route_handlers(self.record(click_xml("menu_1")))
+        self.assertEqual(handlers, [])
+
+
+class OverlapHandler(Handler):
+    """
+    记录同时处理的消息数量的处理器
+    """
+
+    def __init__(self, concurrency):
+        Handler.__init__(self)
+        self.concurrency = concurrency
+        self.running = 0
+        self.max_running = 0
+        self.counter_lock = threading.Lock()
+
+    def reply(self, record):
+        with self.counter_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.counter_lock:
+            self.running -= 1
+        return "ok"
+
+
+class TestConcurrency(TestCase):
+    def run_handler(self, concurrency, openids):
+        handler = OverlapHandler(concurrency)
+        records = []
+        for openid in openids:
+            xmldata = r"<xml><ToUserName><![CDATA[toUser]]></ToUserName>" \
+                      r"<FromUserName><![CDATA[" + openid + r"]]></FromUserName>" \
+                      r"<CreateTime>1348831860</CreateTime><MsgType><![CDATA[text]]></MsgType>" \
+                      r"<Content><![CDATA[hello]]></Content><MsgId>1</MsgId></xml>"
+            records.append(MsgRecord("appid", None, parse_message(msgtodict(xmldata)), None))
+        threads = [threading.Thread(target=handler.handle, args=(r,)) for r in records]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return handler.max_running
+
+    def test_serial(self):
+        self.assertEqual(self.run_handler(CONCURRENCY.SERIAL, ["u1", "u2", "u3"]), 1)
+
+    def test_per_user(self):
+        # 同一用户的消息依次处理
+        self.assertEqual(self.run_handler(CONCURRENCY.PER_USER, ["u1", "u1", "u1"]), 1)
+        self.assertGreater(self.run_handler(CONCURRENCY.PER_USER, ["u%d" % i for i in range(8)]), 1)
+
+    def test_thread_safe(self):
+        self.assertGreater(self.run_handler(CONCURRENCY.THREAD_SAFE, ["u1", "u1", "u1"]), 1)
+
+
 class TestSimpleWxService(TestCase):
     def setUp(self):
         self.chat = SimpleWxService(WX_SETTINGS)
@@ -45,3 +232,387 @@ class TestSimpleWxService(TestCase):
         # 检查没有配置消息处理器的情形
         result2 = self.chat.do_post("ycx.test", inputMsg)
         self.assertIsNotNone(result2)
+
+    def test_dedup(self):
+        inputMsg = r"<xml>" \
+                   r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+                   r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+                   r"<CreateTime>1515935965</CreateTime>" \
+                   r"<MsgType><![CDATA[text]]></MsgType>" \
+                   r"<Content><![CDATA[hello]]></Content>" \
+                   r"<MsgId>6510895392933538074</MsgId>" \
+                   r"</xml>"
+        account = self.chat.get_account("ycx")
+        handler = CountingHandler()
+        account.handler_list = [handler]
+        # 微信服务器重试的消息使用缓存的回复，不再重复调用消息处理器
+        self.assertEqual(self.chat.do_post("ycx", inputMsg), "reply-1")
+        self.assertEqual(self.chat.do_post("ycx", inputMsg), "reply-1")
+        self.assertEqual(handler.count, 1)
+        self.assertEqual(account.deduplicator.stats()["hits"], 1)
+
+    def test_async_handler(self):
+        inputMsg = r"<xml>" \
+                   r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+                   r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+                   r"<CreateTime>1515935965</CreateTime>" \
+                   r"<MsgType><![CDATA[text]]></MsgType>" \
+                   r"<Content><![CDATA[hello]]></Content>" \
+                   r"<MsgId>6510895392933538075</MsgId>" \
+                   r"</xml>"
+        account = self.chat.get_account("ycx")
+        account.client = FakeClient()
+        account.handler_list = [SlowHandler()]
+        account.worker_pool = WorkerPool(max_workers=1)
+        # 立即回复success，处理结果通过客服消息接口发送
+        self.assertEqual(self.chat.do_post("ycx", inputMsg), ACK_REPLY)
+        account.worker_pool.shutdown()
+        self.assertEqual(account.client.messages, [
+            {"touser": "o-Qi-1Or0HmcnUyGqjXkhB4A6qqw", "msgtype": "text", "text": {"content": "处理完成"}}
+        ])
+
+    def test_async_do_post(self):
+        inputMsg = r"<xml>" \
+                   r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+                   r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+                   r"<CreateTime>1515935965</CreateTime>" \
+                   r"<MsgType><![CDATA[text]]></MsgType>" \
+                   r"<Content><![CDATA[hello]]></Content>" \
+                   r"<MsgId>6510895392933538076</MsgId>" \
+                   r"</xml>"
+        account = self.chat.get_account("ycx")
+        counting = CountingHandler()
+        account.handler_list = [CoroutineHandler()]
+        result = asyncio.run(self.chat.async_do_post("ycx", inputMsg))
+        self.assertIn("协程处理完成", result)
+        # 同步的消息处理器在线程池中执行
+        account.handler_list = [counting]
+        account.deduplicator = None
+        self.assertEqual(asyncio.run(self.chat.async_do_post("ycx", inputMsg)), "reply-1")
+        # 同步调用协程类型的消息处理器
+        account.handler_list = [CoroutineHandler()]
+        self.assertIn("协程处理完成", self.chat.do_post("ycx", inputMsg))
+
+
+def signed_params(token, timestamp=None, nonce="nonce"):
+    timestamp = str(int(timestamp if timestamp is not None else time.time()))
+    signature = hashlib.sha1("".join(sorted([token, timestamp, nonce])).encode("utf-8")).hexdigest()
+    return {"signature": signature, "timestamp": timestamp, "nonce": nonce}
+
+
+class TestVerifyRequest(TestCase):
+    inputMsg = r"<xml>" \
+               r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+               r"<FromUserName><![CDATA[o-Qi-1Or0HmcnUyGqjXkhB4A6qqw]]></FromUserName>" \
+               r"<CreateTime>1515935965</CreateTime>" \
+               r"<MsgType><![CDATA[text]]></MsgType>" \
+               r"<Content><![CDATA[hello]]></Content>" \
+               r"<MsgId>6510895392933538077</MsgId>" \
+               r"</xml>"
+
+    def setUp(self):
+        self.handler = CountingHandler()
+        self.account = WxAccount("test", "appid", "token", "secret",
+                                 "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J", handler_list=[self.handler])
+
+    def test_forged(self):
+        params = signed_params("token")
+        params["signature"] = "0" * 40
+        self.assertEqual(self.account.response_message(params, "garbage"), "")
+        self.assertEqual(self.account.response_message({}, "garbage"), "")
+        params["signature"] = "é"
+        self.assertEqual(self.account.response_message(params, "garbage"), "")
+        self.assertEqual(self.handler.count, 0)
+
+    def test_expired(self):
+        params = signed_params("token", time.time() - 3600)
+        self.assertEqual(self.account.response_message(params, self.inputMsg), "")
+        self.assertEqual(self.handler.count, 0)
+
+    def test_replay(self):
+        params = signed_params("token")
+        self.assertEqual(self.account.response_message(params, self.inputMsg), "reply-1")
+        # 重放的请求只能得到原消息已有的回复
+        self.assertEqual(self.account.response_message(params, self.inputMsg), "reply-1")
+        self.assertEqual(self.handler.count, 1)
+        # 签名不包含消息内容，重放的请求参数搭配新的消息时被拒绝
+        self.assertEqual(self.account.response_message(params, self.inputMsg.replace("538077", "538078")), "")
+        self.assertEqual(self.handler.count, 1)
+        # 去重缓存过期后，时间戳误差范围内的重放仍被拒绝
+        self.account.deduplicator = MessageDeduplicator(ttl=0)
+        self.assertEqual(self.account.response_message(params, self.inputMsg), "")
+        self.account.deduplicator = None
+        self.assertEqual(self.account.response_message(params, self.inputMsg), "")
+        self.assertEqual(self.handler.count, 1)
+
+    def test_retry_after_failure(self):
+        failing = FailingOnceHandler()
+        self.account.handler_list = [failing]
+        params = signed_params("token", nonce="retry")
+        with self.assertRaises(RuntimeError):
+            self.account.response_message(params, self.inputMsg)
+        # 处理失败后，微信服务器以相同参数重试的请求重新调用消息处理器
+        self.assertEqual(self.account.response_message(params, self.inputMsg), "retried")
+        self.assertEqual(failing.count, 2)
+        self.assertEqual(asyncio.run(self.account.async_response_message(params, self.inputMsg)), "retried")
+        self.assertEqual(failing.count, 2)
+
+    def test_async(self):
+        params = signed_params("token", nonce="async")
+        self.assertEqual(asyncio.run(self.account.async_response_message(params, self.inputMsg)), "reply-1")
+        self.assertEqual(asyncio.run(self.account.async_response_message(params, self.inputMsg)), "reply-1")
+        params["signature"] = "0" * 40
+        self.assertEqual(asyncio.run(self.account.async_response_message(params, self.inputMsg)), "")
+        self.assertEqual(self.handler.count, 1)
+
+
+class TestEncryptedMessage(TestCase):
+    def test_encrypted_round_trip(self):
+        account = WxAccount("test", "appid", "token", "secret", "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J",
+                            handler_list=[EchoHandler()])
+        params = signed_params("token", nonce="encrypted")
+        envelope = msgtodict(account.crypto.encrypt_msg(TestVerifyRequest.inputMsg, params["nonce"],
+                                                        params["timestamp"]))
+        params["msg_signature"] = envelope["MsgSignature"]
+        body = "<xml><ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>" \
+               "<Encrypt><![CDATA[%s]]></Encrypt></xml>" % envelope["Encrypt"]
+        reply = msgtodict(account.response_message(params, body))
+        text = account.crypto.decrypt_msg(reply["Encrypt"], reply["MsgSignature"], reply["TimeStamp"], reply["Nonce"])
+        self.assertIn("消息内容为'hello'", text)
+
+
+class MenuHandler(Handler):
+    """
+    按菜单Key值回复固定文本的处理器
+    """
+    events = ("click",)
+    concurrency = CONCURRENCY.THREAD_SAFE
+    cacheable = True
+
+    def __init__(self):
+        Handler.__init__(self)
+        self.count = 0
+
+    def reply(self, record):
+        self.count += 1
+        msg = record.msg
+        return render_text(msg.fromUserName, msg.toUserName, "菜单%s" % msg.eventKey)
+
+
+class TestReplyCache(TestCase):
+    def setUp(self):
+        self.handler = MenuHandler()
+        self.account = WxAccount("test", "appid", "token", "secret",
+                                 "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J", handler_list=[self.handler],
+                                 dedup=False)
+
+    def test_click(self):
+        first = msgtodict(self.account.response_message(None, click_xml("menu_1")))
+        second = msgtodict(self.account.response_message(None, click_xml("menu_1").replace("[FromUser]", "[Other]")))
+        self.assertEqual(self.handler.count, 1)
+        self.assertEqual(second["ToUserName"], "Other")
+        self.assertEqual(second["FromUserName"], "toUser")
+        self.assertEqual(second["Content"], first["Content"])
+        self.account.response_message(None, click_xml("menu_2"))
+        self.assertEqual(self.handler.count, 2)
+        # 修改菜单后重新调用处理器
+        self.account.invalidate_replies("click")
+        self.account.response_message(None, click_xml("menu_1"))
+        self.assertEqual(self.handler.count, 3)
+        self.assertEqual(asyncio.run(self.account.async_response_message(None, click_xml("menu_1"))),
+                         self.account.response_message(None, click_xml("menu_1")))
+        self.assertEqual(self.handler.count, 3)
+
+    def test_not_cacheable(self):
+        # 之前的处理器不可缓存时，回复可能与用户有关，不缓存
+        self.account.handler_list = [NamedHandler("", events=("click",)), self.handler]
+        self.account.response_message(None, click_xml("menu_1"))
+        self.account.response_message(None, click_xml("menu_1"))
+        self.assertEqual(self.handler.count, 2)
+
+    def test_keyword_router(self):
+        from weixin.keywords import KeywordRouter
+        router = KeywordRouter([("帮助", "帮助信息")])
+        self.account.handler_list = [router]
+        text = TestVerifyRequest.inputMsg.replace("hello", "帮助")
+        self.assertEqual(msgtodict(self.account.response_message(None, text))["Content"], "帮助信息")
+        self.assertEqual(self.account.reply_cache.stats()["size"], 1)
+        # 规则变化后缓存的回复失效
+        router.set_rules([("帮助", "新的帮助信息")])
+        self.assertEqual(msgtodict(self.account.response_message(None, text))["Content"], "新的帮助信息")
+        router.add_rule("天气", lambda record: render_text(record.openid, "gh", "晴"))
+        self.assertFalse(router.cacheable)
+
+
+class TestAccountRegistry(TestCase):
+    def setUp(self):
+        self.chat = SimpleWxService(WX_SETTINGS)
+
+    def config(self, **kwargs):
+        return dict(WX_SETTINGS["ycx"], **kwargs)
+
+    def test_add_remove(self):
+        # 延迟创建的公众号在首次收到请求时才创建
+        self.assertIsNone(self.chat.add_account("new", self.config()))
+        self.assertIn("new", self.chat.account_ids())
+        accounts = self.chat.accounts
+        account = self.chat.get_account("new")
+        self.assertIsNotNone(account)
+        # 写时复制，已取得的公众号字典不受影响
+        self.assertNotIn("new", accounts)
+        self.assertIs(self.chat.get_account("new"), account)
+        self.assertIs(self.chat.remove_account("new"), account)
+        self.assertIsNone(self.chat.get_account("new"))
+        self.assertIsNone(self.chat.remove_account("new"))
+
+    def test_update_handlers(self):
+        account = self.chat.get_account("ycx")
+        client = account.client
+        updated = self.chat.update_account("ycx", self.config(handlers=["tests.test_wechat.MenuHandler"]))
+        # 只修改处理器时保留原公众号对象
+        self.assertIs(updated, account)
+        self.assertIs(updated.client, client)
+        self.assertEqual(type(updated.handler_list[0]).__name__, "MenuHandler")
+        self.assertIs(self.chat.update_account("ycx", self.config(handlers=["tests.test_wechat.MenuHandler"])),
+                      account)
+
+    def test_update_settings(self):
+        account = self.chat.get_account("ycx")
+        client = account.client
+        updated = self.chat.update_account("ycx", self.config(verify=False))
+        self.assertIsNot(updated, account)
+        self.assertFalse(updated.verify_requests)
+        self.assertIs(updated.client, client)
+        self.assertIs(updated.deduplicator, account.deduplicator)
+        self.assertIs(updated.session_store, account.session_store)
+        updated = self.chat.update_account("ycx", self.config(secret="other"))
+        self.assertIsNot(updated.client, client)
+
+    def test_reload_file(self):
+        import json
+        import os
+        import tempfile
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"other": self.config(), "logging": {"level": "INFO"}}, f)
+            self.assertIsNotNone(self.chat.get_account("ycx.test"))
+            self.chat.load_file(path)
+            self.assertEqual(self.chat.account_ids(), ["other"])
+            self.assertEqual(list(self.chat.accounts.keys()), [])
+            self.assertIsNone(self.chat.get_account("ycx.test"))
+            self.assertIsNotNone(self.chat.get_account("other"))
+        finally:
+            os.remove(path)
+
+    def test_eager(self):
+        chat = SimpleWxService(WX_SETTINGS, lazy=False)
+        self.assertEqual(sorted(chat.accounts.keys()), ["ycx", "ycx.test"])
+
+    def test_eviction(self):
+        settings = {"a%d" % i: self.config() for i in range(4)}
+        chat = SimpleWxService(settings, max_accounts=2)
+        for key in ("a0", "a1", "a2"):
+            chat.get_account(key)
+        self.assertEqual(sorted(chat.accounts.keys()), ["a1", "a2"])
+        # 被淘汰的公众号在下次收到请求时重新创建
+        self.assertIsNotNone(chat.get_account("a0"))
+        self.assertEqual(sorted(chat.accounts.keys()), ["a0", "a2"])
+
+        chat = SimpleWxService(settings, idle_timeout=60)
+        chat.get_account("a0").last_used -= 120
+        chat.get_account("a1")
+        self.assertEqual(chat.evict_idle(), ["a0"])
+        self.assertEqual(list(chat.accounts.keys()), ["a1"])
+
+    def test_evict_busy(self):
+        settings = {"a%d" % i: self.config() for i in range(3)}
+        chat = SimpleWxService(settings, max_accounts=1, idle_timeout=60)
+        with chat.using_account("a0") as account:
+            # 正在处理请求的公众号不被淘汰
+            chat.get_account("a1")
+            self.assertIn("a0", chat.accounts)
+            account.last_used -= 120
+            self.assertNotIn("a0", chat.evict_idle())
+        self.assertIs(chat.get_account("a0"), account)
+        account.last_used -= 120
+        self.assertIn("a0", chat.evict_idle())
+        # 已淘汰的公众号不能再被占用
+        self.assertFalse(account.enter())
+
+    def test_evict_keeps_state(self):
+        chat = SimpleWxService({"a0": self.config()}, idle_timeout=60)
+        account = chat.get_account("a0")
+        client = account.client
+        account.last_used -= 120
+        self.assertEqual(chat.evict_idle(), ["a0"])
+        # 重新创建的公众号继续使用原有的访问令牌、去重缓存和会话存储
+        rebuilt = chat.get_account("a0")
+        self.assertIsNot(rebuilt, account)
+        self.assertIs(rebuilt.client, client)
+        self.assertIs(rebuilt.deduplicator, account.deduplicator)
+        self.assertIs(rebuilt.nonce_filter, account.nonce_filter)
+        self.assertIs(rebuilt.session_store, account.session_store)
+
+    def test_evict_stops_refresh(self):
+        from weixin.api.client import WxClient
+        from weixin.api.models import AccessToken
+        from weixin.api.token import TokenRefresher
+        refresher = TokenRefresher()
+        self.addCleanup(refresher.stop)
+        chat = SimpleWxService({"a0": self.config()}, idle_timeout=60)
+        account = chat.get_account("a0")
+        client = account.client = WxClient("appid", "secret", access_token=AccessToken("t", 7200), refresher=refresher)
+        self.assertIn(client, refresher._clients)
+        account.last_used -= 120
+        chat.evict_idle()
+        # 被淘汰的公众号停止后台刷新令牌，重新创建后恢复
+        self.assertNotIn(client, refresher._clients)
+        self.assertIs(chat.get_account("a0").client, client)
+        self.assertIn(client, refresher._clients)
+        chat.remove_account("a0")
+        self.assertNotIn(client, refresher._clients)
+
+    def test_token_store_lifecycle(self):
+        chat = SimpleWxService({"a0": self.config(token_store={"backend": "memory"})}, idle_timeout=60)
+        closed = []
+        account = chat.get_account("a0")
+        store = account.token_store
+        store.close = lambda: closed.append(store)
+        account.last_used -= 120
+        chat.evict_idle()
+        # 重新创建的公众号继续使用原有的令牌存储，不创建新的连接
+        self.assertIs(chat.get_account("a0").token_store, store)
+        self.assertIs(chat.update_account("a0", self.config(token_store={"backend": "memory"}, verify=False))
+                      .token_store, store)
+        self.assertEqual(closed, [])
+        # 令牌存储配置修改后关闭原有的令牌存储
+        updated = chat.update_account("a0", self.config())
+        self.assertEqual(closed, [store])
+        self.assertIsNone(updated.token_store)
+
+        store = chat.update_account("a0", self.config(token_store={"backend": "memory"})).token_store
+        store.close = lambda: closed.append(store)
+        chat.remove_account("a0")
+        self.assertEqual(closed[-1], store)
+
+    def test_retire_after_requests(self):
+        closed = []
+        account = self.chat.get_account("ycx")
+        account.session_store.close = lambda: closed.append(account.id)
+        with self.chat.using_account("ycx") as used:
+            self.assertIs(used, account)
+            updated = self.chat.update_account("ycx", self.config(session={"backend": "memory"}))
+            self.assertIsNot(updated, account)
+            # 原公众号的请求完成之前不关闭其会话存储
+            self.assertEqual(closed, [])
+            self.assertIs(self.chat.get_account("ycx"), updated)
+        self.assertEqual(closed, ["ycx"])
+
+        account = self.chat.get_account("ycx.test")
+        account.session_store.close = lambda: closed.append(account.id)
+        with self.chat.using_account("ycx.test"):
+            self.chat.remove_account("ycx.test")
+            self.assertEqual(closed, ["ycx"])
+        self.assertEqual(closed, ["ycx", "ycx.test"])
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：使用本机的消息接口测试wxload压测命令
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs
+
+from weixin.utils import check_signature
+
+try:
+    from tests.test_views import setup_django
+except ImportError:
+    setup_django = None
+
+try:
+    import django
+    from django.conf import settings
+except ImportError:
+    django = None
+
+AES_KEY = "ATAQEUbhPfxqUEwI3KkemTuS1tRrhKyUH1yC1iuvT6J"
+
+
+class StubWechatHandler(BaseHTTPRequestHandler):
+    """
+    校验签名并回复success的消息接口
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    posts = []
+
+    def params(self):
+        return {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+
+    def do_GET(self):
+        params = self.params()
+        ok = check_signature("token", params.get("timestamp"), params.get("nonce"), params.get("signature"))
+        self.reply(params["echostr"].encode("utf-8") if ok else b"")
+
+    def do_POST(self):
+        params = self.params()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if check_signature("token", params.get("timestamp"), params.get("nonce"), params.get("signature")):
+            self.posts.append((params, body))
+            self.reply(b"success")
+        else:
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(django is None, "没有安装Django")
+class TestWxLoad(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setup_django()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubWechatHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:%d/wechat/main/" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def run_command(self, **scenario):
+        from wxbot.management.commands.wxload import Command
+        StubWechatHandler.posts = []
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "scenario.json")
+        output = os.path.join(directory, "result.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dict({"url": self.url, "token": "token", "requests": 20, "concurrency": 4}, **scenario), f)
+        command = Command(stdout=io.StringIO(), stderr=io.StringIO())
+        command.handle(scenario=path, output=output)
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_plain(self):
+        result = self.run_command()
+        self.assertEqual((result["sent"], result["ok"], result["failed"]), (20, 20, 0))
+        self.assertEqual(len(StubWechatHandler.posts), 20)
+        self.assertNotIn("token", result["scenario"])
+
+    def test_encrypted(self):
+        result = self.run_command(encrypted=True, appid="wxappid", encodingAESKey=AES_KEY, verify=False)
+        self.assertEqual(result["ok"], 20)
+        params, body = StubWechatHandler.posts[0]
+        self.assertEqual(params["encrypt_type"], "aes")
+        self.assertIn(b"<Encrypt>", body)
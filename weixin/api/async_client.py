@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：异步调用微信提供的API，在协程中批量调用API时不需要为每个调用占用一个线程
+# 创建日期：2026/10/18
+# 说明：AsyncWxClient的方法与WxClient一一对应，只是需要await；
+#      默认的传输层使用httpx，需要另外安装：pip install httpx
+# -------------------------------------------------------------------------
+
+import asyncio
+import json
+
+from weixin.api.client import API_BASE, _replace_token, _rewind
+from weixin.api.menu import WxMenu
+from weixin.api.models import *
+from weixin.api.token import MemoryTokenStore
+from weixin.exceptions import check_api_error, WxApiException
+from weixin.logger import log
+
+
+# ---------------------------------------------------------------------------
+#   AsyncRequestor
+# ---------------------------------------------------------------------------
+
+class AsyncRequestor(object):
+    """
+    异步HTTP请求处理器，与Requestor的接口相同，各方法均为协程
+    """
+
+    async def get(self, url, params=None):
+        raise NotImplementedError('AsyncRequestor的子类没有实现get方法')
+
+    async def download_file(self, url, writer=None, stream=False, data=None, **kwargs):
+        raise NotImplementedError('AsyncRequestor的子类没有实现download_file方法')
+
+    async def post(self, url, params=None, data=None, files=None, headers=None, **kwargs):
+        raise NotImplementedError('AsyncRequestor的子类没有实现post方法')
+
+    async def aclose(self):
+        pass
+
+
+def _httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("需要安装httpx包")
+    return httpx
+
+
+class HttpxRequestor(AsyncRequestor):
+    """
+    使用httpx.AsyncClient的异步请求处理器。
+    AsyncClient的连接池在所有协程间共享，同时进行的请求数不超过concurrency；
+    AsyncClient与首次使用时的事件循环绑定，不能跨事件循环使用
+    """
+
+    def __init__(self, concurrency=100, max_connections=100, max_keepalive=20, timeout=(3.05, 10)):
+        """
+        :param concurrency: 同时进行的请求数，超过时在本地排队等待，避免瞬间向微信服务器发起过多请求
+        :param max_connections: 连接池的最大连接数
+        :param max_keepalive: 连接池中保持的空闲连接数
+        :param timeout: 默认的超时时间，单位为秒，可以是(连接超时, 读取超时)元组；调用时可以通过timeout参数覆盖
+        """
+        _httpx()
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.timeout = timeout
+        self._client = None
+        self._semaphore = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.create_client()
+        return self._client
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _timeout(self, timeout):
+        httpx = _httpx()
+        if isinstance(timeout, tuple):
+            return httpx.Timeout(timeout[1], connect=timeout[0])
+        return httpx.Timeout(timeout)
+
+    def create_client(self):
+        """
+        创建带连接池的AsyncClient
+        """
+        httpx = _httpx()
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive)
+        return httpx.AsyncClient(limits=limits, timeout=self._timeout(self.timeout))
+
+    async def aclose(self):
+        """
+        关闭连接池中的所有连接
+        """
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    async def get(self, url, params=None, **kwargs):
+        if "timeout" in kwargs:
+            kwargs["timeout"] = self._timeout(kwargs["timeout"])
+        async with self.semaphore:
+            r = await self.client.get(url, params=params, **kwargs)
+        # 假定微信返回的结果都是json字符串
+        r = r.json()
+        check_api_error(r)
+        return r
+
+    async def download_file(self, url, writer, stream=False, data=None, **kwargs):
+        if writer is None:
+            raise ValueError("在Stream模式下下载文件时，输出流对象不能为空.")
+        if "timeout" in kwargs:
+            kwargs["timeout"] = self._timeout(kwargs["timeout"])
+        method = "GET" if data is None else "POST"
+        async with self.semaphore:
+            async with self.client.stream(method, url, content=data, **kwargs) as r:
+                # 微信返回失败记录时，不能将错误文本写入到素材文件流中
+                if r.headers.get("Content-Type") == 'text/plain':
+                    await r.aread()
+                    check_api_error(r.json())
+                async for chunk in r.aiter_bytes(512 if stream else None):
+                    if chunk:
+                        writer.write(chunk)
+
+    async def post(self, url, params=None, data=None, files=None, headers=None, **kwargs):
+        if "timeout" in kwargs:
+            kwargs["timeout"] = self._timeout(kwargs["timeout"])
+        async with self.semaphore:
+            r = await self.client.post(url, params=params, content=data, files=files, headers=headers, **kwargs)
+        # 假定微信返回的结果都是json字符串
+        r = r.json()
+        check_api_error(r)
+        return r
+
+
+_default_requestor = None
+
+
+def default_async_requestor():
+    """
+    获取进程内共享的异步请求处理器，未指定请求处理器的AsyncWxClient共用同一个连接池和并发上限
+    """
+    global _default_requestor
+    if _default_requestor is None:
+        _default_requestor = HttpxRequestor()
+    return _default_requestor
+
+
+def set_default_async_requestor(requestor):
+    """
+    替换进程内共享的异步请求处理器。已创建的AsyncWxClient不受影响
+    :param requestor: AsyncRequestor对象
+    :return: 原来的请求处理器
+    """
+    global _default_requestor
+    old, _default_requestor = _default_requestor, requestor
+    return old
+
+
+# ---------------------------------------------------------------------------
+#   AsyncWxClient
+# ---------------------------------------------------------------------------
+
+class AsyncWxClient(object):
+    """
+    异步调用微信提供的API
+    """
+
+    def __init__(self, appid, secret, requestor=None, access_token=None, api_base=API_BASE, token_store=None):
+        """
+
+        :param appid: 第三方用户唯一凭证
+        :param secret: 第三方用户唯一凭证密钥，即appsecret
+        :param requestor: 异步HTTP请求处理器
+        :param api_base: 微信API的地址，测试时可以指向本机的模拟服务器
+        :param token_store: 访问令牌存储，可以与同一公众号的WxClient共用
+        """
+        self.appid = appid
+        self.secret = secret
+        self.api_base = api_base
+        # 未指定时使用进程内共享的请求处理器
+        self.requestor = requestor or default_async_requestor()
+        self.access_token = access_token
+        self.token_store = token_store or MemoryTokenStore()
+        self._token_lock = None
+
+    async def get_token(self):
+        await self.check_token()
+        return self.access_token.token
+
+    # ---------------------------------------------------------------------------
+    # ~ 凭证相关
+
+    async def grant_token(self):
+        """
+        获得用户凭证，凭证是用来验证发送给服务器的消息是否来自微信后台
+        :return:
+        """
+        url = self.api_base + "/cgi-bin/token?grant_type=client_credential&appid={0}&secret={1}" \
+            .format(self.appid, self.secret)
+        r = await self.requestor.get(url)
+        log.debug("微信API返回结果为:%s", r)
+        return AccessToken(r["access_token"], r["expires_in"])
+
+    async def check_token(self):
+        if self.access_token is not None and not self.access_token.is_expired():
+            return
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        # 令牌过期时只有一个协程去获取，其余协程等待获取结果
+        async with self._token_lock:
+            if (self.access_token is None) or (self.access_token.is_expired()):
+                self.access_token = await self.token_store.async_fetch(self.appid, self.grant_token,
+                                                                       self.access_token)
+
+    async def invalidate_token(self, stale):
+        """
+        微信返回令牌无效时获取新令牌。同时失败的多个协程只有第一个刷新，其余直接使用新令牌
+        :param stale: 微信返回无效的令牌字符串
+        :return: 新的AccessToken对象
+        """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            token = self.access_token
+            if token is None or token.token == stale:
+                token = await self.token_store.async_fetch(self.appid, self.grant_token, invalid=stale)
+                self.access_token = token
+            return token
+
+    async def _call(self, method, url, *args, **kwargs):
+        """
+        调用API，微信返回令牌无效时刷新令牌，并使用新令牌重试一次
+        :param method: 请求处理器的协程方法
+        """
+        rewind = _rewind(kwargs.get("files"))
+        try:
+            return await method(url, *args, **kwargs)
+        except WxApiException as e:
+            replace = _replace_token(url, e)
+            if replace is None or rewind is None:
+                raise
+            stale, replace = replace
+            log.warning("公众号%s的访问令牌已失效(%s)，刷新后重试", self.appid, e.errcode)
+            token = await self.invalidate_token(stale)
+            rewind()
+            return await method(replace(token.token), *args, **kwargs)
+
+    async def _get(self, url, *args, **kwargs):
+        return await self._call(self.requestor.get, url, *args, **kwargs)
+
+    async def _post(self, url, *args, **kwargs):
+        return await self._call(self.requestor.post, url, *args, **kwargs)
+
+    async def _download_file(self, url, *args, **kwargs):
+        return await self._call(self.requestor.download_file, url, *args, **kwargs)
+
+    # ---------------------------------------------------------------------------
+    # ~ 自定义菜单相关
+
+    async def create_menus(self, menu):
+        """
+        创建微信公众号的自定义菜单
+        :param menu: WxMenu类型或者Json格式字符串
+        """
+        url = self.api_base + "/cgi-bin/menu/create?access_token={0}".format(await self.get_token())
+        if isinstance(menu, WxMenu):
+            data = menu.to_json().encode('utf-8')
+        else:
+            data = menu
+        return await self._post(url, data=data)
+
+    async def get_menus(self):
+        """
+        查询自定义菜单的结构
+        """
+        url = self.api_base + "/cgi-bin/menu/get?access_token={0}".format(await self.get_token())
+        try:
+            r = await self._get(url)
+        except WxApiException as e:
+            if e.errcode == 46003:
+                # 对于菜单不存在的异常，返回空菜单对象
+                return WxMenu(None)
+            raise e
+        return WxMenu(r)
+
+    async def remove_menus(self):
+        """
+        删除当前使用的自定义菜单
+        """
+        url = self.api_base + "/cgi-bin/menu/delete?access_token={0}".format(await self.get_token())
+        try:
+            r = await self._get(url)
+        except WxApiException as e:
+            if e.errcode == 46003:
+                return WxMenu(None)
+            raise e
+        return r
+
+    # ---------------------------------------------------------------------------
+    # ~ 临时素材文件相关
+
+    async def upload_media(self, media_type, media_file):
+        """
+        上传临时素材文件
+        :param media_type: 媒体类型
+        :param media_file: 输入文件流
+        :return: 返回微信提供的媒体标识Id
+        """
+        url = self.api_base + "/cgi-bin/media/upload?access_token={0}&type={1}".format(await self.get_token(),
+                                                                                       media_type.value)
+        r = await self._post(url, files={"media_file": media_file})
+        return r["media_id"]
+
+    async def download_media(self, media_id, writer, stream=True):
+        """
+        下载临时素材文件
+        :param media_id:  媒体标识
+        :param writer:  输出流
+        :param stream: 是否启用流模式，默认为True
+        """
+        url = self.api_base + "/cgi-bin/media/get?access_token={0}&media_id={1}".format(await self.get_token(),
+                                                                                        media_id)
+        await self._download_file(url, writer, stream)
+
+    # ---------------------------------------------------------------------------
+    # ~ 永久素材相关
+
+    async def upload_material(self, media_type, media_file):
+        """
+        上传除视频外的其它类型永久素材
+        :param media_type: 媒体文件类型，分别有图片（image）、语音（voice）、和缩略图（thumb）
+        :param media_file: 媒体文件
+        :return: 新增的素材的media_id; 当上传类型为图片时，返回tuple结构的(media_id,url)
+        """
+        url = self.api_base + "/cgi-bin/material/add_material?access_token={0}&type={1}". \
+            format(await self.get_token(), media_type.value)
+        r = await self._post(url, files={"media": media_file})
+        if media_type == MediaType.Image:
+            return r["media_id"], r["url"]
+        return r["media_id"]
+
+    async def upload_video(self, title, introduction, media_file):
+        """
+        上传视频类型的永久素材
+        :param title: 视频素材的标题
+        :param introduction: 视频素材的描述
+        :param media_file: 媒体文件
+        :return: 新增的永久素材的media_id
+        """
+        url = self.api_base + "/cgi-bin/material/add_material?access_token={0}&type={1}". \
+            format(await self.get_token(), MediaType.Video.value)
+        params = {
+            "description": '{"title":"%s", "introduction": "%s"}' % (title, introduction)
+        }
+        r = await self._post(url, params=params, files={"media": media_file})
+        return r["media_id"]
+
+    async def download_material(self, media_id, writer, stream=True):
+        """
+        下载其他类型的永久素材消息
+        :param media_id:  媒体标识
+        :param writer:  输出流
+        :param stream: 是否启用流模式，默认为True
+        """
+        mid = media_id[0] if isinstance(media_id, tuple) else media_id
+        url = self.api_base + "/cgi-bin/material/get_material?access_token={0}&media_id={1}". \
+            format(await self.get_token(), mid)
+        data = '{"media_id":"%s"}' % mid
+        await self._download_file(url, writer, stream, data=data)
+
+    async def remove_material(self, media_id):
+        """
+        删除永久素材
+        :param media_id: 媒体标识
+        """
+        url = self.api_base + "/cgi-bin/material/del_material?access_token={0}".format(await self.get_token())
+        mid = media_id[0] if isinstance(media_id, tuple) else media_id
+        data = '{"media_id":"%s"}' % mid
+        return await self._post(url, data=data)
+
+    async def get_material_count(self):
+        """
+        获取永久素材的数量
+        :return: MaterialCount对象
+        """
+        url = self.api_base + "/cgi-bin/material/get_materialcount?access_token={0}".format(await self.get_token())
+        r = await self._get(url, None)
+        return MaterialCount(r["voice_count"], r["video_count"], r["image_count"])
+
+    async def get_material_list(self, media_type, offset=0, count=10):
+        """
+        获取永久素材的列表
+        :return: 永久素材的列表
+        """
+        url = self.api_base + "/cgi-bin/material/batchget_material?access_token={0}".format(await self.get_token())
+        data = '{"type":"%s","offset":%d,"count":%d}' % (media_type.value, offset, count)
+        r = await self._post(url, data=data)
+        return MaterialList(media_type, r)
+
+    async def get_video_info(self, media_id):
+        """
+        获取了永久视图素材信息
+        :param media_id: 媒体标识
+        """
+        url = self.api_base + "/cgi-bin/material/get_material?access_token={0}".format(await self.get_token())
+        data = '{"media_id":"%s"}' % media_id
+        r = await self._post(url, data=data)
+        return VideoInfo(r)
+
+    # ---------------------------------------------------------------------------
+    # ~ 图文信息相关
+
+    async def upload_news(self, articles):
+        """
+        上传图文类型永久素材
+        :param articles: 要上传的图文数组
+        :return: 媒体标识
+        """
+        url = self.api_base + "/cgi-bin/material/add_news?access_token={0}".format(await self.get_token())
+        r = await self._post(url, data=articles.tojson())
+        return r["media_id"]
+
+    # ---------------------------------------------------------------------------
+    # ~ 微信用户相关
+
+    async def get_userinfo(self, openid, lang="zh_CN"):
+        """
+        获取微信用户基本信息
+        :param openid: 普通用户的标识，对当前公众号唯一
+        :param lang: 返回国家地区语言版本，zh_CN 简体，zh_TW 繁体，en 英语
+        :return: Subscriber对象
+        """
+        url = self.api_base + "/cgi-bin/user/info?access_token={0}".format(await self.get_token())
+        params = {
+            "openid": openid,
+            "lang": lang
+        }
+        r = await self._get(url, params)
+        return Subscriber(r)
+
+    async def get_userlist(self, first_open_id=None):
+        """
+        批量获取公众号对应的用户列表
+        :param first_open_id: 第一个拉取的OPENID，不填默认从头开始拉取
+        :return: 用户列表SubscriberInfos对象
+        """
+        url = self.api_base + "/cgi-bin/user/get?access_token={0}".format(await self.get_token())
+        params = {}
+        if first_open_id:
+            params["next_openid"] = first_open_id
+        r = await self._get(url, params)
+        return SubscriberInfos(r)
+
+    async def remark_user(self, openid, remark):
+        """
+        设置用户备注名
+        """
+        url = self.api_base + "/cgi-bin/user/get?access_token={0}".format(await self.get_token())
+        data = '{"openid":"%s", "":"%s"}' % (openid, remark)
+        return await self._post(url, data=data)
+
+    # ---------------------------------------------------------------------------
+    # ~ 微信用户标签相关
+
+    async def create_tag(self, name):
+        """
+        创建新的公众号用户标签
+        :param name: 标签名称（30个字符以内）
+        :return: 标签对象
+        """
+        url = self.api_base + "/cgi-bin/tags/create?access_token={0}".format(await self.get_token())
+        data = '{"tag":{"name":"%s"}}' % name
+        r = await self._post(url, data=data)
+        return Tag(r["id"], r["name"])
+
+    async def get_all_tags(self):
+        """
+        获取公众号下所有的用户标签
+        """
+        url = self.api_base + "/cgi-bin/tags/get?access_token={0}".format(await self.get_token())
+        r = await self._get(url)
+        return list(r["tags"])
+
+    async def update_tag(self, tag_id, new_name):
+        """
+        编辑公众号下的用户标签
+        :param tag_id: 标签标识
+        :param new_name: 标签的新名称
+        """
+        url = self.api_base + "/cgi-bin/tags/update?access_token={0}".format(await self.get_token())
+        data = '{"tag":{"id":%d,"name":"%s"}}' % (tag_id, new_name)
+        await self._post(url, data=data)
+
+    async def remove_tag(self, tag_id):
+        """
+        删除用户标签
+        :param tag_id: 标签标识
+        """
+        url = self.api_base + "/cgi-bin/tags/delete?access_token={0}".format(await self.get_token())
+        data = '{"tag":{"id":%d}}' % tag_id
+        await self._post(url, data=data)
+
+    async def get_users_in_tag(self, tag_id, next_openid=""):
+        """
+        获取标签下粉丝列表
+        """
+        url = self.api_base + "/cgi-bin/user/tag/get?access_token={0}".format(await self.get_token())
+        data = '{"tag":%d, "next_openid":"%s"}' % (tag_id, next_openid)
+        r = await self._post(url, data=data)
+        return r["count"]
+
+    async def tag_users(self, tag_id, openids):
+        """
+        批量为用户打标签
+        """
+        url = self.api_base + "/cgi-bin/user/tag/get?access_token={0}".format(await self.get_token())
+        data = '{"tagid":%d, "openid_list":%s}' % (tag_id, json.dumps(openids))
+        r = await self._post(url, data=data)
+        return r["count"]
+
+    async def cancel_tag_users(self, tag_id, openids):
+        """
+        批量为用户取消标签
+        :param tag_id: 标签标识
+        :param openids: 要取消的用户的openids
+        """
+        url = self.api_base + "/cgi-bin/tags/members/batchuntagging?access_token={0}". \
+            format(await self.get_token())
+        data = '{"tagid":%d,"openid_list":%s}' % (tag_id, json.dumps(openids))
+        return await self._post(url, data)
+
+    # ---------------------------------------------------------------------------
+    # ~ 客服消息
+
+    async def send_custom_message(self, message):
+        """
+        发送客服消息，在用户发送消息后的48小时内可以不限次数地发送
+        :param message: 客服消息字典，包括touser、msgtype及对应消息类型的内容
+        :return: 微信API返回结果
+        """
+        url = self.api_base + "/cgi-bin/message/custom/send?access_token={0}".format(await self.get_token())
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        return await self._post(url, data=data)
+
+    async def send_custom_text(self, openid, content):
+        """
+        发送文本客服消息
+        :param openid: 普通用户的标识
+        :param content: 文本消息内容
+        """
+        return await self.send_custom_message({"touser": openid, "msgtype": "text", "text": {"content": content}})
+
+    # ---------------------------------------------------------------------------
+    # ~ 群发消息
+
+    async def message_status(self, msg_id):
+        """
+        查询群发消息发送状态
+        :param msg_id: 要查询的消息标识
+        :return: MessageStatus 消息状态
+        """
+        url = self.api_base + "/cgi-bin/message/mass/get?access_token={0}".format(await self.get_token())
+        data = '{"msg_id":"%s"}' % msg_id
+        r = await self._post(url, data)
+        return MessageStatus(r["msg_status"])
+
+    # ---------------------------------------------------------------------------
+    # ~ 杂类
+
+    async def get_ip_list(self):
+        """
+        获取微信服务器IP地址。
+        :return: 微信服务器IP地址列表
+        """
+        url = self.api_base + "/cgi-bin/getcallbackip?access_token={0}".format(await self.get_token())
+        return await self._get(url)
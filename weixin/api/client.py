@@ -5,38 +5,95 @@
 # 微信API官方文档地址为： https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1445241432
 # -------------------------------------------------------------------------
 
-import requests
+import re
+import threading
 
 from weixin.api.models import *
-from weixin.exceptions import check_api_error, WxApiException
+from weixin.exceptions import check_api_error, WxApiException, TOKEN_ERRCODES
 from weixin.logger import log
 from weixin.utils import Lockable, deprecated
 from weixin.api.menu import WxMenu
+from weixin.api.token import MemoryTokenStore
 
 
 # ---------------------------------------------------------------------------
 #   Requestor
 # ---------------------------------------------------------------------------
 
+def _requests():
+    """
+    首次调用API时才导入requests，只处理消息的进程不需要加载
+    """
+    import requests
+    return requests
+
 
 class Requestor(object):
     def get(self, url, params=None):
         raise NotImplementedError('Requestor的子类没有实现http_get方法')
 
-    def download_file(self, url, params=None, writer=None, stream=False, **kwargs):
+    def download_file(self, url, writer=None, stream=False, data=None, **kwargs):
         raise NotImplementedError('Requestor的子类没有实现download_file方法')
 
-    def download_file(self, url, writer=None, stream=False, data=None, **kwargs):
+    def post(self, url, params=None, data=None, files=None, headers=None, **kwargs):
         raise NotImplementedError('Requestor的子类没有实现http_post方法')
 
 
 class DefaultRequstor(Requestor):
     """
-    默认的HTTP请求处理器
+    默认的HTTP请求处理器。
+    使用requests.Session的连接池保持与微信服务器的长连接，避免每次调用API都重新建立TCP和TLS连接；
+    Session在多个线程间共享，首次调用API时创建
     """
 
+    def __init__(self, pool_connections=10, pool_maxsize=20, timeout=(3.05, 10), max_retries=0):
+        """
+        :param pool_connections: 缓存连接池的主机数量
+        :param pool_maxsize: 每个主机保持的最大连接数，应不小于同时调用API的线程数
+        :param timeout: 默认的超时时间，单位为秒，可以是(连接超时, 读取超时)元组；调用时可以通过timeout参数覆盖
+        :param max_retries: 连接失败时的重试次数
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        session = self._session
+        if session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self.create_session()
+                session = self._session
+        return session
+
+    def create_session(self):
+        """
+        创建带连接池的Session
+        """
+        requests = _requests()
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_connections,
+                                                pool_maxsize=self.pool_maxsize, max_retries=self.max_retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        """
+        关闭连接池中的所有连接
+        """
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
     def get(self, url, params=None, encoding='utf-8', **kwargs):
-        r = requests.get(url, params=params, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        r = self.session.get(url, params=params, **kwargs)
         r.encoding = encoding
         # 假定微信返回的结果都是json字符串
         r = r.json()
@@ -46,23 +103,29 @@ class DefaultRequstor(Requestor):
     def download_file(self, url, writer, stream=False, data=None, **kwargs):
         if writer is None:
             raise ValueError("在Stream模式下下载文件时，输出流对象不能为空.")
+        kwargs.setdefault("timeout", self.timeout)
         if data is None:
-            r = requests.get(url, stream=stream, **kwargs)
+            r = self.session.get(url, stream=stream, **kwargs)
         else:
-            r = requests.post(url, data=data, **kwargs)
-        # 修正bug-1， 即微信返回失败记录，如"{errcode;40017,errmsg:'media_id is not valid hint", 系统不返回失败
-        # 导致会将错误文本当作记录写入到下载素材文件流中
-        if "Content-Type" in r.headers.keys() and r.headers["Content-Type"] == 'text/plain':
-            check_api_error(r.json())
-        if stream:
-            for chunk in r.iter_content(chunk_size=512):
-                if chunk:
-                    writer.write(chunk)
-        else:
-            writer.write(r.content)
+            r = self.session.post(url, data=data, stream=stream, **kwargs)
+        try:
+            # 修正bug-1， 即微信返回失败记录，如"{errcode;40017,errmsg:'media_id is not valid hint", 系统不返回失败
+            # 导致会将错误文本当作记录写入到下载素材文件流中
+            if "Content-Type" in r.headers.keys() and r.headers["Content-Type"] == 'text/plain':
+                check_api_error(r.json())
+            if stream:
+                for chunk in r.iter_content(chunk_size=512):
+                    if chunk:
+                        writer.write(chunk)
+            else:
+                writer.write(r.content)
+        finally:
+            # 流式下载时需要关闭响应，连接才能回到连接池
+            r.close()
 
     def post(self, url, params=None, data=None, files=None, headers=None, encoding='utf-8', **kwargs):
-        r = requests.post(url, params=params, data=data, files=files, headers=headers, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        r = self.session.post(url, params=params, data=data, files=files, headers=headers, **kwargs)
         r.encoding = encoding
         # 假定微信返回的结果都是json字符串
         r = r.json()
@@ -70,33 +133,111 @@ class DefaultRequstor(Requestor):
         return r
 
 
+_default_requestor = None
+_default_requestor_lock = threading.Lock()
+
+
+def default_requestor():
+    """
+    获取进程内共享的HTTP请求处理器，未指定请求处理器的WxClient共用同一个连接池
+    """
+    global _default_requestor
+    if _default_requestor is None:
+        with _default_requestor_lock:
+            if _default_requestor is None:
+                _default_requestor = DefaultRequstor()
+    return _default_requestor
+
+
+def set_default_requestor(requestor):
+    """
+    替换进程内共享的HTTP请求处理器，如调整连接池大小或超时时间。已创建的WxClient不受影响
+    :param requestor: Requestor对象
+    :return: 原来的请求处理器
+    """
+    global _default_requestor
+    with _default_requestor_lock:
+        old, _default_requestor = _default_requestor, requestor
+    return old
+
+
 # ---------------------------------------------------------------------------
 #   WxClient
 # ---------------------------------------------------------------------------
 
+# 微信API的地址
+API_BASE = "https://api.weixin.qq.com"
+
+# URL中的访问令牌参数
+_TOKEN_PARAM = re.compile(r"access_token=([^&]+)")
+
+
+def _rewind(files):
+    """
+    记录上传文件流的当前位置，重试前恢复到该位置
+    :return: 恢复位置的函数；文件流不支持定位时返回None
+    """
+    try:
+        positions = [(f, f.tell()) for f in (files or {}).values()]
+    except (AttributeError, OSError):
+        return None
+
+    def rewind():
+        for f, pos in positions:
+            f.seek(pos)
+
+    return rewind
+
+
+def _replace_token(url, error):
+    """
+    微信返回令牌无效时，获取URL中的令牌
+    :return: (URL中的令牌, 替换令牌的函数)；不是令牌错误或URL中没有令牌时返回None
+    """
+    if error.errcode not in TOKEN_ERRCODES:
+        return None
+    match = _TOKEN_PARAM.search(url)
+    if match is None:
+        return None
+    return match.group(1), lambda token: url[:match.start(1)] + token + url[match.end(1):]
+
+
 class WxClient(Lockable):
     """
     调用微信提供的API
     """
 
-    def __init__(self, appid, secret, requestor=None, access_token=None):
+    def __init__(self, appid, secret, requestor=None, access_token=None, api_base=API_BASE, token_store=None,
+                 refresher=None):
         """
 
         :param appid: 第三方用户唯一凭证
         :param secret: 第三方用户唯一凭证密钥，即appsecret
         :param requestor: HTTP请求处理器
+        :param api_base: 微信API的地址，测试时可以指向本机的模拟服务器
+        :param token_store: 访问令牌存储，多进程或多机部署时使用共享的存储，为None时保存在本进程内
+        :param refresher: TokenRefresher对象，在后台提前刷新令牌；为None时在令牌过期后调用API时刷新
         """
         Lockable.__init__(self)
         self.appid = appid
         self.secret = secret
-        self.requestor = requestor or DefaultRequstor()
+        self.api_base = api_base
+        # 未指定时使用进程内共享的请求处理器
+        self.requestor = requestor or default_requestor()
         self.access_token = access_token
+        self.token_store = token_store or MemoryTokenStore()
+        self.refresher = refresher
+        if refresher is not None:
+            refresher.register(self)
 
     @property
     def token(self):
-        # Token存在于本机内存中，如果多机部署会存在问题？
-        self.check_token()
-        return self.access_token.token
+        # 令牌有效时直接读取，不加锁；后台刷新时整体替换access_token，读取方不会看到不完整的令牌
+        token = self.access_token
+        if token is None or token.is_expired():
+            # 令牌过期时从令牌存储中获取，多进程部署时只有一个进程调用grant_token
+            token = self.check_token()
+        return token.token
 
     # ---------------------------------------------------------------------------
     # ~ 凭证相关
@@ -106,17 +247,71 @@ class WxClient(Lockable):
         获得用户凭证，凭证是用来验证发送给服务器的消息是否来自微信后台
         :return:
         """
-        url = "https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={0}&secret={1}" \
+        url = self.api_base + "/cgi-bin/token?grant_type=client_credential&appid={0}&secret={1}" \
             .format(self.appid, self.secret)
         r = self.requestor.get(url)
-        log.debug("微信API返回结果为:{0}".format(r))
+        log.debug("微信API返回结果为:%s", r)
         return AccessToken(r["access_token"], r["expires_in"])
 
     def check_token(self):
+        return self.refresh_token()
+
+    def invalidate_token(self, stale):
+        """
+        微信返回令牌无效时获取新令牌。同时失败的多个调用方只有第一个刷新，其余直接使用新令牌
+        :param stale: 微信返回无效的令牌字符串
+        :return: 新的AccessToken对象
+        """
         try:
             self.acquire_lock()
-            if (self.access_token is None) or (self.access_token.is_expired()):
-                self.access_token = self.grant_token()
+            token = self.access_token
+            if token is None or token.token == stale:
+                token = self.token_store.fetch(self.appid, self.grant_token, invalid=stale)
+                self.access_token = token
+            return token
+        finally:
+            self.release_lock()
+
+    def _call(self, method, url, *args, **kwargs):
+        """
+        调用API，微信返回令牌无效时刷新令牌，并使用新令牌重试一次
+        :param method: 请求处理器的方法
+        """
+        rewind = _rewind(kwargs.get("files"))
+        try:
+            return method(url, *args, **kwargs)
+        except WxApiException as e:
+            replace = _replace_token(url, e)
+            if replace is None or rewind is None:
+                raise
+            stale, replace = replace
+            log.warning("公众号%s的访问令牌已失效(%s)，刷新后重试", self.appid, e.errcode)
+            token = self.invalidate_token(stale)
+            rewind()
+            return method(replace(token.token), *args, **kwargs)
+
+    def _get(self, url, *args, **kwargs):
+        return self._call(self.requestor.get, url, *args, **kwargs)
+
+    def _post(self, url, *args, **kwargs):
+        return self._call(self.requestor.post, url, *args, **kwargs)
+
+    def _download_file(self, url, *args, **kwargs):
+        return self._call(self.requestor.download_file, url, *args, **kwargs)
+
+    def refresh_token(self, min_ttl=60):
+        """
+        令牌的剩余有效时间不足min_ttl秒时获取新令牌
+        :param min_ttl: 单位为秒，后台刷新时大于60秒以便提前刷新
+        :return: 有效的AccessToken对象
+        """
+        try:
+            self.acquire_lock()
+            token = self.access_token
+            if token is None or token.remaining() <= min_ttl:
+                token = self.token_store.fetch(self.appid, self.grant_token, token, min_ttl)
+                self.access_token = token
+            return token
         finally:
             self.release_lock()
 
@@ -130,13 +325,13 @@ class WxClient(Lockable):
         :param menu: WxMenu类型或者Json格式字符串
         参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1421141013
         """
-        url = "https://api.weixin.qq.com/cgi-bin/menu/create?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/menu/create?access_token={0}".format(self.token)
         # 如果是WxMenu类型，需将其转换为Json格式字符串
         if isinstance(menu, WxMenu):
             data = menu.to_json().encode('utf-8')
         else:
             data = menu
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return r
 
     def get_menus(self):
@@ -145,9 +340,9 @@ class WxClient(Lockable):
         请注意，在设置了个性化菜单后，使用本自定义菜单查询接口可以获取默认菜单和全部个性化菜单信息
         参见:https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1421141014
         """
-        url = "https://api.weixin.qq.com/cgi-bin/menu/get?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/menu/get?access_token={0}".format(self.token)
         try:
-            r = self.requestor.get(url)
+            r = self._get(url)
         except WxApiException as e:
             if e.errcode == 46003:
                 # 对于菜单不存在的异常，返回空菜单对象
@@ -161,9 +356,9 @@ class WxClient(Lockable):
         请注意，在个性化菜单时，调用此接口会删除默认菜单及全部个性化菜单
         参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1421141015
         """
-        url = "https://api.weixin.qq.com/cgi-bin/menu/delete?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/menu/delete?access_token={0}".format(self.token)
         try:
-            r = self.requestor.get(url)
+            r = self._get(url)
         except WxApiException as e:
             if e.errcode == 46003:
                 # 对于菜单不存在的异常，返回空菜单对象
@@ -182,11 +377,8 @@ class WxClient(Lockable):
         :param media_file: 输入文件流
         :return: 返回微信提供的媒体标识Id
         """
-        url = "https://api.weixin.qq.com/cgi-bin/media/upload?access_token={0}&type={1}".format(self.token,
-                                                                                                media_type.value)
-        r = self.requestor.post(url,
-                                files={"media_file": media_file}
-                                )
+        url = self.api_base + "/cgi-bin/media/upload?access_token={0}&type={1}".format(self.token, media_type.value)
+        r = self._post(url, files={"media_file": media_file})
         return r["media_id"]
 
     def download_media(self, media_id, writer, stream=True):
@@ -197,8 +389,8 @@ class WxClient(Lockable):
         :param writer:  输出流
         :param stream: 是否启用流模式，默认为True
         """
-        url = "https://api.weixin.qq.com/cgi-bin/media/get?access_token={0}&media_id={1}".format(self.token, media_id)
-        self.requestor.download_file(url, writer, stream)
+        url = self.api_base + "/cgi-bin/media/get?access_token={0}&media_id={1}".format(self.token, media_id)
+        self._download_file(url, writer, stream)
 
     # ---------------------------------------------------------------------------
     # ~ 永久素材相关
@@ -211,11 +403,9 @@ class WxClient(Lockable):
         :param media_file: 媒体文件
         :return: 返回的即为新增的图文消息素材的media_id; 当上传类型为图片时，返回tuple结构的(media_id,url)
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/add_material?access_token={0}&type={1}". \
+        url = self.api_base + "/cgi-bin/material/add_material?access_token={0}&type={1}". \
             format(self.token, media_type.value)
-        r = self.requestor.post(url,
-                                files={"media": media_file}
-                                )
+        r = self._post(url, files={"media": media_file})
         if media_type == MediaType.Image:
             # 新增图片素材时会返回新增的图片素材的图片URL
             return r["media_id"], r["url"]
@@ -230,15 +420,12 @@ class WxClient(Lockable):
         :param media_file: 媒体文件
         :return: 新增的永久素材的media_id
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/add_material?access_token={0}&type={1}".format(self.token,
-                                                                                                         MediaType.Video.value)
+        url = self.api_base + "/cgi-bin/material/add_material?access_token={0}&type={1}". \
+            format(self.token, MediaType.Video.value)
         params = {
             "description": '{"title":"%s", "introduction": "%s"}' % (title, introduction)
         }
-        r = self.requestor.post(url,
-                                params=params,
-                                files={"media": media_file}
-                                )
+        r = self._post(url, params=params, files={"media": media_file})
         return r["media_id"]
 
     def download_material(self, media_id, writer, stream=True):
@@ -254,10 +441,9 @@ class WxClient(Lockable):
             mid = media_id[0]
         else:
             mid = media_id
-        url = "https://api.weixin.qq.com/cgi-bin/material/get_material?access_token={0}&media_id={1}".format(self.token,
-                                                                                                             mid)
+        url = self.api_base + "/cgi-bin/material/get_material?access_token={0}&media_id={1}".format(self.token, mid)
         data = '{"media_id":"%s"}' % mid
-        self.requestor.download_file(url, writer, stream, data=data)
+        self._download_file(url, writer, stream, data=data)
 
     def remove_material(self, media_id):
         """
@@ -267,13 +453,13 @@ class WxClient(Lockable):
         参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1444738731
         :param media_id: 媒体标识
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/del_material?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/material/del_material?access_token={0}".format(self.token)
         if isinstance(media_id, tuple):
             mid = media_id[0]
         else:
             mid = media_id
         data = '{"media_id":"%s"}' % mid
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return r
 
     def get_material_count(self):
@@ -282,8 +468,8 @@ class WxClient(Lockable):
         参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1444738733
         :return: MaterialCount对象
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/get_materialcount?access_token={0}".format(self.token)
-        r = self.requestor.get(url, None)
+        url = self.api_base + "/cgi-bin/material/get_materialcount?access_token={0}".format(self.token)
+        r = self._get(url, None)
         return MaterialCount(r["voice_count"], r["video_count"], r["image_count"])
 
     def get_material_list(self, media_type, offset=0, count=10):
@@ -292,9 +478,9 @@ class WxClient(Lockable):
         参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1444738734
         :return: 永久素材的列表
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/batchget_material?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/material/batchget_material?access_token={0}".format(self.token)
         data = '{"type":"%s","offset":%d,"count":%d}' % (media_type.value, offset, count)
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return MaterialList(media_type, r)
 
     def get_video_info(self, media_id):
@@ -303,9 +489,9 @@ class WxClient(Lockable):
         :param media_id: 媒体标识
         :return:
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/get_material?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/material/get_material?access_token={0}".format(self.token)
         data = '{"media_id":"%s"}' % media_id
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return VideoInfo(r)
 
     # ---------------------------------------------------------------------------
@@ -317,12 +503,10 @@ class WxClient(Lockable):
         :param articles: 要上传的图文数组
         :return: 媒体标识
         """
-        url = "https://api.weixin.qq.com/cgi-bin/material/add_news?access_token={0}". \
+        url = self.api_base + "/cgi-bin/material/add_news?access_token={0}". \
             format(self.token)
         jsondata = articles.tojson()
-        r = self.requestor.post(url,
-                                data=jsondata
-                                )
+        r = self._post(url, data=jsondata)
         return r["media_id"]
 
     # ---------------------------------------------------------------------------
@@ -336,12 +520,12 @@ class WxClient(Lockable):
         :param lang: 返回国家地区语言版本，zh_CN 简体，zh_TW 繁体，en 英语
         :return: Subscriber对象
         """
-        url = "https://api.weixin.qq.com/cgi-bin/user/info?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/user/info?access_token={0}".format(self.token)
         params = {
             "openid": openid,
             "lang": lang
         }
-        r = self.requestor.get(url, params)
+        r = self._get(url, params)
         return Subscriber(r)
 
     def get_userlist(self, first_open_id=None):
@@ -351,11 +535,11 @@ class WxClient(Lockable):
         :param first_open_id: 第一个拉取的OPENID，不填默认从头开始拉取
         :return: 用户列表SubscriberInfos对象
         """
-        url = "https://api.weixin.qq.com/cgi-bin/user/get?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/user/get?access_token={0}".format(self.token)
         params = {}
         if first_open_id:
             params["next_openid"] = first_open_id
-        r = self.requestor.get(url, params)
+        r = self._get(url, params)
         return SubscriberInfos(r)
 
     def remark_user(self, openid, remark):
@@ -366,9 +550,9 @@ class WxClient(Lockable):
         :param remark:
         :return:
         """
-        url = "https://api.weixin.qq.com/cgi-bin/user/get?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/user/get?access_token={0}".format(self.token)
         data = '{"openid":"%s", "":"%s"}' % (openid, remark)
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return r
 
     # ---------------------------------------------------------------------------
@@ -383,9 +567,9 @@ class WxClient(Lockable):
         :param name: 标签名称（30个字符以内）
         :return: 标签对象
         """
-        url = "https://api.weixin.qq.com/cgi-bin/tags/create?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/tags/create?access_token={0}".format(self.token)
         data = '{"tag":{"name":"%s"}}' % name
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return Tag(r["id"], r["name"])
 
     def get_all_tags(self):
@@ -394,8 +578,8 @@ class WxClient(Lockable):
         :return: 公众号下所有的用户标签
         """
         tags = []
-        url = "https://api.weixin.qq.com/cgi-bin/tags/get?access_token={0}".format(self.token)
-        r = self.requestor.get(url)
+        url = self.api_base + "/cgi-bin/tags/get?access_token={0}".format(self.token)
+        r = self._get(url)
         for g in r["tags"]:
             tags.append(g)
         return tags
@@ -407,9 +591,9 @@ class WxClient(Lockable):
         :param new_name: 标签的新名称
         :return: 标签对象
         """
-        url = "https://api.weixin.qq.com/cgi-bin/tags/update?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/tags/update?access_token={0}".format(self.token)
         data = '{"tag":{"id":%d,"name":"%s"}}' % (tag_id, new_name)
-        self.requestor.post(url, data=data)
+        self._post(url, data=data)
 
     def remove_tag(self, tag_id):
         """
@@ -417,9 +601,9 @@ class WxClient(Lockable):
         请注意，当某个标签下的粉丝超过10w时，后台不可直接删除标签
         :param tag_id: 标签标识
         """
-        url = "https://api.weixin.qq.com/cgi-bin/tags/delete?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/tags/delete?access_token={0}".format(self.token)
         data = '{"tag":{"id":%d}}' % tag_id
-        self.requestor.post(url, data=data)
+        self._post(url, data=data)
 
     def get_users_in_tag(self, tag_id, next_openid=""):
         """
@@ -428,9 +612,9 @@ class WxClient(Lockable):
         :param next_openid:
         :return: TagUsers对象
         """
-        url = "https://api.weixin.qq.com/cgi-bin/user/tag/get?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/user/tag/get?access_token={0}".format(self.token)
         data = '{"tag":%d, "next_openid":"%s"}' % (tag_id, next_openid)
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return r["count"]
 
     def tag_users(self, tag_id, openids):
@@ -441,9 +625,9 @@ class WxClient(Lockable):
         :param openids:
         :return:
         """
-        url = "https://api.weixin.qq.com/cgi-bin/user/tag/get?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/user/tag/get?access_token={0}".format(self.token)
         data = '{"tagid":%d, "openid_list":%s}' % (tag_id, json.dumps(openids))
-        r = self.requestor.post(url, data=data)
+        r = self._post(url, data=data)
         return r["count"]
 
     def cancel_tag_users(self, tag_id, openids):
@@ -453,9 +637,9 @@ class WxClient(Lockable):
         :param tag_id: 标签标识
         :param openids: 要取消的用户的openids
         """
-        url = "https://api.weixin.qq.com/cgi-bin/tags/members/batchuntagging?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/tags/members/batchuntagging?access_token={0}".format(self.token)
         data = '{"tagid":%d,"openid_list":%s}' % (tag_id, json.dumps(openids))
-        r = self.requestor.post(url, data)
+        r = self._post(url, data)
         return r
 
     def get_tags_in_user(self, openid):
@@ -466,6 +650,29 @@ class WxClient(Lockable):
         """
         pass
 
+    # ---------------------------------------------------------------------------
+    # ~ 客服消息
+    # ~ 参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1421140547
+
+    def send_custom_message(self, message):
+        """
+        发送客服消息，在用户发送消息后的48小时内可以不限次数地发送
+        :param message: 客服消息字典，包括touser、msgtype及对应消息类型的内容
+        :return: 微信API返回结果
+        """
+        url = self.api_base + "/cgi-bin/message/custom/send?access_token={0}".format(self.token)
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        r = self._post(url, data=data)
+        return r
+
+    def send_custom_text(self, openid, content):
+        """
+        发送文本客服消息
+        :param openid: 普通用户的标识
+        :param content: 文本消息内容
+        """
+        return self.send_custom_message({"touser": openid, "msgtype": "text", "text": {"content": content}})
+
     # ---------------------------------------------------------------------------
     # ~ 群发消息
     # https: // mp.weixin.qq.com / wiki?t = resource / res_main & id = mp1481187827_i0l21
@@ -491,9 +698,9 @@ class WxClient(Lockable):
         :param msg_id: 要查询的消息标识
         :return: MessageStatus 消息状态
         """
-        url = "https://api.weixin.qq.com/cgi-bin/message/mass/get?access_token={0}".format(self.token)
+        url = self.api_base + "/cgi-bin/message/mass/get?access_token={0}".format(self.token)
         data = '{"msg_id":"%s"}' % msg_id
-        r = self.requestor.post(url, data)
+        r = self._post(url, data)
         return MessageStatus(r["msg_status"])
 
     # ---------------------------------------------------------------------------
@@ -504,6 +711,6 @@ class WxClient(Lockable):
         获取微信服务器IP地址。
         :return: 微信服务器IP地址列表
         """
-        url = "https://api.weixin.qq.com/cgi-bin/getcallbackip?access_token={0}".format(self.token)
-        r = self.requestor.get(url)
+        url = self.api_base + "/cgi-bin/getcallbackip?access_token={0}".format(self.token)
+        r = self._get(url)
         return r
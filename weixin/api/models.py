@@ -68,6 +68,12 @@ class AccessToken(Jsonable):
         """
         return self.expires < (time.time() - self.create_time + 60)
 
+    def remaining(self):
+        """
+        :return: 凭证的剩余有效时间，单位为秒
+        """
+        return self.create_time + self.expires - time.time()
+
 
 # ---------------------------------------------------------------------------
 #   订阅者及用户组
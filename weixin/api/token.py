@@ -0,0 +1,686 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：在多个工作进程或多台服务器之间共享公众号的访问令牌
+# 创建日期：2026/10/18
+# 说明：微信每次获取access_token都会使之前的令牌在5分钟后失效，且每天获取次数有限。
+#      多个进程各自获取令牌时会互相使对方的令牌失效，因此令牌保存在共享的存储中，
+#      同一公众号同一时刻只有取得刷新锁的进程调用grant_token，其余进程继续使用原令牌或等待新令牌发布
+# -------------------------------------------------------------------------
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+import weakref
+
+from weixin.api.models import AccessToken
+from weixin.exceptions import TokenUnavailable
+from weixin.logger import log
+from weixin.metrics import Histogram
+from weixin.utils import Lockable
+
+
+def _alive(token):
+    """
+    令牌是否仍然可用。is_expired提前60秒判断过期，在此期间令牌仍可以调用API
+    """
+    return token is not None and token.remaining() > 0
+
+
+def _usable(token, min_ttl=60, invalid=None):
+    return token is not None and token.remaining() > min_ttl and token.token != invalid
+
+
+def _dump_token(token):
+    return json.dumps({"token": token.token, "expires": token.expires, "create_time": token.create_time})
+
+
+def _load_token(text):
+    data = json.loads(text)
+    return AccessToken(data["token"], data["expires"], data["create_time"])
+
+
+# ---------------------------------------------------------------------------
+#   TokenStore
+# ---------------------------------------------------------------------------
+
+class TokenStore(object):
+    """
+    访问令牌存储的基类。子类实现令牌的读写和按公众号加锁，刷新流程由fetch统一处理
+    """
+
+    # 读写存储是否会阻塞，为True时async_fetch在线程池中调用load、acquire、save和release，不阻塞事件循环
+    blocking = True
+
+    def __init__(self, wait_timeout=10.0, poll_interval=0.05, lock_ttl=30):
+        """
+        :param wait_timeout: 其它进程正在刷新令牌且本进程没有可用令牌时，最长等待时间，单位为秒
+        :param poll_interval: 等待新令牌发布时查询存储的时间间隔，单位为秒
+        :param lock_ttl: 刷新锁的有效时间，单位为秒，持有锁的进程异常退出后锁自动失效
+        """
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.lock_ttl = lock_ttl
+
+    def load(self, appid):
+        """
+        :return: 存储中的AccessToken对象；不存在时返回None
+        """
+        raise NotImplementedError("TokenStore的子类没有实现load方法")
+
+    def save(self, appid, token):
+        raise NotImplementedError("TokenStore的子类没有实现save方法")
+
+    def acquire(self, appid):
+        """
+        尝试获取公众号的刷新锁，不等待
+        :return: 获取成功时返回True
+        """
+        raise NotImplementedError("TokenStore的子类没有实现acquire方法")
+
+    def release(self, appid):
+        raise NotImplementedError("TokenStore的子类没有实现release方法")
+
+    def close(self):
+        pass
+
+    def fetch(self, appid, grant, current=None, min_ttl=60, invalid=None):
+        """
+        获取有效的访问令牌。存储中的令牌有效时直接使用；
+        否则由取得刷新锁的调用方调用grant获取新令牌并发布到存储，其余调用方等待新令牌
+        :param appid: 公众号开发者ID
+        :param grant: 获取新令牌的函数，返回AccessToken对象
+        :param current: 调用方当前持有的令牌，其它进程刷新期间如果仍可用则继续使用
+        :param min_ttl: 剩余有效时间不足min_ttl秒的令牌需要刷新
+        :param invalid: 微信已返回无效的令牌字符串，存储中的令牌与之相同时需要刷新
+        :return: AccessToken对象
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            token = self.load(appid)
+            if _usable(token, min_ttl, invalid):
+                return token
+            if self.acquire(appid):
+                try:
+                    # 取得锁之前其它进程可能已经发布了新令牌
+                    token = self.load(appid)
+                    if _usable(token, min_ttl, invalid):
+                        return token
+                    start = time.perf_counter()
+                    token = grant()
+                    self.save(appid, token)
+                    log.info("公众号%s的访问令牌已刷新，耗时%.1fms", appid, (time.perf_counter() - start) * 1000)
+                    return token
+                finally:
+                    self.release(appid)
+            fallback = self._fallback(current, token, invalid)
+            if fallback is not None:
+                return fallback
+            if time.monotonic() >= deadline:
+                raise TokenUnavailable("等待公众号%s的访问令牌超时" % appid)
+            time.sleep(self.poll_interval)
+
+    async def async_fetch(self, appid, grant, current=None, min_ttl=60, invalid=None):
+        """
+        fetch的协程版本，grant为返回AccessToken对象的协程函数
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            token = await self._run(self.load, appid)
+            if _usable(token, min_ttl, invalid):
+                return token
+            if await self._async_acquire(appid):
+                try:
+                    token = await self._run(self.load, appid)
+                    if _usable(token, min_ttl, invalid):
+                        return token
+                    start = time.perf_counter()
+                    token = await grant()
+                    await self._run(self.save, appid, token)
+                    log.info("公众号%s的访问令牌已刷新，耗时%.1fms", appid, (time.perf_counter() - start) * 1000)
+                    return token
+                finally:
+                    await self._run(self.release, appid)
+            fallback = self._fallback(current, token, invalid)
+            if fallback is not None:
+                return fallback
+            if time.monotonic() >= deadline:
+                raise TokenUnavailable("等待公众号%s的访问令牌超时" % appid)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run(self, func, *args):
+        if not self.blocking:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _async_acquire(self, appid):
+        """
+        在线程池中获取刷新锁，协程在获取期间被取消时，获取成功的锁随即释放
+        """
+        if not self.blocking:
+            return self.acquire(appid)
+        future = asyncio.get_running_loop().run_in_executor(None, self.acquire, appid)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: self._release_acquired(f, appid))
+            raise
+
+    def _release_acquired(self, future, appid):
+        if not future.cancelled() and future.exception() is None and future.result():
+            self.release(appid)
+
+    @staticmethod
+    def _fallback(current, stored, invalid=None):
+        """
+        其它进程正在刷新时，使用尚未真正过期且未被微信判定无效的原令牌
+        """
+        for token in (stored, current):
+            if _alive(token) and token.token != invalid:
+                return token
+        return None
+
+
+class MemoryTokenStore(TokenStore, Lockable):
+    """
+    进程内的令牌存储，适用于单进程部署
+    """
+
+    blocking = False
+
+    def __init__(self, **kwargs):
+        TokenStore.__init__(self, **kwargs)
+        Lockable.__init__(self)
+        self._tokens = {}
+        self._locks = set()
+
+    def load(self, appid):
+        return self._tokens.get(appid)
+
+    def save(self, appid, token):
+        self._tokens[appid] = token
+
+    def acquire(self, appid):
+        self.acquire_lock()
+        try:
+            if appid in self._locks:
+                return False
+            self._locks.add(appid)
+            return True
+        finally:
+            self.release_lock()
+
+    def release(self, appid):
+        self.acquire_lock()
+        try:
+            self._locks.discard(appid)
+        finally:
+            self.release_lock()
+
+
+class FileTokenStore(TokenStore):
+    """
+    基于文件的令牌存储，适用于同一台服务器上的多个工作进程。
+    每个公众号的令牌保存为目录下的<appid>.json，刷新锁为<appid>.lock上的flock，进程退出时自动释放
+    """
+
+    def __init__(self, directory, **kwargs):
+        """
+        :param directory: 保存令牌文件的目录
+        """
+        TokenStore.__init__(self, **kwargs)
+        try:
+            import fcntl
+        except ImportError:
+            raise RuntimeError("FileTokenStore需要支持fcntl的操作系统")
+        self._fcntl = fcntl
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock_files = {}
+        self._mutex = threading.Lock()
+
+    def _path(self, appid, suffix):
+        return os.path.join(self.directory, appid + suffix)
+
+    def load(self, appid):
+        try:
+            with open(self._path(appid, ".json"), encoding="utf-8") as f:
+                return _load_token(f.read())
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def save(self, appid, token):
+        # 先写入临时文件再替换，读取方不会读到写了一半的文件
+        path = self._path(appid, ".json")
+        tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(_dump_token(token))
+        os.replace(tmp, path)
+
+    def acquire(self, appid):
+        with self._mutex:
+            if appid in self._lock_files:
+                return False
+            f = open(self._path(appid, ".lock"), "a")
+            try:
+                self._fcntl.flock(f, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._lock_files[appid] = f
+            return True
+
+    def release(self, appid):
+        with self._mutex:
+            f = self._lock_files.pop(appid, None)
+        if f is not None:
+            self._fcntl.flock(f, self._fcntl.LOCK_UN)
+            f.close()
+
+
+class SQLiteTokenStore(TokenStore, Lockable):
+    """
+    基于SQLite的令牌存储，适用于同一台服务器上的多个工作进程。
+    刷新锁为带有效期的租约，持有锁的进程异常退出后租约到期自动失效
+    """
+
+    def __init__(self, path, **kwargs):
+        """
+        :param path: 数据库文件路径，可以与SQLiteSessionStore使用同一个文件
+        """
+        TokenStore.__init__(self, **kwargs)
+        Lockable.__init__(self)
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        # 首次使用时才连接数据库
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS wx_token ("
+                         "appid TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS wx_token_lock ("
+                         "appid TEXT PRIMARY KEY, owner TEXT NOT NULL, expire_at REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def load(self, appid):
+        self.acquire_lock()
+        try:
+            row = self.conn.execute("SELECT data FROM wx_token WHERE appid=?", (appid,)).fetchone()
+        finally:
+            self.release_lock()
+        return _load_token(row[0]) if row else None
+
+    def save(self, appid, token):
+        self.acquire_lock()
+        try:
+            self.conn.execute("INSERT OR REPLACE INTO wx_token (appid, data) VALUES (?, ?)",
+                              (appid, _dump_token(token)))
+        finally:
+            self.release_lock()
+
+    def acquire(self, appid):
+        now = time.time()
+        self.acquire_lock()
+        try:
+            conn = self.conn
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM wx_token_lock WHERE appid=? AND expire_at<=?", (appid, now))
+                cursor = conn.execute("INSERT OR IGNORE INTO wx_token_lock (appid, owner, expire_at) "
+                                      "VALUES (?, ?, ?)", (appid, self.owner, now + self.lock_ttl))
+                return cursor.rowcount == 1
+        finally:
+            self.release_lock()
+
+    def release(self, appid):
+        self.acquire_lock()
+        try:
+            self.conn.execute("DELETE FROM wx_token_lock WHERE appid=? AND owner=?", (appid, self.owner))
+        finally:
+            self.release_lock()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# ---------------------------------------------------------------------------
+#   Redis
+# ---------------------------------------------------------------------------
+
+class RespError(Exception):
+    """
+    Redis服务器返回的错误
+    """
+    pass
+
+
+class RespConnection(object):
+    """
+    使用RESP协议的最小Redis客户端，只支持令牌存储用到的命令，不依赖redis包。
+    任何兼容RESP协议的服务器都可以作为后端
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, password=None, db=0, timeout=5):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = self._reader = None
+
+    def execute(self, *args):
+        """
+        执行命令，连接断开时重新连接一次
+        :return: 命令的返回值，字符串以bytes返回
+        """
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, EOFError):
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    def _call(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise EOFError("Redis连接已关闭")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise RespError(body.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = self._reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(body)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise RespError("无法解析的Redis响应:%r" % line)
+
+
+class RedisTokenStore(TokenStore):
+    """
+    基于Redis的令牌存储，适用于多台服务器部署。
+    令牌的有效期与微信返回的有效期相同，刷新锁为带有效期的SET NX
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, password=None, db=0, prefix="weixin:token:",
+                 connection=None, **kwargs):
+        """
+        :param prefix: 键名前缀
+        :param connection: RespConnection对象，为None时根据host和port创建，首次使用时才连接
+        """
+        TokenStore.__init__(self, **kwargs)
+        self.prefix = prefix
+        self.owner = uuid.uuid4().hex
+        self.connection = connection or RespConnection(host, port, password, db)
+
+    def load(self, appid):
+        data = self.connection.execute("GET", self.prefix + appid)
+        if data is None:
+            return None
+        try:
+            return _load_token(data.decode("utf-8"))
+        except (ValueError, KeyError):
+            return None
+
+    def save(self, appid, token):
+        ttl = int(token.remaining() * 1000)
+        if ttl > 0:
+            self.connection.execute("SET", self.prefix + appid, _dump_token(token), "PX", ttl)
+
+    def acquire(self, appid):
+        r = self.connection.execute("SET", self.prefix + appid + ":lock", self.owner, "NX",
+                                    "PX", int(self.lock_ttl * 1000))
+        return r is not None
+
+    def release(self, appid):
+        # 只删除自己持有的锁；锁在GET和DEL之间到期并被其它进程取得的情况需要刷新耗时超过lock_ttl，可以忽略
+        key = self.prefix + appid + ":lock"
+        if self.connection.execute("GET", key) == self.owner.encode("ascii"):
+            self.connection.execute("DEL", key)
+
+    def close(self):
+        self.connection.close()
+
+
+# ---------------------------------------------------------------------------
+#   TokenRefresher
+# ---------------------------------------------------------------------------
+
+class TokenRefresher(Lockable):
+    """
+    在后台线程中提前刷新访问令牌，调用API时令牌总是有效的，不需要等待grant_token。
+    刷新时间为过期前lead秒再随机提前0到jitter秒，多个工作进程的刷新时间错开，
+    先到期的进程刷新并发布到令牌存储，其余进程直接使用存储中的新令牌。
+    只保存WxClient的弱引用，公众号被淘汰后不再刷新
+    """
+
+    def __init__(self, lead=300, jitter=60, retry_interval=10):
+        """
+        :param lead: 在令牌过期前多少秒刷新，单位为秒。微信获取新令牌后原令牌在5分钟内仍然有效
+        :param jitter: 随机提前的最大时间，单位为秒
+        :param retry_interval: 刷新失败后的重试间隔，单位为秒
+        """
+        Lockable.__init__(self)
+        self.lead = lead
+        self.jitter = jitter
+        self.retry_interval = retry_interval
+        # (刷新时间, 序号, 弱引用)
+        self._heap = []
+        self._seq = itertools.count()
+        self._clients = weakref.WeakSet()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        # 刷新耗时和次数统计
+        self.latency = Histogram()
+        self.refreshes = 0
+        self.failures = 0
+        # 开发者ID -> 统计信息
+        self._stats = {}
+
+    def register(self, client):
+        """
+        加入需要后台刷新令牌的WxClient，尚未获取令牌时立即获取
+        :param client: WxClient对象
+        """
+        self.acquire_lock()
+        try:
+            if client in self._clients:
+                return
+            self._clients.add(client)
+            self._schedule(client, self._due(client.access_token))
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="weixin-token-refresher", daemon=True)
+                self._thread.start()
+        finally:
+            self.release_lock()
+        self._wakeup.set()
+
+    def unregister(self, client):
+        self.acquire_lock()
+        try:
+            self._clients.discard(client)
+        finally:
+            self.release_lock()
+
+    def stop(self):
+        """
+        停止后台线程，已加入的WxClient在下次register时重新调度
+        """
+        self.acquire_lock()
+        try:
+            thread, self._thread = self._thread, None
+            self._stopped = True
+            self._heap = []
+            self._clients = weakref.WeakSet()
+        finally:
+            self.release_lock()
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+
+    def _due(self, token):
+        if token is None:
+            return time.time()
+        return token.create_time + token.expires - self.lead - random.uniform(0, self.jitter)
+
+    def _schedule(self, client, due):
+        heapq.heappush(self._heap, (due, next(self._seq), weakref.ref(client)))
+
+    def _run(self):
+        while True:
+            self.acquire_lock()
+            try:
+                if self._stopped:
+                    return
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._wakeup.clear()
+            finally:
+                self.release_lock()
+            for ref in due:
+                client = ref()
+                if client is not None and client in self._clients:
+                    self.refresh(client)
+            if not due:
+                self._wakeup.wait(timeout)
+
+    def refresh(self, client):
+        """
+        刷新一个WxClient的令牌，并安排下次刷新
+        """
+        stats = self._stats.setdefault(client.appid, {"refreshes": 0, "failures": 0, "last_error": None})
+        start = time.perf_counter()
+        try:
+            token = client.refresh_token(self.lead + self.jitter)
+        except Exception as e:
+            self.failures += 1
+            stats["failures"] += 1
+            stats["last_error"] = str(e)
+            log.error("公众号%s的访问令牌刷新失败，%s秒后重试，原因为:%s", client.appid, self.retry_interval, e)
+            due = time.time() + self.retry_interval
+        else:
+            self.latency.record(time.perf_counter() - start)
+            self.refreshes += 1
+            stats["refreshes"] += 1
+            stats["expires_at"] = token.create_time + token.expires
+            # 其它进程正在刷新时得到的是原令牌，稍后再检查存储
+            due = max(self._due(token), time.time() + self.retry_interval)
+        self.acquire_lock()
+        try:
+            if not self._stopped and client in self._clients:
+                self._schedule(client, due)
+        finally:
+            self.release_lock()
+
+    def snapshot(self):
+        """
+        :return: 刷新次数、失败次数、刷新耗时统计及各公众号的刷新情况
+        """
+        now = time.time()
+        accounts = {}
+        for appid, stats in list(self._stats.items()):
+            item = dict(stats)
+            expires_at = item.pop("expires_at", None)
+            item["expires_in"] = expires_at - now if expires_at else None
+            accounts[appid] = item
+        return {"refreshes": self.refreshes, "failures": self.failures, "latency": self.latency.snapshot(),
+                "accounts": accounts}
+
+
+_default_refresher = None
+_default_refresher_lock = threading.Lock()
+
+
+def default_token_refresher():
+    """
+    获取进程内共享的令牌刷新器，所有公众号共用一个后台线程
+    """
+    global _default_refresher
+    if _default_refresher is None:
+        with _default_refresher_lock:
+            if _default_refresher is None:
+                _default_refresher = TokenRefresher()
+    return _default_refresher
+
+
+def create_token_store(config):
+    """
+    根据配置参数创建令牌存储
+    :param config: 配置参数，为None时使用进程内存储；
+                   为字典时由backend指定存储类型(memory、file、sqlite或redis)，其它参数传给存储对象
+    :return: TokenStore对象
+    """
+    if config is None:
+        return MemoryTokenStore()
+    config = dict(config)
+    backend = config.pop("backend", "memory")
+    if backend == "memory":
+        return MemoryTokenStore(**config)
+    if backend == "file":
+        return FileTokenStore(**config)
+    if backend == "sqlite":
+        return SQLiteTokenStore(**config)
+    if backend == "redis":
+        return RedisTokenStore(**config)
+    raise ValueError("不支持的令牌存储类型:%s" % backend)
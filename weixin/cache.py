@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：消息处理过程中使用的缓存
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+try:
+    import threading
+except ImportError:  # pragma: no cover
+    threading = None
+
+from weixin.render import ReplyTemplate
+from weixin.utils import Lockable
+
+
+# ---------------------------------------------------------------------------
+#   LRUCache
+# ---------------------------------------------------------------------------
+
+class LRUCache(Lockable):
+    """
+    带过期时间的LRU缓存，缓存项数量超过上限时淘汰最久未使用的缓存项
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        :param max_size: 最大缓存项数量
+        :param ttl: 缓存项的有效时间，单位为秒；为None时缓存项不过期
+        """
+        Lockable.__init__(self)
+        self.max_size = max_size
+        self.ttl = ttl
+        # 缓存数据，值为(过期时间, 缓存值)
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        获取缓存值，并将缓存项标记为最近使用
+        :param key: 缓存键
+        :param default: 缓存不存在或已过期时的返回值
+        :return: 缓存值
+        """
+        self.acquire_lock()
+        try:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] is None or item[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self._data[key]
+            self.misses += 1
+            return default
+        finally:
+            self.release_lock()
+
+    def set(self, key, value, ttl=None):
+        """
+        设置缓存值
+        :param key: 缓存键
+        :param value: 缓存值
+        :param ttl: 缓存项的有效时间，为None时使用缓存的默认有效时间
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        expire_at = time.monotonic() + ttl if ttl is not None else None
+        self.acquire_lock()
+        try:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        finally:
+            self.release_lock()
+
+    def pop(self, key, default=None):
+        """
+        移除缓存项
+        :return: 被移除的缓存值
+        """
+        self.acquire_lock()
+        try:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+        finally:
+            self.release_lock()
+
+    def clear(self):
+        self.acquire_lock()
+        try:
+            self._data.clear()
+        finally:
+            self.release_lock()
+
+    def keys(self):
+        """
+        :return: 缓存键列表的副本，包括已过期但尚未移除的缓存项
+        """
+        self.acquire_lock()
+        try:
+            return list(self._data.keys())
+        finally:
+            self.release_lock()
+
+    def stats(self):
+        """
+        获取缓存的统计信息
+        :return: 包含缓存项数量、命中次数、未命中次数和淘汰次数的字典
+        """
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        item = self._data.get(key)
+        return item is not None and (item[0] is None or item[0] > time.monotonic())
+
+
+# ---------------------------------------------------------------------------
+#   MessageDeduplicator
+# ---------------------------------------------------------------------------
+
+class _PendingReply(object):
+    """
+    正在处理、已处理完成或处理失败的消息回复
+    """
+    __slots__ = ("event", "result", "size", "expire_at", "failed")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.size = 0
+        self.expire_at = None
+        self.failed = False
+
+
+class MessageDeduplicator(Lockable):
+    """
+    微信服务器在5秒内收不到响应时，会以相同的消息重新发起请求，最多重试三次。
+    本对象按消息标识缓存消息的回复，对于重试的消息直接返回缓存的回复，
+    或者等待正在处理的同一消息的回复，避免重复执行消息处理器。
+    """
+
+    def __init__(self, ttl=30, max_size=10000, max_bytes=4 * 1024 * 1024, wait_timeout=4.5):
+        """
+        :param ttl: 回复的缓存时间，单位为秒，应覆盖微信服务器的重试周期
+        :param max_size: 最多缓存的消息数量
+        :param max_bytes: 缓存回复文本的总长度上限
+        :param wait_timeout: 等待正在处理的消息的最长时间，单位为秒
+        """
+        Lockable.__init__(self)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def message_key(dic):
+        """
+        获取消息的去重标识。普通消息使用MsgId，事件消息使用FromUserName和CreateTime
+        :param dic: 消息数据字典
+        :return: 消息的去重标识；无法识别时返回None
+        """
+        msg_id = dic.get("MsgId")
+        if msg_id:
+            return msg_id
+        from_user = dic.get("FromUserName")
+        create_time = dic.get("CreateTime")
+        if from_user and create_time:
+            return "%s#%s" % (from_user, create_time)
+        return None
+
+    def begin(self, key):
+        """
+        登记开始处理的消息
+        :param key: 消息的去重标识
+        :return: (entry, owner)，owner为True表示调用方需要处理该消息，并在处理完成后调用complete或fail
+        """
+        now = time.monotonic()
+        self.acquire_lock()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not entry.failed and (entry.expire_at is None or entry.expire_at > now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, False
+                self._discard(key, entry)
+            self.misses += 1
+            entry = _PendingReply()
+            self._entries[key] = entry
+            self._evict()
+            return entry, True
+        finally:
+            self.release_lock()
+
+    def complete(self, key, entry, result):
+        """
+        保存消息的回复，并唤醒等待该消息的请求
+        :param key: 消息的去重标识
+        :param entry: begin返回的登记项
+        :param result: 消息的回复
+        """
+        self.acquire_lock()
+        try:
+            entry.result = result
+            entry.expire_at = time.monotonic() + self.ttl
+            if self._entries.get(key) is entry:
+                entry.size = len(result) if result else 0
+                self._bytes += entry.size
+                self._evict()
+        finally:
+            self.release_lock()
+        entry.event.set()
+
+    def fail(self, key, entry):
+        """
+        消息处理失败时将登记项标记为失败，微信服务器的重试请求将重新处理该消息。
+        失败的登记项保留ttl秒，期间peek仍能找到，重试请求不会被当作重放拒绝
+        """
+        self.acquire_lock()
+        try:
+            entry.failed = True
+            if self._entries.get(key) is entry:
+                entry.expire_at = time.monotonic() + self.ttl
+        finally:
+            self.release_lock()
+        entry.event.set()
+
+    def wait(self, entry):
+        """
+        等待正在处理的消息的回复
+        :param entry: begin返回的登记项
+        :return: 消息的回复；超时或处理失败时返回空字符串
+        """
+        if not entry.event.is_set():
+            self.waits += 1
+            entry.event.wait(self.wait_timeout)
+        return entry.result or ""
+
+    def peek(self, key):
+        """
+        查找已登记的消息，不登记新的消息
+        :param key: 消息的去重标识
+        :return: 正在处理、已处理完成或处理失败的登记项；消息未登记或已过期时返回None
+        """
+        self.acquire_lock()
+        try:
+            entry = self._entries.get(key)
+            if entry is None or (entry.expire_at is not None and entry.expire_at <= time.monotonic()):
+                return None
+            self.hits += 1
+            return entry
+        finally:
+            self.release_lock()
+
+    def stats(self):
+        """
+        获取去重缓存的统计信息
+        """
+        return {"size": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+                "waits": self.waits, "evictions": self.evictions}
+
+    def _discard(self, key, entry):
+        del self._entries[key]
+        self._bytes -= entry.size
+
+    def _evict(self):
+        # 超过数量或者回复总长度上限时，淘汰最久未使用的登记项
+        while self._entries and (len(self._entries) > self.max_size or self._bytes > self.max_bytes):
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+# ---------------------------------------------------------------------------
+#   ReplyCache
+# ---------------------------------------------------------------------------
+
+class ReplyCache(object):
+    """
+    按路由缓存与用户无关的回复，如菜单点击和固定关键字的回复。
+    只缓存cacheable为True的处理器的回复，处理器的reply_version变化后缓存的回复自动失效
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        :param max_size: 最多缓存的回复数量
+        :param ttl: 回复的缓存时间，单位为秒；为None时只在失效或被淘汰时移除
+        """
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def route_key(dic):
+        """
+        获取消息的回复路由。文本消息按消息内容，菜单点击事件按事件Key值
+        :param dic: 消息数据字典
+        :return: (路由类型, 路由值)；不支持缓存的消息返回None
+        """
+        msg_type = dic.get("MsgType")
+        if msg_type == "text":
+            content = dic.get("Content")
+            return ("text", content) if content else None
+        if msg_type == "event" and (dic.get("Event") or "").lower() == "click":
+            event_key = dic.get("EventKey")
+            return ("click", event_key) if event_key else None
+        return None
+
+    def get(self, key, openid):
+        """
+        获取缓存的回复
+        :param key: 回复路由
+        :param openid: 接收方帐号
+        :return: 回复给该用户的消息；没有缓存或缓存已失效时返回None
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        handler, version, template = entry
+        if getattr(handler, "reply_version", 0) != version:
+            self._cache.pop(key)
+            return None
+        return template.render(openid)
+
+    def put(self, key, handler, reply, openid):
+        """
+        缓存处理器的回复
+        :param key: 回复路由
+        :param handler: 生成回复的处理器
+        :param reply: 回复消息
+        :param openid: 回复消息的接收方帐号
+        :return: 是否已缓存
+        """
+        if not getattr(handler, "cacheable", False):
+            return False
+        template = ReplyTemplate.compile(reply, openid)
+        if template is None:
+            return False
+        self._cache.set(key, (handler, getattr(handler, "reply_version", 0), template))
+        return True
+
+    def invalidate(self, msg_type=None, key=None):
+        """
+        移除缓存的回复
+        :param msg_type: 路由类型，text或click；为None时移除所有回复
+        :param key: 路由值，即消息内容或事件Key值；为None时移除该类型的所有回复
+        """
+        if msg_type is None:
+            self._cache.clear()
+        elif key is not None:
+            self._cache.pop((msg_type, key))
+        else:
+            for k in self._cache.keys():
+                if k[0] == msg_type:
+                    self._cache.pop(k)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# ---------------------------------------------------------------------------
+#   RotatingBloomFilter
+# ---------------------------------------------------------------------------
+
+class RotatingBloomFilter(Lockable):
+    """
+    按时间轮换的布隆过滤器，用于识别重放的请求。
+    过滤器分为当前和上一代，每隔rotate_interval秒或者当前代的元素数量达到capacity时，
+    丢弃上一代并新建当前代，因此内存占用固定，元素至少保留rotate_interval秒或capacity个元素。
+    布隆过滤器可能误判元素已存在，但不会漏判
+    """
+
+    def __init__(self, capacity=50000, error_rate=0.001, rotate_interval=600):
+        """
+        :param capacity: 每一代过滤器的元素数量上限
+        :param error_rate: 每一代过滤器的误判率
+        :param rotate_interval: 轮换的时间间隔，单位为秒
+        """
+        Lockable.__init__(self)
+        self.capacity = capacity
+        self.rotate_interval = rotate_interval
+        self.bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        # 首次添加元素时才分配位数组，未收到请求的公众号不占用内存
+        self._current = None
+        self._previous = None
+        self._count = 0
+        self._rotated_at = time.monotonic()
+
+    def _positions(self, item):
+        # 使用两个哈希值的线性组合模拟多个哈希函数
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    @staticmethod
+    def _test(bits, positions):
+        for pos in positions:
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, item):
+        """
+        添加元素
+        :param item: 字符串
+        :return: 如果元素可能已经存在，返回True；否则添加元素并返回False
+        """
+        positions = self._positions(item)
+        self.acquire_lock()
+        try:
+            if self._current is None:
+                self._current = bytearray((self.bits + 7) // 8)
+                self._previous = bytearray(len(self._current))
+            elif self._count >= self.capacity or time.monotonic() - self._rotated_at >= self.rotate_interval:
+                self._rotate()
+            current = self._current
+            if self._test(current, positions) or self._test(self._previous, positions):
+                return True
+            for pos in positions:
+                current[pos >> 3] |= 1 << (pos & 7)
+            self._count += 1
+            return False
+        finally:
+            self.release_lock()
+
+    def __contains__(self, item):
+        if self._current is None:
+            return False
+        positions = self._positions(item)
+        return self._test(self._current, positions) or self._test(self._previous, positions)
+
+    def _rotate(self):
+        self._previous = self._current
+        self._current = bytearray(len(self._previous))
+        self._count = 0
+        self._rotated_at = time.monotonic()
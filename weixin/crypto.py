@@ -6,18 +6,28 @@
 
 # -------------------------------------------------------------------------
 import base64
+import hmac
+import os
+import struct
 import time
 import string
 import hashlib
 from weixin.utils import rand_str
 
-try:
-    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-    from cryptography.hazmat.backends import default_backend
-except ImportError:
-    raise RuntimeError("需要安装cryptography包")
+from .exceptions import UnValidEncodingAESKey, AppIdValidationError, InvalidSignature, DecryptError
 
-from .exceptions import UnValidEncodingAESKey, AppIdValidationError, InvalidSignature
+
+def _load_cipher():
+    """
+    创建加解密器时才导入cryptography，只校验签名或输出回复的进程不需要加载
+    :return: (Cipher, algorithms, modes, default_backend)
+    """
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.backends import default_backend
+    except ImportError:
+        raise RuntimeError("需要安装cryptography包")
+    return Cipher, algorithms, modes, default_backend
 
 
 class AesCrypto(object):
@@ -31,36 +41,75 @@ class AesCrypto(object):
 class PrpCrypt(object):
     """提供接收和推送给公众平台消息的加解密接口"""
 
+    # 微信使用32字节的PKCS#7填充
+    BLOCK_SIZE = 32
+
     def __init__(self, key):
-        pass
+        """
+        :param key: 由EncodingAESKey解码得到的32字节密钥
+        """
+        self.key = key
+        # 初始向量为密钥的前16字节，与密钥一起只在创建时计算一次
+        self.iv = key[:16]
+        Cipher, algorithms, modes, default_backend = _load_cipher()
+        self._cipher = Cipher(algorithms.AES(key), modes.CBC(self.iv), backend=default_backend())
 
     def encrypt(self, text, appid):
         """
-
-        :param text:
-        :param appid:
-        :return:
+        加密消息，明文格式为：16字节随机字符串 + 4字节网络字节序的消息长度 + 消息 + 开发者ID + PKCS#7填充
+        :param text: 消息明文
+        :param appid: 公众号开发者ID
+        :return: Base64编码的密文
         """
-        pass
+        msg = text.encode("utf-8")
+        appid = appid.encode("utf-8")
+        length = 20 + len(msg) + len(appid)
+        pad = self.BLOCK_SIZE - length % self.BLOCK_SIZE
+        # 一次分配完整的缓冲区，避免多次拼接字节串
+        buf = bytearray(length + pad)
+        buf[0:16] = os.urandom(16)
+        struct.pack_into("!I", buf, 16, len(msg))
+        buf[20:20 + len(msg)] = msg
+        buf[20 + len(msg):length] = appid
+        buf[length:] = bytes((pad,)) * pad
+        encryptor = self._cipher.encryptor()
+        return base64.b64encode(encryptor.update(bytes(buf)) + encryptor.finalize()).decode("ascii")
 
     def decrypt(self, text, appid):
         """
-
-        :param text:
-        :param appid:
-        :return:
+        解密消息
+        :param text: Base64编码的密文
+        :param appid: 公众号开发者ID，为None时不校验
+        :return: 消息明文
         """
-        return ''
+        try:
+            data = base64.b64decode(text)
+            decryptor = self._cipher.decryptor()
+            plain = decryptor.update(data) + decryptor.finalize()
+        except (ValueError, TypeError) as e:
+            raise DecryptError(str(e))
+        pad = plain[-1] if plain else 0
+        if not 1 <= pad <= self.BLOCK_SIZE or len(plain) < 20 + pad:
+            raise DecryptError("消息填充错误")
+        content = memoryview(plain)[16:len(plain) - pad]
+        msg_len = struct.unpack_from("!I", content, 0)[0]
+        if msg_len > len(content) - 4:
+            raise DecryptError("消息长度错误")
+        try:
+            from_appid = bytes(content[4 + msg_len:]).decode("utf-8")
+            msg = bytes(content[4:4 + msg_len]).decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise DecryptError(str(e))
+        if appid is not None and from_appid != appid:
+            raise AppIdValidationError(from_appid)
+        return msg
 
 
 def _get_signature(token, timestamp, nonce, *args):
     sign = [token, timestamp, nonce] + list(args)
     sign.sort()
-    # 将参数拼接成字符串并且sha1算法加密
-    sha1 = hashlib.sha1()
-    map(sha1.update, sign)
-    # 加密后的字节转换为文本
-    return sha1.hexdigest()
+    # 将参数拼接成字符串并且sha1算法加密，加密后的字节转换为文本
+    return hashlib.sha1("".join(sign).encode("utf-8")).hexdigest()
 
 
 class MessageCryptor(object):
@@ -88,10 +137,12 @@ class MessageCryptor(object):
         :param nonce:
         :return:
         """
+        if not (timestamp and nonce and msg_signature):
+            raise InvalidSignature(msg_signature)
         signature = _get_signature(self.token, timestamp, nonce, content)
-        if signature != msg_signature:
+        if not hmac.compare_digest(signature.encode("ascii"), msg_signature.encode("utf-8", "surrogatepass")):
             raise InvalidSignature(msg_signature)
-        return self.pc.decrypt(content)
+        return self.pc.decrypt(content, self.appid)
 
     def encrypt_msg(self, content, nonce=None, timestamp=None):
         """
@@ -102,9 +153,9 @@ class MessageCryptor(object):
         :return:
         """
         encrypt = self.pc.encrypt(content, self.appid)
-        ts = timestamp or str(int(time.time()))
+        ts = str(timestamp or int(time.time()))
         nc = nonce or rand_str(10, string.digits)
-        signature = _get_signature(self.token, ts, nonce, encrypt)
+        signature = _get_signature(self.token, ts, nc, encrypt)
         return self.AES_TEXT_RESPONSE_TEMPLATE.format(
             encrypt=encrypt,
             signature=signature,
@@ -4,7 +4,7 @@
 # 创建日期：2018/1/3
 # -------------------------------------------------------------------------
 
-from weixin.messages import BaseMessage
+from weixin.messages import BaseMessage, Field
 
 EVENT_TYPES = {}
 SUBSCRIBE_QRSCENE = "qrscene_"
@@ -14,7 +14,7 @@ def register_event(event_type):
     def register(cls):
         if event_type in EVENT_TYPES.keys():
             raise ValueError("重复的事件类型:" + event_type)
-            EVENT_TYPES[event_type] = cls
+        EVENT_TYPES[event_type] = cls
         return cls
 
     return register
@@ -25,10 +25,8 @@ class EventMessage(BaseMessage):
     定义微信服务器推送的基本事件消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 事件类型
-        self.event = dic["Event"]
+    # 事件类型
+    event = Field("Event")
 
 
 class EventKeyMessage(EventMessage):
@@ -36,10 +34,8 @@ class EventKeyMessage(EventMessage):
     定义微信服务器推送的明细事件消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 事件Key值
-        self.eventKey = dic["EventKey"]
+    # 事件Key值
+    eventKey = Field("EventKey")
 
 
 class EventTicketMessage(EventKeyMessage):
@@ -47,10 +43,8 @@ class EventTicketMessage(EventKeyMessage):
     定义微信服务器推送的二维码事件信息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 事件Key值
-        self.ticket = dic["Ticket"]
+    # 二维码的ticket，可用来换取二维码图片
+    ticket = Field("Ticket")
 
 
 # ----------------------------------------------------------------------
@@ -89,9 +83,10 @@ class SubscribeScanEvent(EventTicketMessage):
     用户未关注时，通过扫描带场景值关注公众号时的事件推送
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        self.qrvalue = self.eventKey[len(SUBSCRIBE_QRSCENE):]
+    @property
+    def qrvalue(self):
+        # 二维码的场景值，在访问时才从事件Key值中截取
+        return self.eventKey[len(SUBSCRIBE_QRSCENE):]
 
 
 # ----------------------------------------------------------------------
@@ -103,14 +98,12 @@ class LocationEvent(EventMessage):
 
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 地理位置纬度
-        self.latitude = dic["Latitude"]
-        # 地理位置经度
-        self.longitude = dic["Longitude"]
-        # 地理位置精度
-        self.precision = dic["Precision"]
+    # 地理位置纬度
+    latitude = Field("Latitude")
+    # 地理位置经度
+    longitude = Field("Longitude")
+    # 地理位置精度
+    precision = Field("Precision")
 
 
 # ----------------------------------------------------------------------
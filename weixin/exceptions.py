@@ -25,6 +25,13 @@ class InvalidSignature(WxExcepion):
     pass
 
 
+class DecryptError(WxExcepion):
+    """
+    消息密文无法解密
+    """
+    pass
+
+
 class ApiException(WxExcepion):
     """"""
     pass
@@ -40,6 +47,18 @@ class AccountDisabled(WxExcepion):
     pass
 
 
+class TokenUnavailable(WxExcepion):
+    """
+    其它进程正在刷新访问令牌，等待超时仍没有可用的令牌
+    """
+    pass
+
+
+# 访问令牌无效或已过期的错误码，刷新令牌后可以重试
+# 40001: 令牌无效(可能已被其它调用方获取新令牌而失效)；40014: 不合法的令牌；42001: 令牌超时
+TOKEN_ERRCODES = (40001, 40014, 42001)
+
+
 def check_api_error(result):
     if result and isinstance(result, dict):
         if "errcode" in result.keys() and result["errcode"] != 0:
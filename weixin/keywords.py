@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：按关键字回复文本消息
+# 创建日期：2026/10/18
+# 说明：所有关键字编译为一个Aho-Corasick自动机，匹配耗时只与消息长度相关，不随关键字数量增长
+# -------------------------------------------------------------------------
+
+import threading
+from enum import Enum
+
+from weixin.logger import log
+from weixin.messages import TextInputMessage
+from weixin.render import render_text
+from weixin.wechat import Handler, CONCURRENCY
+
+
+class MATCH(Enum):
+    """
+    关键字的匹配方式
+    """
+    # 消息内容与关键字完全相同
+    EXACT = 30
+    # 消息内容以关键字开头
+    PREFIX = 20
+    # 消息内容包含关键字
+    CONTAINS = 10
+
+
+class KeywordRule(object):
+    """
+    关键字回复规则
+    """
+    __slots__ = ("keyword", "target", "match", "priority", "order")
+
+    def __init__(self, keyword, target, match=MATCH.CONTAINS, priority=0):
+        """
+        :param keyword: 关键字
+        :param target: 回复的文本，或者以消息处理中间对象为参数、返回回复信息的函数
+        :param match: 匹配方式
+        :param priority: 优先级，多条规则同时匹配时选择优先级最高的规则
+        """
+        if not keyword:
+            raise ValueError("关键字不能为空")
+        self.keyword = keyword
+        self.target = target
+        self.match = match
+        self.priority = priority
+        # 规则的添加顺序，由KeywordRouter设置
+        self.order = 0
+
+    def rank(self):
+        # 优先级相同时，依次比较匹配方式、关键字长度和添加顺序
+        return self.priority, self.match.value, len(self.keyword), -self.order
+
+    def __repr__(self):
+        return "KeywordRule(%r, %s, priority=%d)" % (self.keyword, self.match.name, self.priority)
+
+
+class _Automaton(object):
+    """
+    编译后的关键字匹配器，创建后不再修改，可以被多个线程同时使用
+    """
+
+    def __init__(self, rules, ignore_case):
+        self.ignore_case = ignore_case
+        # 完全匹配的规则直接按关键字索引
+        self.exact = {}
+        # 自动机的状态转移、失败跳转和各状态匹配的规则
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for rule in rules:
+            keyword = self.normalize(rule.keyword)
+            if rule.match is MATCH.EXACT:
+                best = self.exact.get(keyword)
+                if best is None or rule.rank() > best.rank():
+                    self.exact[keyword] = rule
+            else:
+                self._insert(keyword, rule)
+        self._link()
+
+    def normalize(self, text):
+        text = text.strip()
+        return text.lower() if self.ignore_case else text
+
+    def _insert(self, keyword, rule):
+        state = 0
+        for ch in keyword:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = nxt
+        self.output[state] = self.output[state] + ((len(keyword), rule),)
+
+    def _link(self):
+        # 按广度优先的顺序建立失败跳转，并合并失败状态上匹配的规则
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                if self.output[self.fail[nxt]]:
+                    self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def search(self, text):
+        """
+        查找与文本匹配的优先级最高的规则
+        :param text: 消息内容
+        :return: 匹配的规则；没有匹配时返回None
+        """
+        text = self.normalize(text)
+        best = self.exact.get(text)
+        best_rank = best.rank() if best is not None else None
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not output[state]:
+                continue
+            for length, rule in output[state]:
+                # 前缀匹配的关键字必须从消息开头开始
+                if rule.match is MATCH.PREFIX and i + 1 != length:
+                    continue
+                if best is None or rule.rank() > best_rank:
+                    best, best_rank = rule, rule.rank()
+        return best
+
+
+class KeywordRouter(Handler):
+    """
+    按关键字回复文本消息的处理器，支持完全匹配、前缀匹配和包含匹配，并按优先级选择回复规则。
+    修改规则时编译新的匹配器，编译完成后整体替换，正在处理的消息继续使用原有的匹配器，不会被阻塞
+    """
+    msg_types = ("text",)
+    concurrency = CONCURRENCY.THREAD_SAFE
+
+    def __init__(self, rules=None, ignore_case=True):
+        """
+        :param rules: 关键字回复规则列表
+        :param ignore_case: 匹配时是否忽略大小写
+        """
+        Handler.__init__(self)
+        self.ignore_case = ignore_case
+        self._rules = []
+        self._order = 0
+        self._automaton = _Automaton((), ignore_case)
+        self._build_lock = threading.Lock()
+        if rules:
+            self.add_rules(rules)
+
+    @property
+    def rules(self):
+        return list(self._rules)
+
+    def add_rule(self, keyword, target, match=MATCH.CONTAINS, priority=0):
+        """
+        添加关键字回复规则
+        :param keyword: 关键字
+        :param target: 回复的文本，或者以消息处理中间对象为参数、返回回复信息的函数
+        :param match: 匹配方式
+        :param priority: 优先级
+        """
+        self.add_rules([KeywordRule(keyword, target, match, priority)])
+
+    def add_rules(self, rules):
+        """
+        批量添加关键字回复规则，添加完成后只重新编译一次
+        :param rules: KeywordRule对象或者(keyword, target, match, priority)元组的列表
+        """
+        with self._build_lock:
+            self._install(self._rules + self._number(rules))
+
+    def remove_rule(self, keyword, match=None):
+        """
+        移除关键字回复规则
+        :param keyword: 关键字
+        :param match: 匹配方式，为None时移除该关键字的所有规则
+        """
+        with self._build_lock:
+            self._install([r for r in self._rules
+                           if not (r.keyword == keyword and (match is None or r.match is match))])
+
+    def set_rules(self, rules):
+        """
+        替换所有的关键字回复规则，新的匹配器编译完成后一次替换，正在处理的消息不会看到空的规则列表
+        :param rules: KeywordRule对象或者(keyword, target, match, priority)元组的列表
+        """
+        with self._build_lock:
+            self._install(self._number(rules))
+
+    def _number(self, rules):
+        """
+        按添加顺序为规则编号，优先级相同时先添加的规则优先，调用方需持有编译锁
+        """
+        numbered = []
+        for rule in rules:
+            if not isinstance(rule, KeywordRule):
+                rule = KeywordRule(*rule)
+            self._order += 1
+            rule.order = self._order
+            numbered.append(rule)
+        return numbered
+
+    def _install(self, rules):
+        automaton = _Automaton(rules, self.ignore_case)
+        # 先编译再替换引用，替换是原子操作，读取时无需加锁
+        self._rules = rules
+        self._automaton = automaton
+        # 只有固定文本的回复与用户无关，可以被公众号缓存；规则变化后已缓存的回复失效
+        self.cacheable = not any(callable(r.target) for r in rules)
+        self.reply_version += 1
+        log.debug("关键字匹配器编译完成，规则数量为%d", len(rules))
+
+    def match(self, text):
+        """
+        查找与文本匹配的规则
+        :param text: 消息内容
+        :return: 匹配的规则；没有匹配时返回None
+        """
+        if not text:
+            return None
+        return self._automaton.search(text)
+
+    def reply(self, record):
+        msg = record.msg
+        if not isinstance(msg, TextInputMessage):
+            return ""
+        rule = self.match(msg.content)
+        if rule is None:
+            return ""
+        if callable(rule.target):
+            return rule.target(record)
+        return render_text(msg.fromUserName, msg.toUserName, rule.target)
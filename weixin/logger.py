@@ -2,52 +2,155 @@
 # -------------------------------------------------------------------------
 # 文件目的：
 # 创建日期：2018/1/7
+# 说明：日志记录先放入队列，由后台线程格式化并写入输出，日志的I/O不再占用请求线程的时间
 # -------------------------------------------------------------------------
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 log = logging.getLogger("weixin")
 
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+DEFAULT_DATEFMT = "%Y-%m-%d-%H:%M:%S"
 
-def set_logger(logging_config=None):
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+# 完整消息内容的日志采样比例，1表示全部记录
+_body_sample_rate = 1.0
+
+
+class _NonBlockingQueueHandler(QueueHandler):
     """
-    根据日志配置参数设置模块日志记录器
-    :param logging_config: 日志配置参数
+    将日志记录放入有界队列，队列已满时丢弃日志，不阻塞请求线程
     """
-    if logging_config is None:
-        # 设置默认的日志信息
-        log.setLevel(logging.DEBUG)
-        formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%Y-%m-%d-%H:%M:%S")
+
+    def __init__(self, q):
+        QueueHandler.__init__(self, q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 日志消息在后台线程中格式化，这里不做任何处理
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_level(level):
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError("无效的日志级别:%s" % level)
+    return value
+
+
+def _build_handlers(logging_config):
+    fmt = logging.Formatter(logging_config.get("format", DEFAULT_FORMAT),
+                            logging_config.get("datefmt", DEFAULT_DATEFMT))
+    handlers = []
+    handler = logging_config.get("handler", {"console": True})
+    if handler.get("console") in (True, "True", "true"):
         console = logging.StreamHandler()
-        console.setFormatter(formatter)
-        log.addHandler(console)
-    else:
+        console.setFormatter(fmt)
+        handlers.append(console)
+    if "rotating-file" in handler:
+        rthandler = handler["rotating-file"]
+        rt_file = RotatingFileHandler(rthandler["file"],
+                                      maxBytes=rthandler.get("maxBytes", 10 * 1024 * 1024),
+                                      backupCount=rthandler.get("backupCount", 5),
+                                      encoding="utf-8")
+        rt_file.setFormatter(fmt)
+        handlers.append(rt_file)
+    return handlers
+
+
+def _stop_listener():
+    """
+    停止后台日志线程，并返回原来的日志输出
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return []
+    _listener.stop()
+    log.removeHandler(_queue_handler)
+    targets = list(_listener.handlers)
+    _listener = None
+    _queue_handler = None
+    return targets
+
+
+def set_logger(logging_config=None):
+    """
+    根据日志配置参数设置模块日志记录器，可以重复调用。
+    :param logging_config: 日志配置参数，可选的键为level、format、datefmt、handler、queue_size、body_sample_rate。
+        为None时，如果已经设置过则不做修改；否则使用日志记录器已有的输出(例如Django的LOGGING配置)，
+        没有输出时输出到控制台
+    """
+    global _listener, _queue_handler, _body_sample_rate
+    with _lock:
+        if logging_config is None and _listener is not None:
+            return
+        logging_config = logging_config or {}
+        targets = _stop_listener()
+        if "handler" in logging_config:
+            for h in targets:
+                h.close()
+            targets = _build_handlers(logging_config)
+        elif not targets:
+            # 将已有的输出移到后台线程中
+            targets = list(log.handlers) or _build_handlers(logging_config)
+        for h in list(log.handlers):
+            log.removeHandler(h)
+
         # 设置日志级别
         if "level" in logging_config:
-            level = logging_config["level"]
-            # todo
-            log.setLevel(logging.DEBUG)
-        else:
+            log.setLevel(_parse_level(logging_config["level"]))
+        elif log.level == logging.NOTSET:
             log.setLevel(logging.DEBUG)
-        # 设置格式
-        fmt = logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%Y-%m-%d-%H:%M:%S")
-        # 设置输出
-        if "handler" in logging_config:
-            handler = logging["handler"]
-            if "console" in handler and dict["console"] == 'True':
-                console = logging.StreamHandler()
-                console.setFormatter(fmt)
-                log.addHandler(console)
-            if "rotating-file" in handler:
-                rthandler = handler["rotating-file"]
-                filepath = rthandler["file"]
-                max_bytes = 10 * 1024 * 1024
-                if "maxBytes" in rthandler:
-                    max_bytes = rthandler["maxBytes"]
-                backup_count = 5
-                if "backupCount" in rthandler:
-                    backup_count = rthandler["backupCount"]
-                rt_file = RotatingFileHandler(filepath, maxBytes=max_bytes, backupCount=backup_count)
-                rt_file.setFormatter(fmt)
-                log.addHandler(rt_file)
+        _body_sample_rate = float(logging_config.get("body_sample_rate", _body_sample_rate))
+
+        _queue_handler = _NonBlockingQueueHandler(queue.Queue(logging_config.get("queue_size", 10000)))
+        log.addHandler(_queue_handler)
+        _listener = QueueListener(_queue_handler.queue, *targets, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logger():
+    """
+    写入队列中剩余的日志并停止后台日志线程，日志输出恢复为同步方式
+    """
+    with _lock:
+        for h in _stop_listener():
+            log.addHandler(h)
+
+
+def dropped_records():
+    """
+    :return: 因队列已满而丢弃的日志数量
+    """
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def log_body(level, msg, *args):
+    """
+    记录包含完整消息内容的日志，按body_sample_rate采样，避免消息内容的日志占满日志输出
+    :param level: 日志级别
+    :param msg: 日志消息，使用%格式
+    """
+    if not log.isEnabledFor(level):
+        return
+    if _body_sample_rate < 1.0 and random.random() >= _body_sample_rate:
+        return
+    log.log(level, msg, *args)
+
+
+atexit.register(shutdown_logger)
@@ -16,24 +16,79 @@ def register_message(msg_type):
     return register
 
 
+_REQUIRED = object()
+
+
+class Field(object):
+    """
+    消息字段的声明，对应消息XML中的一个节点
+    """
+    __slots__ = ("tag", "default")
+
+    def __init__(self, tag, default=_REQUIRED):
+        """
+        :param tag: 消息XML中的节点名称
+        :param default: 节点不存在时的默认值；未设置时节点必须存在，否则抛出KeyError
+        """
+        self.tag = tag
+        self.default = default
+
+
+class _MessageType(type):
+    """
+    将消息类型中声明的字段转换为__slots__，消息对象不再创建实例字典；
+    并为消息类型生成逐个字段赋值的构造器，与dataclasses生成构造器的方式相同
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = []
+        for key, value in list(namespace.items()):
+            if isinstance(value, Field):
+                fields.append((key, value))
+                del namespace[key]
+        namespace["__slots__"] = tuple(namespace.get("__slots__", ())) + tuple(key for key, _ in fields)
+        inherited = ()
+        for base in bases:
+            inherited += getattr(base, "_fields", ())
+        namespace["_fields"] = inherited + tuple(fields)
+        if "__init__" not in namespace:
+            namespace["__init__"] = _make_init(namespace["_fields"])
+        return type.__new__(mcs, name, bases, namespace)
+
+
+def _make_init(fields):
+    lines = ["def __init__(self, dic):"]
+    defaults = {}
+    for key, field in fields:
+        if field.default is _REQUIRED:
+            lines.append("    self.%s = dic[%r]" % (key, field.tag))
+        else:
+            defaults["_default_" + key] = field.default
+            lines.append("    self.%s = dic.get(%r, _default_%s)" % (key, field.tag, key))
+    if len(lines) == 1:
+        lines.append("    pass")
+    namespace = {}
+    exec("\n".join(lines), defaults, namespace)
+    return namespace["__init__"]
+
+
 # ---------------------------------------------------------------------------
 #   Handler
 # ---------------------------------------------------------------------------
 
-class BaseMessage(object):
+class BaseMessage(object, metaclass=_MessageType):
     """
     微信发送XML消息的基本类型
     """
 
-    def __init__(self, dic):
-        # 开发者微信号
-        self.toUserName = dic['ToUserName']
-        # 发送方账号(一个OpenId)
-        self.fromUserName = dic['FromUserName']
-        # 消息创建时间（整型）
-        self.createTime = dic['CreateTime']
-        # 消息类型
-        self.msgType = dic['MsgType']
+    # 开发者微信号
+    toUserName = Field('ToUserName')
+    # 发送方账号(一个OpenId)
+    fromUserName = Field('FromUserName')
+    # 消息创建时间（整型）
+    createTime = Field('CreateTime')
+    # 消息类型
+    msgType = Field('MsgType')
 
 
 # ---------------------------------------------------------------------------
@@ -45,10 +100,8 @@ class InputMessage(BaseMessage):
    微信发送消息的基本类型
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 消息id, 64位整型
-        self.msgId = dic['MsgId']
+    # 消息id, 64位整型
+    msgId = Field('MsgId')
 
 
 @register_message('text')
@@ -57,10 +110,8 @@ class TextInputMessage(InputMessage):
     微信发送的文本消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 文本消息内容
-        self.content = dic['Content']
+    # 文本消息内容
+    content = Field('Content')
 
 
 @register_message('image')
@@ -69,12 +120,10 @@ class ImageInputMessage(InputMessage):
     微信图片消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 图片链接
-        self.picUrl = dic['PicUrl']
-        # 图片消息媒体id,可以调用多媒体文件下载接口摘取数据
-        self.mediaId = dic['MediaId']
+    # 图片链接
+    picUrl = Field('PicUrl')
+    # 图片消息媒体id,可以调用多媒体文件下载接口摘取数据
+    mediaId = Field('MediaId')
 
 
 @register_message('voice')
@@ -83,14 +132,12 @@ class VoiceInputMessage(InputMessage):
     微信语音消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 语音消息媒体id,可以调用多媒体文件下载接口摘取数据
-        self.mediaId = dic['MediaId']
-        # 语音格式，如amr, speex等
-        self.format = dic['Format']
-        # 语音识别结果，UTF8编码
-        self.recognition = dic.get('Recognition', '')
+    # 语音消息媒体id,可以调用多媒体文件下载接口摘取数据
+    mediaId = Field('MediaId')
+    # 语音格式，如amr, speex等
+    format = Field('Format')
+    # 语音识别结果，UTF8编码
+    recognition = Field('Recognition', '')
 
 
 @register_message('video')
@@ -99,12 +146,10 @@ class VideoInputMessage(InputMessage):
     微信视频消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 视频消息媒体id,可以调用多媒体文件下载接口摘取数据
-        self.mediaId = dic['MediaId']
-        # 视频消息缩略图的媒体id,可以调用多媒体文件下载接口摘取数据
-        self.thumbMediaId = dic['ThumbMediaId']
+    # 视频消息媒体id,可以调用多媒体文件下载接口摘取数据
+    mediaId = Field('MediaId')
+    # 视频消息缩略图的媒体id,可以调用多媒体文件下载接口摘取数据
+    thumbMediaId = Field('ThumbMediaId')
 
 
 @register_message('shortvideo')
@@ -112,9 +157,7 @@ class ShortVideoInputMessage(VideoInputMessage):
     """
     微信小视频信息
     """
-
-    def __init__(self, dic):
-        super().__init__(dic)
+    pass
 
 
 @register_message('location')
@@ -123,16 +166,14 @@ class LocationInputMessage(InputMessage):
     微信地理位置消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 地理位置维度X
-        self.location_x = dic['Location_X']
-        # 地理位置维度Y
-        self.location_y = dic['Location_Y']
-        # 地理缩放大小
-        self.scale = dic.get('Scale', '1')
-        # 地理位置信息
-        self.label = dic['Label']
+    # 地理位置维度X
+    location_x = Field('Location_X')
+    # 地理位置维度Y
+    location_y = Field('Location_Y')
+    # 地理缩放大小
+    scale = Field('Scale', '1')
+    # 地理位置信息
+    label = Field('Label')
 
     def location(self):
         return self.location_x, self.location_y
@@ -144,20 +185,19 @@ class LinkInputMessage(InputMessage):
     微信链接消息
     """
 
-    def __init__(self, dic):
-        super().__init__(dic)
-        # 消息标题
-        self.title = dic['Title']
-        # 消息描述
-        self.description = dic['Description']
-        # 消息链接
-        self.url = dic['Url']
+    # 消息标题
+    title = Field('Title')
+    # 消息描述
+    description = Field('Description')
+    # 消息链接
+    url = Field('Url')
 
 
 class UnknownMessage(object):
     """
     未知的消息类型
     """
+    __slots__ = ("dic", "msgType")
 
     def __init__(self, dic):
         self.dic = dic
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：统计消息处理各阶段的耗时
+# 创建日期：2026/10/18
+# 说明：耗时按对数分桶计数，记录一次耗时只需一次二分查找，分位数的相对误差约为9%
+# -------------------------------------------------------------------------
+
+import time
+from bisect import bisect_left
+
+from weixin.events import EVENT_TYPES
+from weixin.logger import log
+from weixin.messages import MESSAGE_TYPES
+from weixin.utils import Lockable
+
+# 桶的上界，从1微秒到约60秒，相邻的桶相差2**(1/8)倍
+_BUCKET_BOUNDS = [1e-6 * 2 ** (i / 8.0) for i in range(8 * 26 + 1)]
+
+# 消息处理的阶段
+STAGE_VERIFY = "verify"
+STAGE_PARSE = "parse"
+STAGE_DECRYPT = "decrypt"
+STAGE_MESSAGE = "message"
+STAGE_HANDLE = "handle"
+STAGE_ENCRYPT = "encrypt"
+STAGE_TOTAL = "total"
+
+# 未注册的消息类型和事件类型使用的统计标签
+OTHER_LABEL = "other"
+
+_EMPTY = {}
+
+
+class Histogram(object):
+    """
+    耗时直方图。为减少开销，记录耗时时不加锁，多线程并发记录时计数可能有极少量的误差
+    """
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        记录一次耗时
+        :param seconds: 耗时，单位为秒
+        """
+        self.counts[bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """
+        获取耗时的分位数
+        :param q: 分位，取值范围为0到1
+        :return: 分位数所在桶的上界，单位为秒
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(_BUCKET_BOUNDS[i], self.max) if i < len(_BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self):
+        """
+        :return: 包含次数、平均值、p50、p95、p99和最大值的字典，时间单位为毫秒
+        """
+        count = self.count
+        return {
+            "count": count,
+            "avg_ms": self.total / count * 1000 if count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class StageTimer(object):
+    """
+    记录一次请求中各阶段的耗时
+    """
+    __slots__ = ("start", "last", "stages")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        # 阶段名称 -> 耗时，同一阶段多次出现时累加
+        self.stages = {}
+
+    def mark(self, stage):
+        """
+        结束一个阶段，记录从上一阶段结束到现在的耗时
+        :param stage: 阶段名称
+        """
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+class PipelineMetrics(Lockable):
+    """
+    按消息类型和处理阶段统计一个公众号的消息处理耗时
+    """
+
+    def __init__(self, name, deadline_warning=4.0):
+        """
+        :param name: 公众号标识
+        :param deadline_warning: 请求耗时超过该值时记录警告日志，单位为秒。微信服务器等待回复的时间为5秒
+        """
+        Lockable.__init__(self)
+        self.name = name
+        self.deadline_warning = deadline_warning
+        # 消息类型 -> 阶段 -> Histogram
+        self._histograms = {}
+
+    def histogram(self, msg_type, stage):
+        stages = self._histograms.get(msg_type)
+        h = stages.get(stage) if stages is not None else None
+        if h is None:
+            # 只有首次出现的消息类型或阶段需要加锁
+            self.acquire_lock()
+            try:
+                h = self._histograms.setdefault(msg_type, {}).setdefault(stage, Histogram())
+            finally:
+                self.release_lock()
+        return h
+
+    def observe(self, msg_type, timer):
+        """
+        记录一次请求的各阶段耗时
+        :param msg_type: 消息类型
+        :param timer: StageTimer对象
+        """
+        total = timer.elapsed()
+        histograms = self._histograms.get(msg_type, _EMPTY)
+        for stage, elapsed in timer.stages.items():
+            h = histograms.get(stage)
+            if h is None:
+                h = self.histogram(msg_type, stage)
+            h.record(elapsed)
+        h = histograms.get(STAGE_TOTAL)
+        if h is None:
+            h = self.histogram(msg_type, STAGE_TOTAL)
+        h.record(total)
+        if self.deadline_warning is not None and total >= self.deadline_warning:
+            log.warning("公众号'%s'的%s消息处理耗时%.3f秒，接近微信服务器5秒的等待时间，各阶段耗时为:%s",
+                        self.name, msg_type, total,
+                        ", ".join("%s=%.3f" % item for item in timer.stages.items()))
+
+    def snapshot(self):
+        """
+        :return: 消息类型 -> 阶段 -> 统计信息的字典
+        """
+        return {msg_type: {stage: h.snapshot() for stage, h in list(stages.items())}
+                for msg_type, stages in list(self._histograms.items())}
+
+    def reset(self):
+        self.acquire_lock()
+        try:
+            self._histograms = {}
+        finally:
+            self.release_lock()
+
+
+def type_label(msg_type, event=None):
+    """
+    获取统计使用的消息类型，事件消息包含事件类型。
+    类型来自未经校验的请求，未注册的消息类型和事件类型统一为other，避免伪造的请求产生无限多的统计项
+    :param msg_type: 消息类型
+    :param event: 事件类型
+    """
+    msg_type = (msg_type or "").lower()
+    if msg_type == "event":
+        event = (event or "").lower()
+        return "event:%s" % (event if event in EVENT_TYPES else OTHER_LABEL)
+    return msg_type if msg_type in MESSAGE_TYPES else OTHER_LABEL
+
+
+def message_label(msg_dict):
+    """
+    获取统计使用的消息类型，事件消息包含事件类型
+    :param msg_dict: 消息数据字典
+    """
+    return type_label(msg_dict.get("MsgType"), msg_dict.get("Event"))
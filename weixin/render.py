@@ -7,98 +7,169 @@
 
 import time
 
+try:
+    import xml.etree.cElementTree as Et
+except ImportError:
+    import xml.etree.ElementTree as Et
 
-def _create_time(timestamp):
-    return timestamp or str(int(time.time()))
+
+# 回复消息的XML按固定的片段拼接，只需一次join，不再对整个模板做格式化。
+# 公众号的FromUserName片段只计算一次，缓存后复用
+_HEAD = "<xml><ToUserName><![CDATA["
+_FROM = "]]></ToUserName><FromUserName><![CDATA["
+_TIME = "]]></FromUserName><CreateTime>"
+
+_TEXT_BODY = "</CreateTime><MsgType><![CDATA[text]]></MsgType><Content><![CDATA["
+_TEXT_TAIL = "]]></Content></xml>"
+
+_IMAGE_BODY = "</CreateTime><MsgType><![CDATA[image]]></MsgType><Image><MediaId><![CDATA["
+_IMAGE_TAIL = "]]></MediaId></Image></xml>"
+
+_VOICE_BODY = "</CreateTime><MsgType><![CDATA[voice]]></MsgType><Voice><MediaId><![CDATA["
+_VOICE_TAIL = "]]></MediaId></Voice></xml>"
+
+_VIDEO_BODY = "</CreateTime><MsgType><![CDATA[video]]></MsgType><Video><MediaId><![CDATA["
+_VIDEO_TITLE = "]]></MediaId><Title><![CDATA["
+_VIDEO_DESC = "]]></Title><Description><![CDATA["
+_VIDEO_TAIL = "]]></Description></Video></xml>"
+
+_MUSIC_BODY = "</CreateTime><MsgType><![CDATA[music]]></MsgType><Music><Title><![CDATA["
+_MUSIC_DESC = "]]></Title><Description><![CDATA["
+_MUSIC_URL = "]]></Description><MusicUrl><![CDATA["
+_MUSIC_HQ_URL = "]]></MusicUrl><HQMusicUrl><![CDATA["
+_MUSIC_THUMB = "]]></HQMusicUrl><ThumbMediaId><![CDATA["
+_MUSIC_TAIL = "]]></ThumbMediaId></Music></xml>"
+
+_NEWS_BODY = "</CreateTime><MsgType><![CDATA[news]]></MsgType><ArticleCount>"
+_NEWS_ARTICLES = "</ArticleCount><Articles>"
+_NEWS_TAIL = "</Articles></xml>"
+
+_ITEM_TITLE = "<item><Title><![CDATA["
+_ITEM_DESC = "]]></Title><Description><![CDATA["
+_ITEM_PIC_URL = "]]></Description><PicUrl><![CDATA["
+_ITEM_URL = "]]></PicUrl><Url><![CDATA["
+_ITEM_TAIL = "]]></Url></item>"
+
+# 图文消息最多包含的图文数
+MAX_ARTICLES = 8
+
+# 缓存的FromUserName片段数量上限
+_MAX_FROM_PARTS = 1024
+_from_parts = {}
+
+
+def _cdata(value):
+    """
+    转义CDATA中的内容，"]]>"拆分到两个CDATA段中
+    """
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        value = str(value)
+    return value.replace("]]>", "]]]]><![CDATA[>")
+
+
+def _from_part(userid):
+    """
+    获取从ToUserName结束到CreateTime开始的固定片段
+    :param userid: 开发者微信号
+    """
+    part = _from_parts.get(userid)
+    if part is None:
+        if len(_from_parts) >= _MAX_FROM_PARTS:
+            _from_parts.clear()
+        part = _from_parts[userid] = _FROM + _cdata(userid) + _TIME
+    return part
 
 
-_TEXT_XML = r"<xml>" \
-            r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
-            r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
-            r"<CreateTime>{2}</CreateTime>" \
-            r"<MsgType><![CDATA[text]]></MsgType>" \
-            r"<Content><![CDATA[{3}]]></Content>" \
-            r"</xml>"
+def _create_time(timestamp):
+    return str(timestamp) if timestamp else str(int(time.time()))
 
 
 def render_text(openid, userid, content, timestamp=None):
     """
     回复文本消息
+    :param openid: 接收方帐号
+    :param userid: 开发者微信号
+    :param content: 回复的消息内容
+    :param timestamp: 消息创建时间 （整型）
+    """
+    return "".join((_HEAD, _cdata(openid), _from_part(userid), _create_time(timestamp),
+                    _TEXT_BODY, _cdata(content), _TEXT_TAIL))
+
+
+def render_image(openid, userid, mediaId, timestamp=None):
+    """
+    回复图片消息
+    """
+    return "".join((_HEAD, _cdata(openid), _from_part(userid), _create_time(timestamp),
+                    _IMAGE_BODY, _cdata(mediaId), _IMAGE_TAIL))
+
+
+def render_voice(openid, userid, mediaId, timestamp=None):
+    """
+    回复语音消息
+    """
+    return "".join((_HEAD, _cdata(openid), _from_part(userid), _create_time(timestamp),
+                    _VOICE_BODY, _cdata(mediaId), _VOICE_TAIL))
+
+
+def render_video(openid, userid, title, desc, mediaId, timestamp=None):
+    """
+    回复视频消息
+    """
+    return "".join((_HEAD, _cdata(openid), _from_part(userid), _create_time(timestamp),
+                    _VIDEO_BODY, _cdata(mediaId), _VIDEO_TITLE, _cdata(title),
+                    _VIDEO_DESC, _cdata(desc), _VIDEO_TAIL))
+
+
+def render_music(openid, userid, title, desc, mediaId, musicurl, hqmusicurl, timestamp=None):
+    """
+    回复音乐消息
     """
-    return _TEXT_XML.format(
-        openid, userid, _create_time(timestamp), content
-    )
-
-
-_IMAGE_XML = r"<xml>" \
-             r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
-             r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
-             r"<CreateTime>{2}</CreateTime>" \
-             r"<MsgType><![CDATA[image]]></MsgType>" \
-             r"<Image><MediaId><![CDATA[{3}]]></MediaId></Image>" \
-             r"</xml>"
-
-_VOICE_XML = r"<xml>" \
-             r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
-             r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
-             r"<CreateTime>{2}</CreateTime>" \
-             r"<MsgType><![CDATA[voice]]></MsgType>" \
-             r"<Image><MediaId><![CDATA[{3}]]></MediaId></Image>" \
-             r"</xml>"
-
-_VIDEO_XML = r"<xml>" \
-             r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
-             r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
-             r"<CreateTime>{2}</CreateTime>" \
-             r"<MsgType><![CDATA[video]]></MsgType>" \
-             r"<Video>" \
-             r"<MediaId><![CDATA[{3}]]></MediaId>" \
-             r"<Title><![CDATA[{4}]]></Title>" \
-             r"<Description><![CDATA[{5}]]></Description>" \
-             r"</Video>" \
-             r"</xml>"
-
-_MUSIC_XML = r"<xml>" \
-             r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
-             r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
-             r"<CreateTime>{2}</CreateTime>" \
-             r"<MsgType><![CDATA[music]]></MsgType>" \
-             r"<Music>" \
-             r"<Title><![CDATA[{3}]]></Title>" \
-             r"<Description><![CDATA[{4}]]></Description>" \
-             r"<MusicUrl><![CDATA[{5}]]></MusicUrl>" \
-             r"<HQMusicUrl><![CDATA[{6}]]></HQMusicUrl>" \
-             r"<ThumbMediaId><![CDATA[{7}]]></ThumbMediaId>" \
-             r"</Music>" \
-             r"</xml>"
-
-_NEWS_XML = r"<xml>" \
-            r"<ToUserName><![CDATA[{0}]]></ToUserName>" \
-            r"<FromUserName><![CDATA[{1}]]></FromUserName>" \
-            r"<CreateTime>{2}</CreateTime>" \
-            r"<MsgType><![CDATA[news]]></MsgType>" \
-            r"<ArticleCount>{3}</ArticleCount>" \
-            r"<Articles>" \
-            r"{4}" \
-            r"</Articles>" \
-            r"</xml>"
-
-_ARTICLE_XML = r"<item>" \
-               r"<Title><![CDATA[{3}]]></Title>" \
-               r"<Description><![CDATA[{4}]]></Description>" \
-               r"<PicUrl><![CDATA[{5}]]></PicUrl>" \
-               r"</item>"
+    return "".join((_HEAD, _cdata(openid), _from_part(userid), _create_time(timestamp),
+                    _MUSIC_BODY, _cdata(title), _MUSIC_DESC, _cdata(desc),
+                    _MUSIC_URL, _cdata(musicurl), _MUSIC_HQ_URL, _cdata(hqmusicurl),
+                    _MUSIC_THUMB, _cdata(mediaId), _MUSIC_TAIL))
+
+
+def render_news(openid, userid, articles, timestamp=None):
+    """
+    回复图文消息
+    :param articles: Article对象或包含title、description、picurl、url的字典的列表，最多8条
+    """
+    articles = list(articles)
+    if not articles or len(articles) > MAX_ARTICLES:
+        raise ValueError("图文消息的图文数必须为1到%d条，实际为%d条" % (MAX_ARTICLES, len(articles)))
+    parts = [_HEAD, _cdata(openid), _from_part(userid), _create_time(timestamp),
+             _NEWS_BODY, str(len(articles)), _NEWS_ARTICLES]
+    for article in articles:
+        if isinstance(article, dict):
+            article = Article(article.get("title"), article.get("description"),
+                              article.get("picurl"), article.get("url"))
+        parts += (_ITEM_TITLE, _cdata(article.title), _ITEM_DESC, _cdata(article.desc),
+                  _ITEM_PIC_URL, _cdata(article.picurl), _ITEM_URL, _cdata(article.url), _ITEM_TAIL)
+    parts.append(_NEWS_TAIL)
+    return "".join(parts)
 
 
 class Article(object):
     """
-    表示图文消息
+    表示图文消息中的一条图文
     """
+    __slots__ = ("title", "desc", "picurl", "url")
 
-    def __init__(self, title, desc, picurl):
+    def __init__(self, title, desc, picurl, url=None):
+        """
+        :param title: 图文消息标题
+        :param desc: 图文消息描述
+        :param picurl: 图片链接，支持JPG、PNG格式
+        :param url: 点击图文消息跳转的链接
+        """
         self.title = title
         self.desc = desc
-        self.picurl
+        self.picurl = picurl
+        self.url = url
 
 
 class Renderer(object):
@@ -109,6 +180,7 @@ class Renderer(object):
     def __init__(self, appid):
         # 开发者微信号
         self.fromUserName = appid
+        self._from = _FROM + _cdata(appid) + _TIME
 
     def render_text(self, openid, content, timestamp=None):
         """
@@ -118,7 +190,8 @@ class Renderer(object):
         :param timestamp: 消息创建时间 （整型）
         :return: 微信格式的XML文本
         """
-        return render_text(self.fromUserName, openid, content, timestamp)
+        return "".join((_HEAD, _cdata(openid), self._from, _create_time(timestamp),
+                        _TEXT_BODY, _cdata(content), _TEXT_TAIL))
 
     def render_image(self, openid, mediaId, timestamp=None):
         """
@@ -128,58 +201,164 @@ class Renderer(object):
         :param timestamp:消息创建时间 （整型）
         :return:微信格式的XML文本
         """
-        return _IMAGE_XML.format(
-            openid, self.fromUserName, _create_time(timestamp), mediaId
-        )
+        return "".join((_HEAD, _cdata(openid), self._from, _create_time(timestamp),
+                        _IMAGE_BODY, _cdata(mediaId), _IMAGE_TAIL))
 
     def render_voice(self, openid, mediaId, timestamp=None):
         """
-        回复消息
+        回复语音消息
         :param openid: 接收方帐号
         :param mediaId:通过素材管理中的接口上传多媒体文件，得到的id
         :param timestamp:消息创建时间 （整型）
         :return:微信格式的XML文本
         """
-        return _VOICE_XML.format(
-            openid, self.fromUserName, mediaId, _create_time(timestamp)
-        )
+        return "".join((_HEAD, _cdata(openid), self._from, _create_time(timestamp),
+                        _VOICE_BODY, _cdata(mediaId), _VOICE_TAIL))
 
     def render_video(self, openid, title, desc, mediaId, timestamp=None):
         """
-        回复图片消息
+        回复视频消息
         :param openid: 接收方帐号
-        :param title:
-        :param desc:
+        :param title: 视频消息的标题
+        :param desc: 视频消息的描述
         :param mediaId:通过素材管理中的接口上传多媒体文件，得到的id
         :param timestamp: 消息创建时间 （整型）
         :return: 微信格式的XML文本
         """
-        return _VIDEO_XML.format(
-            openid, self.fromUserName, mediaId, _create_time(timestamp), title, desc
-        )
+        return "".join((_HEAD, _cdata(openid), self._from, _create_time(timestamp),
+                        _VIDEO_BODY, _cdata(mediaId), _VIDEO_TITLE, _cdata(title),
+                        _VIDEO_DESC, _cdata(desc), _VIDEO_TAIL))
 
     def render_music(self, openid, title, desc, mediaId, musicurl, hqmusicurl, timestamp=None):
         """
-
-        :param openid:
-        :param title:
-        :param desc:
-        :param mediaId:
-        :param musicurl:
-        :param hqmusicurl:
-        :param timestamp:
+        回复音乐消息
+        :param openid: 接收方帐号
+        :param title: 音乐标题
+        :param desc: 音乐描述
+        :param mediaId: 缩略图的媒体id
+        :param musicurl: 音乐链接
+        :param hqmusicurl: 高质量音乐链接，WIFI环境优先使用该链接播放音乐
+        :param timestamp: 消息创建时间 （整型）
         :return: 微信格式的XML文本
         """
-        return _MUSIC_XML.format(
-            openid, self.fromUserName, mediaId, _create_time(timestamp), title, desc
-        )
+        return "".join((_HEAD, _cdata(openid), self._from, _create_time(timestamp),
+                        _MUSIC_BODY, _cdata(title), _MUSIC_DESC, _cdata(desc),
+                        _MUSIC_URL, _cdata(musicurl), _MUSIC_HQ_URL, _cdata(hqmusicurl),
+                        _MUSIC_THUMB, _cdata(mediaId), _MUSIC_TAIL))
 
     def render_news(self, openid, articles, timestamp=None):
         """
+        回复图文消息
+        :param openid: 接收方帐号
+        :param articles: Article对象或字典的列表，最多8条
+        :param timestamp: 消息创建时间 （整型）
+        :return: 微信格式的XML文本
+        """
+        return render_news(openid, self.fromUserName, articles, timestamp)
+
+
+# ---------------------------------------------------------------------------
+#   回复模板
+# ---------------------------------------------------------------------------
+
+_TO_END = "]]></ToUserName>"
+_CREATE_TIME = "<CreateTime>"
+_CREATE_TIME_END = "</CreateTime>"
+
 
-        :param openid:
-        :param articles:
-        :param timestamp:
+class ReplyTemplate(object):
+    """
+    回复消息中与用户无关的部分。同一菜单或关键字的回复只有ToUserName和CreateTime不同，
+    缓存模板后只需拼接这两个字段即可得到回复
+    """
+    __slots__ = ("middle", "tail")
+
+    def __init__(self, middle, tail):
+        # ToUserName之后到CreateTime的值之前的部分
+        self.middle = middle
+        # CreateTime的值之后的部分
+        self.tail = tail
+
+    @classmethod
+    def compile(cls, reply, openid):
+        """
+        从回复消息中提取模板
+        :param reply: 微信格式的XML文本
+        :param openid: 回复消息的接收方帐号
+        :return: ReplyTemplate对象；回复不是本模块输出的格式时返回None
+        """
+        head = _HEAD + _cdata(openid)
+        if not reply or not reply.startswith(head) or not reply.startswith(_TO_END, len(head)):
+            return None
+        start = reply.find(_CREATE_TIME, len(head))
+        if start < 0:
+            return None
+        start += len(_CREATE_TIME)
+        end = reply.find(_CREATE_TIME_END, start)
+        if end < 0:
+            return None
+        return cls(reply[len(head):start], reply[end:])
+
+    def render(self, openid, timestamp=None):
+        """
+        输出回复给指定用户的消息
+        :param openid: 接收方帐号
+        :param timestamp: 消息创建时间 （整型）
         :return: 微信格式的XML文本
         """
-        pass
+        return "".join((_HEAD, _cdata(openid), self.middle, _create_time(timestamp), self.tail))
+
+
+# ---------------------------------------------------------------------------
+#   客服消息
+# ---------------------------------------------------------------------------
+
+def _find_text(node, path):
+    child = node.find(path)
+    if child is None or child.text is None:
+        return ""
+    return child.text
+
+
+def to_custom_message(reply):
+    """
+    将回复微信服务器的消息文本转换为客服消息，用于在被动回复超时后通过客服消息接口发送
+    参见：https://mp.weixin.qq.com/wiki?t=resource/res_main&id=mp1421140547
+    :param reply: 微信格式的XML文本
+    :return: 客服消息字典；不支持的消息类型返回None
+    """
+    tree = Et.fromstring(reply)
+    msg_type = _find_text(tree, "MsgType")
+    message = {"touser": _find_text(tree, "ToUserName"), "msgtype": msg_type}
+    if msg_type == "text":
+        message["text"] = {"content": _find_text(tree, "Content")}
+    elif msg_type in ("image", "voice"):
+        message[msg_type] = {"media_id": _find_text(tree, ".//MediaId")}
+    elif msg_type == "video":
+        message["video"] = {
+            "media_id": _find_text(tree, ".//MediaId"),
+            "thumb_media_id": _find_text(tree, ".//ThumbMediaId"),
+            "title": _find_text(tree, ".//Title"),
+            "description": _find_text(tree, ".//Description"),
+        }
+    elif msg_type == "music":
+        message["music"] = {
+            "title": _find_text(tree, ".//Title"),
+            "description": _find_text(tree, ".//Description"),
+            "musicurl": _find_text(tree, ".//MusicUrl"),
+            "hqmusicurl": _find_text(tree, ".//HQMusicUrl"),
+            "thumb_media_id": _find_text(tree, ".//ThumbMediaId"),
+        }
+    elif msg_type == "news":
+        articles = []
+        for item in tree.iter("item"):
+            articles.append({
+                "title": _find_text(item, "Title"),
+                "description": _find_text(item, "Description"),
+                "url": _find_text(item, "Url"),
+                "picurl": _find_text(item, "PicUrl"),
+            })
+        message["news"] = {"articles": articles}
+    else:
+        return None
+    return message
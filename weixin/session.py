@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：保存同一用户多次消息之间的会话数据
+# 创建日期：2026/10/18
+# 说明：会话数据按"公众号开发者ID:用户标识"保存，只有在消息处理器访问时才加载，
+#      处理完成后如果会话数据被修改则写回存储
+# -------------------------------------------------------------------------
+
+import json
+import threading
+import time
+
+from weixin.cache import LRUCache
+from weixin.utils import Lockable
+
+
+# ---------------------------------------------------------------------------
+#   Session
+# ---------------------------------------------------------------------------
+
+class Session(object):
+    """
+    用户的会话数据，使用方式与字典相同，数据必须能够被序列化为JSON。
+    直接修改会话中的列表或字典时，需要调用mark_modified通知会话数据已修改
+    """
+    __slots__ = ("key", "_data", "modified")
+
+    def __init__(self, key, data=None):
+        self.key = key
+        self._data = data if data is not None else {}
+        self.modified = False
+
+    def get(self, name, default=None):
+        return self._data.get(name, default)
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def __setitem__(self, name, value):
+        self._data[name] = value
+        self.modified = True
+
+    def __delitem__(self, name):
+        del self._data[name]
+        self.modified = True
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def pop(self, name, default=None):
+        if name in self._data:
+            self.modified = True
+        return self._data.pop(name, default)
+
+    def setdefault(self, name, default=None):
+        if name not in self._data:
+            self._data[name] = default
+            self.modified = True
+        return self._data[name]
+
+    def update(self, *args, **kwargs):
+        self._data.update(*args, **kwargs)
+        self.modified = True
+
+    def clear(self):
+        if self._data:
+            self._data.clear()
+            self.modified = True
+
+    def mark_modified(self):
+        self.modified = True
+
+    def to_dict(self):
+        return dict(self._data)
+
+    def __repr__(self):
+        return "Session(%r, %r)" % (self.key, self._data)
+
+
+# ---------------------------------------------------------------------------
+#   SessionStore
+# ---------------------------------------------------------------------------
+
+class SessionStore(object):
+    """
+    会话存储的基类
+    """
+
+    def open(self, key):
+        """
+        加载用户的会话，会话不存在或已过期时返回空会话
+        :param key: 会话标识
+        :return: Session对象
+        """
+        return Session(key, self.load(key))
+
+    def commit(self, session):
+        """
+        会话数据被修改时写回存储，会话被清空时删除存储的数据
+        :param session: Session对象
+        """
+        if not session.modified:
+            return
+        if len(session):
+            self.save(session.key, session.to_dict())
+        else:
+            self.delete(session.key)
+        session.modified = False
+
+    def load(self, key):
+        """
+        :return: 会话数据字典；不存在或已过期时返回None
+        """
+        raise NotImplementedError("SessionStore的子类没有实现load方法")
+
+    def save(self, key, data):
+        raise NotImplementedError("SessionStore的子类没有实现save方法")
+
+    def delete(self, key):
+        raise NotImplementedError("SessionStore的子类没有实现delete方法")
+
+    def flush(self):
+        """
+        将缓冲的修改写入存储
+        """
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    进程内的会话存储，会话数量超过上限时淘汰最久未使用的会话
+    """
+
+    def __init__(self, max_size=10000, ttl=1800):
+        """
+        :param max_size: 最多保存的会话数量
+        :param ttl: 会话的有效时间，单位为秒
+        """
+        self.ttl = ttl
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def load(self, key):
+        text = self._cache.get(key)
+        # 存储的是JSON文本，每次加载得到新的对象，未提交的修改(包括嵌套的列表和字典)不影响存储中的数据
+        return json.loads(text) if text is not None else None
+
+    def save(self, key, data):
+        self._cache.set(key, json.dumps(data, ensure_ascii=False))
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def stats(self):
+        return self._cache.stats()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class _WriteBatch(object):
+    """
+    一次事务中写入的会话修改
+    """
+    __slots__ = ("items", "done", "error")
+
+    def __init__(self):
+        # 会话标识 -> JSON文本，None表示删除；同一会话的多次修改只写入最后一次
+        self.items = {}
+        self.done = threading.Event()
+        self.error = None
+
+
+class SQLiteSessionStore(SessionStore, Lockable):
+    """
+    基于SQLite的会话存储，同一台服务器上的多个工作进程可以共享会话。
+    会话提交时写入数据库，写入完成后才返回，其它进程随后读取到的是最新的会话。
+    同时提交的修改合并为一个事务批量写入：第一个提交的线程负责写入，写入期间其它线程提交的修改进入下一批
+    """
+
+    def __init__(self, path, ttl=1800, cleanup_interval=300):
+        """
+        :param path: 数据库文件路径
+        :param ttl: 会话的有效时间，单位为秒
+        :param cleanup_interval: 清理过期会话的时间间隔，单位为秒
+        """
+        Lockable.__init__(self)
+        self.path = path
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0
+        import sqlite3
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS wx_session ("
+                           "key TEXT PRIMARY KEY, data TEXT NOT NULL, expire_at REAL NOT NULL)")
+        # 数据库连接的锁；self.lock只保护待写入的批次，写入数据库期间其它线程仍可以提交修改
+        self._conn_lock = threading.Lock()
+        self._batch = None
+        self._writing = False
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+
+    def load(self, key):
+        with self._conn_lock:
+            self._check_open()
+            row = self._conn.execute("SELECT data FROM wx_session WHERE key=? AND expire_at>?",
+                                     (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key, data):
+        self._write(key, json.dumps(data, ensure_ascii=False))
+
+    def delete(self, key):
+        self._write(key, None)
+
+    def _write(self, key, text):
+        """
+        将修改加入待写入的批次，并等待该批次写入数据库
+        """
+        self.acquire_lock()
+        try:
+            self._check_open()
+            batch = self._batch
+            if batch is None:
+                batch = self._batch = _WriteBatch()
+            batch.items[key] = text
+            leader = not self._writing
+            self._writing = True
+        finally:
+            self.release_lock()
+        if leader:
+            self._write_batches()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def _write_batches(self):
+        """
+        依次写入待写入的批次，直到没有新的修改
+        """
+        while True:
+            self.acquire_lock()
+            try:
+                batch, self._batch = self._batch, None
+                if batch is None:
+                    self._writing = False
+                    return
+            finally:
+                self.release_lock()
+            try:
+                self._commit(batch.items)
+            except Exception as e:
+                batch.error = e
+            batch.done.set()
+
+    def _commit(self, items):
+        expire_at = time.time() + self.ttl
+        saves = [(k, text, expire_at) for k, text in items.items() if text is not None]
+        deletes = [(k,) for k, text in items.items() if text is None]
+        with self._conn_lock:
+            self._check_open()
+            with self._conn:
+                self._conn.execute("BEGIN")
+                if saves:
+                    self._conn.executemany("INSERT OR REPLACE INTO wx_session (key, data, expire_at) "
+                                           "VALUES (?, ?, ?)", saves)
+                if deletes:
+                    self._conn.executemany("DELETE FROM wx_session WHERE key=?", deletes)
+            self.batches += 1
+            self.writes += len(items)
+            now = time.monotonic()
+            if now - self._last_cleanup >= self.cleanup_interval:
+                self._last_cleanup = now
+                self._conn.execute("DELETE FROM wx_session WHERE expire_at<=?", (time.time(),))
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("会话存储%s已关闭" % self.path)
+
+    def close(self):
+        """
+        关闭数据库连接，之后的读写抛出RuntimeError；已提交的修改在提交返回时均已写入数据库
+        """
+        self.acquire_lock()
+        try:
+            self._closed = True
+        finally:
+            self.release_lock()
+        with self._conn_lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._conn_lock:
+            self._check_open()
+            return self._conn.execute("SELECT COUNT(*) FROM wx_session WHERE expire_at>?",
+                                      (time.time(),)).fetchone()[0]
+
+
+def create_session_store(config):
+    """
+    根据配置参数创建会话存储
+    :param config: 配置参数，为None或True时使用进程内存储；为False时不使用会话；
+                   为字典时由backend指定存储类型(memory或sqlite)，其它参数传给存储对象
+    :return: SessionStore对象或None
+    """
+    if config is False:
+        return None
+    if config is None or config is True:
+        return MemorySessionStore()
+    config = dict(config)
+    backend = config.pop("backend", "memory")
+    if backend == "memory":
+        return MemorySessionStore(**config)
+    if backend == "sqlite":
+        return SQLiteSessionStore(**config)
+    raise ValueError("不支持的会话存储类型:%s" % backend)
@@ -5,6 +5,9 @@
 # -------------------------------------------------------------------------
 
 import hashlib
+import hmac
+import re
+from sys import intern
 
 try:
     import threading
@@ -29,6 +32,8 @@ def check_signature(token, timestamp, nonce, signature):
     :param signature: 微信加密签名
     :return: 如果签名验证成功，则返回True；否则返回False
     """
+    if not (timestamp and nonce and signature):
+        return False
     lst = [token, timestamp, nonce]
     # 将token, timestamp, nonce三个参数按升序进行排序
     lst.sort()
@@ -40,12 +45,27 @@ def check_signature(token, timestamp, nonce, signature):
     hashcode = sha1.hexdigest()
 
     # 将字节与服务器提供的微信加密签名进行比较。如两者相等，则校验通过
-    return hashcode == signature
+    # 使用固定耗时的比较，避免通过响应时间逐字节猜测签名；compare_digest不接受含非ASCII字符的字符串，因此比较编码后的字节
+    return hmac.compare_digest(hashcode.encode("ascii"), signature.encode("utf-8", "surrogatepass"))
 
 
 def msgtodict(msg_xml):
     """
     解析微信消息的XML文本，获取消息数据
+    微信推送的消息都是只有一层子节点的<xml>文档，子节点的值多为CDATA，
+    因此先使用单遍扫描的方式直接提取节点名称和值；遇到不符合此格式的文档时再交给ElementTree解析
+    :param msg_xml: 消息XML文本，可以是字符串或者UTF-8编码的字节
+    :return: 消息数据字典
+    """
+    props = _scan_flat_xml(msg_xml)
+    if props is None:
+        props = _msgtodict_etree(msg_xml)
+    return props
+
+
+def _msgtodict_etree(msg_xml):
+    """
+    使用ElementTree解析消息XML文本，用于处理单遍扫描无法处理的文档
     :param msg_xml: 消息XML文本
     :return: 消息数据字典
     """
@@ -57,6 +77,54 @@ def msgtodict(msg_xml):
     return props
 
 
+# 微信消息XML的子节点：节点名称只包含字母、数字和下划线且不以数字开头，节点值为CDATA或不含实体的普通文本
+# 回车符在XML解析时需要做换行规范化，因此不在快速路径中处理
+_FLAT_ELEMENT = r'\s*<([A-Za-z_]\w*)>(?:<!\[CDATA\[([^\]\r]*(?:\](?!\]>)[^\]\r]*)*)\]\]>|([^<&\r]*))</\1>'
+_FLAT_ELEMENT_RE = re.compile(_FLAT_ELEMENT, re.A)
+_FLAT_ELEMENT_BYTES_RE = re.compile(_FLAT_ELEMENT.encode("ascii"))
+_FLAT_ROOT_RE = re.compile(r'\s*<xml>')
+_FLAT_ROOT_BYTES_RE = re.compile(br'\s*<xml>')
+_FLAT_END_RE = re.compile(r'\s*</xml>\s*\Z')
+_FLAT_END_BYTES_RE = re.compile(br'\s*</xml>\s*\Z')
+
+
+def _scan_flat_xml(data):
+    """
+    单遍扫描只有一层子节点的微信消息XML，直接提取节点名称和值
+    :param data: 消息XML文本或UTF-8编码的字节
+    :return: 消息数据字典；如果文档包含嵌套节点、属性、实体、声明等不常见的结构，返回None
+    """
+    binary = isinstance(data, bytes)
+    if binary:
+        root, element, end = _FLAT_ROOT_BYTES_RE, _FLAT_ELEMENT_BYTES_RE, _FLAT_END_BYTES_RE
+    else:
+        root, element, end = _FLAT_ROOT_RE, _FLAT_ELEMENT_RE, _FLAT_END_RE
+    m = root.match(data)
+    if m is None:
+        return None
+    props = {}
+    pos = m.end()
+    m = element.match(data, pos)
+    while m is not None:
+        tag, cdata, text = m.groups()
+        value = cdata if cdata is not None else text
+        if binary:
+            try:
+                tag = tag.decode("ascii")
+                value = value.decode("utf-8")
+            except UnicodeDecodeError:
+                return None
+        # 节点名称使用驻留字符串，各消息的数据字典共享相同的键对象
+        # 与ElementTree保持一致，空节点的值为None
+        props[intern(tag)] = value or None
+        pos = m.end()
+        m = element.match(data, pos)
+    # 剩余内容必须是根节点的结束标记，否则说明存在嵌套节点、混合内容或格式错误
+    if end.match(data, pos) is None:
+        return None
+    return props
+
+
 def rand_str(length, dictionary):
     """
     生成指定长度的随机字符串
@@ -155,10 +223,9 @@ def parse_event(dic):
     # assert (dic['MsgType'].lower() == 'event')
     event = dic["Event"].lower()
     if event == "subscribe":
-        eventkey = dic.get("EventKey", "")
+        eventkey = dic.get("EventKey") or ""
         if eventkey.startswith(SUBSCRIBE_QRSCENE):
             return SubscribeScanEvent(dic)
         return SubscribeEvent(dic)
-    event_type = dic['MsgType'].lower()
-    event_class = EVENT_TYPES.get(event_type, UnknownMessage)
+    event_class = EVENT_TYPES.get(event, UnknownMessage)
     return event_class(dic)
@@ -3,14 +3,29 @@
 # 文件目的：
 # 创建日期：2017-12-30
 # -------------------------------------------------------------------------
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
 from enum import Enum
 
-from weixin.api.client import WxClient
-from weixin.crypto import MessageCryptor
-from weixin.logger import log, set_logger
+from weixin.cache import MessageDeduplicator, ReplyCache, RotatingBloomFilter
+import logging
+
+from weixin.logger import log, set_logger, log_body
 from weixin.messages import TextInputMessage
-from weixin.render import render_text
+from weixin import metrics
+from weixin.metrics import PipelineMetrics, StageTimer, message_label, type_label
+from weixin.render import render_text, to_custom_message
+from weixin.session import create_session_store
+from weixin.api.token import create_token_store, default_token_refresher
 from weixin.utils import check_signature, msgtodict, Lockable, Activator, parse_message
+from weixin.worker import default_pool
+
+# 无法在5秒内回复时，微信服务器要求直接回复success，此时不会对消息做任何处理，也不会发起重试
+ACK_REPLY = "success"
 
 
 # ---------------------------------------------------------------------------
@@ -18,20 +33,111 @@ from weixin.utils import check_signature, msgtodict, Lockable, Activator, parse_
 # ---------------------------------------------------------------------------
 
 
+class CONCURRENCY(Enum):
+    """
+    消息处理器的并发方式
+    """
+    # 同一处理器同时只处理一条消息
+    SERIAL = 10
+    # 同一用户的消息依次处理，不同用户的消息并发处理
+    PER_USER = 20
+    # 处理器是线程安全的，所有消息并发处理
+    THREAD_SAFE = 30
+
+
+class _StripedLocks(object):
+    """
+    按用户分段的锁。用户标识经过哈希后映射到固定数量的锁上，内存占用不随用户数量增长
+    """
+
+    def __init__(self, factory, stripes=64):
+        self._locks = [factory() for _ in range(stripes)]
+
+    def lock_for(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+
 class Handler(Lockable):
     """
     消息处理器
     """
 
+    # 是否在后台线程中处理消息。为True时立即回复微信服务器success，处理结果通过客服消息接口发送给用户
+    asynchronous = False
+    # 处理器接收的消息类型，如("text", "image")；为None时接收所有类型的消息
+    msg_types = None
+    # 处理器接收的事件类型，如("click", "view")；为None时接收所有事件
+    events = None
+    # 处理器接收的事件Key值前缀，如("menu_",)；为None时不限制事件Key值
+    event_keys = None
+    # 处理器的并发方式，默认同一处理器同时只处理一条消息；线程安全的处理器应声明为THREAD_SAFE
+    concurrency = CONCURRENCY.SERIAL
+    # 回复是否只与菜单Key值或消息内容有关、与用户无关。为True时公众号缓存处理器的回复，相同的请求不再调用处理器
+    cacheable = False
+    # 回复内容的版本，处理器的回复内容变化时递增，已缓存的回复随之失效
+    reply_version = 0
+
     def __init__(self):
         Lockable.__init__(self)
+        self._user_locks = None
+        self._async_lock = None
+        self._async_user_locks = None
 
     def handle(self, record):
-        self.acquire_lock()
-        try:
-            return self.reply(record)
-        finally:
-            self.release_lock()
+        lock = self._lock_for(record)
+        if lock is None:
+            return self._reply(record)
+        with lock:
+            return self._reply(record)
+
+    async def async_handle(self, record):
+        """
+        以协程方式处理消息。
+        reply为协程函数时直接在事件循环中执行，否则在线程池中执行，避免阻塞事件循环
+        """
+        if not self.is_coroutine():
+            return await asyncio.get_running_loop().run_in_executor(None, self.handle, record)
+        lock = self._async_lock_for(record)
+        if lock is None:
+            return await self.reply(record)
+        async with lock:
+            return await self.reply(record)
+
+    def _reply(self, record):
+        if self.is_coroutine():
+            # 在Web服务器或后台的工作线程中，为协程类型的处理器创建新的事件循环
+            return asyncio.run(self.reply(record))
+        return self.reply(record)
+
+    def _lock_for(self, record):
+        """
+        根据并发方式获取处理消息前需要持有的锁
+        :return: 锁对象；线程安全的处理器返回None
+        """
+        if self.concurrency == CONCURRENCY.THREAD_SAFE:
+            return None
+        if self.concurrency == CONCURRENCY.PER_USER:
+            if self._user_locks is None:
+                self._user_locks = _StripedLocks(threading.RLock)
+            return self._user_locks.lock_for(record.openid)
+        return self.lock
+
+    def _async_lock_for(self, record):
+        if self.concurrency == CONCURRENCY.THREAD_SAFE:
+            return None
+        if self.concurrency == CONCURRENCY.PER_USER:
+            if self._async_user_locks is None:
+                self._async_user_locks = _StripedLocks(asyncio.Lock)
+            return self._async_user_locks.lock_for(record.openid)
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    def is_coroutine(self):
+        """
+        判断处理器的reply方法是否为协程函数
+        """
+        return asyncio.iscoroutinefunction(self.reply)
 
     def reply(self, record):
         raise NotImplementedError('Hanlder的子类没有实现reply方法')
@@ -41,6 +147,7 @@ class EchoHandler(Handler):
     """
     简单的消息回应处理器
     """
+    concurrency = CONCURRENCY.THREAD_SAFE
 
     def reply(self, record):
         msg = record.msg
@@ -51,46 +158,291 @@ class EchoHandler(Handler):
         return retval
 
 
+def route(msg_types=None, events=None, event_keys=None):
+    """
+    声明消息处理器接收的消息，可用于处理器类或者处理函数
+
+    >>> @route(events=("click",), event_keys=("menu_",))
+    ... def on_menu_click(record):
+    ...     pass
+    :param msg_types: 接收的消息类型
+    :param events: 接收的事件类型，声明后处理器只接收事件消息
+    :param event_keys: 接收的事件Key值前缀，声明后处理器只接收事件消息
+    """
+
+    def decorate(h):
+        h.msg_types = msg_types
+        h.events = events
+        h.event_keys = event_keys
+        return h
+
+    return decorate
+
+
+def _lower_set(values):
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = (values,)
+    return frozenset(v.lower() for v in values)
+
+
+class _Route(object):
+    """
+    消息处理器声明的接收条件
+    """
+    __slots__ = ("handler", "msg_types", "events", "event_keys")
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.msg_types = _lower_set(getattr(handler, "msg_types", None))
+        self.events = _lower_set(getattr(handler, "events", None))
+        event_keys = getattr(handler, "event_keys", None)
+        if isinstance(event_keys, str):
+            event_keys = (event_keys,)
+        self.event_keys = tuple(event_keys) if event_keys is not None else None
+
+    def accept_type(self, msg_type):
+        if self.msg_types is not None:
+            return msg_type in self.msg_types
+        if msg_type == "event":
+            return True
+        # 只声明了事件或事件Key值的处理器不接收普通消息
+        return self.events is None and self.event_keys is None
+
+    def accept_event(self, event):
+        return self.events is None or event in self.events
+
+
+class _RouteTable(object):
+    """
+    按消息类型、事件类型和事件Key值前缀建立的消息处理器索引，
+    消息只会交给声明接收该消息的处理器，处理器的调用顺序与配置顺序一致
+    """
+
+    def __init__(self, handlers):
+        routes = [_Route(h) for h in handlers]
+        msg_types = set()
+        events = set()
+        for r in routes:
+            msg_types.update(r.msg_types or ())
+            events.update(r.events or ())
+        msg_types.discard("event")
+        self._by_type = {}
+        for t in msg_types:
+            self._by_type[t] = [r.handler for r in routes if r.accept_type(t)]
+        # 没有处理器声明的消息类型只交给未声明接收条件的处理器
+        self._default_type = [r.handler for r in routes if r.accept_type(None)]
+        event_routes = [r for r in routes if r.accept_type("event")]
+        self._by_event = {}
+        for e in events:
+            self._by_event[e] = self._compile_event([r for r in event_routes if r.accept_event(e)])
+        self._default_event = self._compile_event([r for r in event_routes if r.events is None])
+
+    @staticmethod
+    def _compile_event(routes):
+        # 没有处理器声明事件Key值前缀时，直接返回处理器列表，无需逐个判断
+        if all(r.event_keys is None for r in routes):
+            return [r.handler for r in routes], None
+        return None, [(r.handler, r.event_keys) for r in routes]
+
+    def lookup(self, msg_type, event=None, event_key=None):
+        """
+        查找接收该消息的处理器
+        :param msg_type: 消息类型（小写）
+        :param event: 事件类型（小写）
+        :param event_key: 事件Key值
+        :return: 处理器列表
+        """
+        if msg_type != "event":
+            return self._by_type.get(msg_type, self._default_type)
+        handlers, routes = self._by_event.get(event, self._default_event)
+        if handlers is not None:
+            return handlers
+        event_key = event_key or ""
+        return [h for h, prefixes in routes if prefixes is None or event_key.startswith(prefixes)]
+
+
+def route_of(msg):
+    """
+    获取消息的路由信息
+    :param msg: 消息对象
+    :return: (消息类型, 事件类型, 事件Key值)，消息类型和事件类型为小写
+    """
+    dic = getattr(msg, "dic", None)
+    if dic is not None:
+        # 未知类型的消息保留了原始的消息数据
+        msg_type, event, event_key = dic.get("MsgType"), dic.get("Event"), dic.get("EventKey")
+    else:
+        msg_type = msg.msgType
+        event, event_key = getattr(msg, "event", None), getattr(msg, "eventKey", None)
+    return (msg_type or "").lower(), (event or "").lower(), event_key
+
+
 class _Handlerer(Lockable):
     """
     Handler的管理
     """
 
     def __init__(self):
-        self.handler_list = []
+        Lockable.__init__(self)
+        self._handler_list = []
+        self._routes = None
         self.default_handler = None
+        # 后台处理消息的线程池，为None时使用进程内共享的默认线程池
+        self.worker_pool = None
+        # 各路由的处理耗时统计，值为[调用次数, 总耗时, 最大耗时]
+        self.route_stats = {}
+        # 与用户无关的回复缓存
+        self.reply_cache = None
+
+    @property
+    def handler_list(self):
+        return self._handler_list
+
+    @handler_list.setter
+    def handler_list(self, handlers):
+        # 修改处理器列表后重新建立索引，并清除缓存的回复
+        self._handler_list = handlers
+        self._routes = None
+        if self.reply_cache is not None:
+            self.reply_cache.invalidate()
 
     def add_handler(self, handler):
-        self.acquire()
+        self.acquire_lock()
         try:
-            self.handler_list.append(handler)
+            self.handler_list = self._handler_list + [handler]
         finally:
-            self.release()
+            self.release_lock()
 
     def remove_handler(self, handler):
-        self.acquire()
+        self.acquire_lock()
         try:
-            if handler in self.handlerList:
-                self.handler_list.append(handler)
+            if handler in self._handler_list:
+                self.handler_list = [h for h in self._handler_list if h is not handler]
         finally:
-            self.release()
+            self.release_lock()
+
+    def route_handlers(self, record):
+        """
+        获取接收该消息的处理器
+        :param record: 消息处理的中间对象
+        :return: (路由名称, 处理器列表)
+        """
+        routes = self._routes
+        if routes is None:
+            routes = self._routes = _RouteTable(self._handler_list)
+        msg_type, event, event_key = route_of(record.msg)
+        return type_label(msg_type, event), routes.lookup(msg_type, event, event_key)
+
+    def route_timings(self):
+        """
+        获取各路由的处理耗时统计
+        :return: 路由名称到{count, avg_ms, max_ms}的字典
+        """
+        timings = {}
+        for label, (count, total, maximum) in list(self.route_stats.items()):
+            timings[label] = {"count": count, "avg_ms": total / count * 1000, "max_ms": maximum * 1000}
+        return timings
+
+    def _record_route(self, label, elapsed):
+        self.acquire_lock()
+        try:
+            stats = self.route_stats.get(label)
+            if stats is None:
+                self.route_stats[label] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+        finally:
+            self.release_lock()
 
     def handle(self, record):
-        if len(self.handler_list) == 0:
-            log.warning("公众号{0}没有配置消息处理器，使用默认的EchoHandler".format(record.appid))
+        if len(self._handler_list) == 0:
+            log.warning("公众号%s没有配置消息处理器，使用默认的EchoHandler", record.appid)
             if self.default_handler is None:
                 self.default_handler = EchoHandler()
             return self.default_handler.handle(record)
-        else:
-            log.debug("进入消息处理过程，处理器为:" + str(type(self.handler_list[0])))
-            for h in self.handler_list:
+        label, handlers = self.route_handlers(record)
+        log.debug("进入消息处理过程，路由为%s，处理器数量为%d", label, len(handlers))
+        start = time.perf_counter()
+        # 之前的处理器都可缓存时，生成回复的处理器的回复才可以缓存
+        cacheable = True
+        try:
+            for h in handlers:
+                cacheable = cacheable and getattr(h, "cacheable", False)
                 if hasattr(h, 'handle'):
+                    if h.asynchronous and self.defer(h.handle, record):
+                        return ACK_REPLY
                     result = h.handle(record)
+                elif asyncio.iscoroutinefunction(h):
+                    result = asyncio.run(h(record))
                 else:
                     result = h(record)  # 调用函数
                 if not (result is None) and len(result) > 0:
+                    record.handler = h
+                    record.cacheable = cacheable
                     return result
             return ""
+        finally:
+            self._record_route(label, time.perf_counter() - start)
+
+    async def async_handle(self, record):
+        """
+        以协程方式调用消息处理器，处理规则与handle相同
+        """
+        if len(self._handler_list) == 0:
+            return self.handle(record)
+        label, handlers = self.route_handlers(record)
+        start = time.perf_counter()
+        cacheable = True
+        try:
+            for h in handlers:
+                cacheable = cacheable and getattr(h, "cacheable", False)
+                if hasattr(h, 'handle'):
+                    if h.asynchronous and self.defer(h.handle, record):
+                        return ACK_REPLY
+                    result = await h.async_handle(record)
+                elif asyncio.iscoroutinefunction(h):
+                    result = await h(record)
+                else:
+                    result = await asyncio.get_running_loop().run_in_executor(None, h, record)
+                if not (result is None) and len(result) > 0:
+                    record.handler = h
+                    record.cacheable = cacheable
+                    return result
+            return ""
+        finally:
+            self._record_route(label, time.perf_counter() - start)
+
+    def defer(self, func, record):
+        """
+        将消息交给后台线程处理，处理结果通过客服消息接口发送给用户
+        :param func: 消息处理函数
+        :param record: 消息处理的中间对象
+        :return: 如果消息已交给后台线程，返回True；线程池已满时返回False，由调用方在当前线程处理
+        """
+        pool = self.worker_pool or default_pool()
+        if pool.submit(self._reply_later, func, record):
+            return True
+        log.warning("后台线程池已满，公众号%s的消息%s改为同步处理", record.appid, record)
+        return False
+
+    @staticmethod
+    def _reply_later(func, record):
+        try:
+            result = func(record)
+        finally:
+            record.save_session()
+        if not result or result == ACK_REPLY:
+            return
+        message = to_custom_message(result)
+        if message is None:
+            log.warning("公众号%s的回复无法转换为客服消息:%s", record.appid, result)
+            return
+        record.client.send_custom_message(message)
 
 
 # ---------------------------------------------------------------------------
@@ -102,12 +454,63 @@ class MsgRecord(object):
     """
     消息处理的中间对象
     """
+    __slots__ = ("appid", "kind", "msg", "_client", "sessions", "_session", "handler", "cacheable", "account")
 
-    def __init__(self, appid, kind, msg, client):
+    def __init__(self, appid, kind, msg, client, sessions=None, account=None):
         self.appid = appid
         self.kind = kind
         self.msg = msg
-        self.client = client
+        self._client = client
+        # 接收消息的公众号，未指定client时从公众号获取API客户端
+        self.account = account
+        # 会话存储
+        self.sessions = sessions
+        self._session = None
+        # 生成回复的处理器
+        self.handler = None
+        # 回复是否与用户无关，可以缓存
+        self.cacheable = False
+
+    @property
+    def client(self):
+        """
+        公众号API调用，处理器首次使用时才创建
+        """
+        if self._client is None and self.account is not None:
+            self._client = self.account.client
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def openid(self):
+        """
+        发送消息的用户标识
+        """
+        dic = getattr(self.msg, "dic", None)
+        if dic is not None:
+            return dic.get("FromUserName")
+        return getattr(self.msg, "fromUserName", None)
+
+    @property
+    def session(self):
+        """
+        发送消息的用户的会话数据，首次访问时从会话存储中加载
+        """
+        if self._session is None:
+            if self.sessions is None:
+                raise RuntimeError("公众号{0}没有配置会话存储".format(self.appid))
+            self._session = self.sessions.open("{0}:{1}".format(self.appid, self.openid))
+        return self._session
+
+    def save_session(self):
+        """
+        如果会话数据已被修改，则写回会话存储
+        """
+        if self._session is not None:
+            self.sessions.commit(self._session)
 
     def __str__(self):
         return "{0}:{1}".format(self.appid, self.msg)
@@ -138,7 +541,10 @@ class WxAccount(_Handlerer):
     # Constructor
 
     def __init__(self, id, appid, token, secret, encoding_aes_key="",
-                 enable=True, kind=ACCOUNTKIND.SUBSCRIPTION, handler_list=None):
+                 enable=True, kind=ACCOUNTKIND.SUBSCRIPTION, handler_list=None, dedup=True,
+                 asynchronous=False, worker_pool=None, session_store=None, verify_requests=True,
+                 max_clock_skew=300, metrics_enabled=True, deadline_warning=4.0, reply_cache=True,
+                 token_store=None, token_refresher=None):
         _Handlerer.__init__(self)
         self.id = id
         # 服务器配置令牌
@@ -154,12 +560,151 @@ class WxAccount(_Handlerer):
         # 公众号类别
         self.kind = kind
 
-        self.handler_list = handler_list
+        self.handler_list = handler_list or []
+        # 是否在后台线程中处理所有消息，并立即回复微信服务器success
+        self.asynchronous = asynchronous
+        self.worker_pool = worker_pool
 
-        # 公众号API调用
-        self.client = WxClient(appid, secret)
-        # 消息加解密器
-        self.crypto = MessageCryptor(self.appid, self.token, self.encoding_aes_key)
+        # 公众号API调用和消息加解密器，首次使用时创建
+        self._client = None
+        self._crypto = None
+        # 访问令牌存储，多个工作进程共用同一公众号时只有一个进程刷新令牌；为None时保存在本进程内
+        self.token_store = token_store
+        # 后台刷新访问令牌的TokenRefresher，为None时在令牌过期后调用API时刷新
+        self.token_refresher = token_refresher
+        # 最近一次处理请求的时间，用于淘汰空闲的公众号
+        self.last_used = time.monotonic()
+        # 正在处理的请求数，公众号被替换、移除或淘汰后等到请求全部完成才关闭不再使用的存储
+        self._inflight = 0
+        self._retired = False
+        self._on_idle = []
+        # 重试消息去重器，为True时使用默认设置，为False或None时不去重
+        if dedup is True:
+            dedup = MessageDeduplicator()
+        self.deduplicator = dedup or None
+        # 是否在解析消息之前校验请求的签名、时间戳和随机数
+        self.verify_requests = verify_requests
+        # 请求时间戳与服务器时间的最大误差，单位为秒
+        self.max_clock_skew = max_clock_skew
+        # 已处理请求的随机数，时间戳在误差范围内的请求都需要记录，因此保留时间为误差的两倍
+        self.nonce_filter = RotatingBloomFilter(rotate_interval=max_clock_skew * 2) if verify_requests else None
+        # 各阶段的处理耗时统计
+        self.metrics = PipelineMetrics(id, deadline_warning) if metrics_enabled else None
+        # 用户会话存储，为None时使用进程内存储，为False时不保存会话
+        self.session_store = create_session_store(session_store) if session_store in (None, False) else session_store
+        # 与用户无关的回复缓存，为True时使用默认设置，为False或None时不缓存
+        if reply_cache is True:
+            reply_cache = ReplyCache()
+        self.reply_cache = reply_cache or None
+
+    # ----------------------------------------------------------------------
+    # Properties
+
+    @property
+    def client(self):
+        """
+        公众号API调用，首次使用时创建
+        """
+        client = self._client
+        if client is None:
+            self.acquire_lock()
+            try:
+                if self._client is None:
+                    # API层依赖requests，首次使用时才导入
+                    from weixin.api.client import WxClient
+                    self._client = WxClient(self.appid, self.secret, token_store=self.token_store,
+                                            refresher=self.token_refresher)
+                client = self._client
+            finally:
+                self.release_lock()
+        return client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def crypto(self):
+        """
+        消息加解密器，首次收到加密消息时创建，未启用加密的公众号不需要解码消息加解密密钥
+        """
+        crypto = self._crypto
+        if crypto is None:
+            self.acquire_lock()
+            try:
+                if self._crypto is None:
+                    from weixin.crypto import MessageCryptor
+                    self._crypto = MessageCryptor(self.appid, self.token, self.encoding_aes_key)
+                crypto = self._crypto
+            finally:
+                self.release_lock()
+        return crypto
+
+    @crypto.setter
+    def crypto(self, crypto):
+        self._crypto = crypto
+
+    # ----------------------------------------------------------------------
+    # 请求占用
+
+    def enter(self):
+        """
+        开始处理一个请求，处理完成后需调用leave
+        :return: 是否成功占用；公众号已被替换、移除或淘汰时返回False，调用方应重新获取公众号
+        """
+        self.acquire_lock()
+        try:
+            if self._retired:
+                return False
+            self._inflight += 1
+            return True
+        finally:
+            self.release_lock()
+
+    def leave(self):
+        """
+        结束处理一个请求，公众号已停用且没有其它请求在处理时调用停用时登记的函数
+        """
+        self.acquire_lock()
+        try:
+            self._inflight -= 1
+            callbacks = self._take_idle()
+        finally:
+            self.release_lock()
+        self._run_idle(callbacks)
+
+    def retire(self, on_idle=None, only_idle=False):
+        """
+        停用公众号，之后不再接受新的请求
+        :param on_idle: 正在处理的请求全部完成后调用的函数，没有请求在处理时立即调用
+        :param only_idle: 为True时只停用没有请求在处理的公众号
+        :return: 是否已停用
+        """
+        self.acquire_lock()
+        try:
+            if only_idle and self._inflight:
+                return False
+            self._retired = True
+            if on_idle is not None:
+                self._on_idle.append(on_idle)
+            callbacks = self._take_idle()
+        finally:
+            self.release_lock()
+        self._run_idle(callbacks)
+        return True
+
+    def _take_idle(self):
+        if self._inflight or not self._on_idle:
+            return []
+        callbacks, self._on_idle = self._on_idle, []
+        return callbacks
+
+    def _run_idle(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                log.error("公众号'%s'停用后的清理失败，原因为:%s", self.id, e)
 
     # ----------------------------------------------------------------------
     # Methods
@@ -171,54 +716,308 @@ class WxAccount(_Handlerer):
         :return: 如果验证通过，返回公众号响应字符串；否则返回空字符
         """
 
-        log.debug("接收到微信服务器验证公众号'{0}'请求，参数为:echostr={1},signature={2},timestamp={3},nonce={4}".
-                  format(self.id, echostr, signature, timestamp, nonce))
+        log.debug("接收到微信服务器验证公众号'%s'请求，参数为:echostr=%s,signature=%s,timestamp=%s,nonce=%s",
+                  self.id, echostr, signature, timestamp, nonce)
 
         if check_signature(self.token, timestamp, nonce, signature):
-            log.debug("微信服务器验证公众号'{0}'校验成功".format(self.id))
+            log.debug("微信服务器验证公众号'%s'校验成功", self.id)
             return echostr
         else:
-            log.error("微信服务器验证公众号'{0}'校验失败，参数为:echostr={1},signature={2},timestamp={3},nonce={4}".
-                      format(self.id, echostr, signature, timestamp, nonce))
+            log.error("微信服务器验证公众号'%s'校验失败，参数为:echostr=%s,signature=%s,timestamp=%s,nonce=%s",
+                      self.id, echostr, signature, timestamp, nonce)
             # 如果校验失败或服务器无法在5秒内回复，则返回空字符串或Success
             # 否则微信后台会发起三次重试
             # 三次重试后，依旧没有及时回复任何内容，系统自动在粉丝会话界面出现错误提示“该公众号暂时无法提供服务，请稍后再试
             return ""
 
+    def verify_request(self, params):
+        """
+        在解析消息之前校验请求的签名和时间戳，并识别重放的请求，伪造的请求只需计算一次SHA1即可拒绝
+        :param params: 消息请求参数
+        :return: (请求是否有效, 请求是否为重放)
+        """
+        timestamp = params.get("timestamp")
+        nonce = params.get("nonce")
+        if not check_signature(self.token, timestamp, nonce, params.get("signature")):
+            log.warning("公众号'%s'的请求签名校验失败，参数为:%s", self.id, params)
+            return False, False
+        try:
+            skew = abs(time.time() - int(timestamp))
+        except ValueError:
+            skew = None
+        if skew is None or skew > self.max_clock_skew:
+            log.warning("公众号'%s'的请求时间戳%s已过期", self.id, timestamp)
+            return False, False
+        if self.nonce_filter.add("{0}:{1}".format(timestamp, nonce)):
+            return True, True
+        return True, False
+
     def response_message(self, params, msgdata):
         """
         处理微信服务器以POST方式发送的消息并作出响应
-        :param params: 消息请求参数
+        :param params: 消息请求参数，为None时表示内部调用，不校验请求
+        :param msgdata: 消息请求数据,格式为XML
+        :return: 返回响应信息或空字符串
+        """
+        timer = StageTimer() if self.metrics is not None else None
+        if params is not None and self.verify_requests:
+            valid, replay = self.verify_request(params)
+            if timer is not None:
+                timer.mark(metrics.STAGE_VERIFY)
+            if not valid:
+                self._observe("rejected", timer)
+                return ""
+            if replay and self.deduplicator is None:
+                self._reject_replay(params, timer)
+                return ""
+        else:
+            replay = False
+        msg_dict, b_encrypt = self.unpack_message(params, msgdata, timer)
+        if replay and not self._known_message(msg_dict):
+            self._reject_replay(params, timer)
+            return ""
+        if self.deduplicator is None:
+            result = self.dispatch_message(msg_dict, timer)
+        else:
+            result = self._dispatch_once(msg_dict, timer)
+        result = self.pack_reply(result, b_encrypt, timer)
+        self._observe(message_label(msg_dict), timer)
+        return result
+
+    async def async_response_message(self, params, msgdata):
+        """
+        以协程方式处理微信服务器以POST方式发送的消息并作出响应，
+        协程类型的消息处理器直接在事件循环中执行，其它消息处理器在线程池中执行
+        :param params: 消息请求参数，为None时表示内部调用，不校验请求
         :param msgdata: 消息请求数据,格式为XML
         :return: 返回响应信息或空字符串
         """
-        log.debug("接收到微信服务器公众号'{0}'请求:{1}".format(id, msgdata))
+        timer = StageTimer() if self.metrics is not None else None
+        if params is not None and self.verify_requests:
+            valid, replay = self.verify_request(params)
+            if timer is not None:
+                timer.mark(metrics.STAGE_VERIFY)
+            if not valid:
+                self._observe("rejected", timer)
+                return ""
+            if replay and self.deduplicator is None:
+                self._reject_replay(params, timer)
+                return ""
+        else:
+            replay = False
+        msg_dict, b_encrypt = self.unpack_message(params, msgdata, timer)
+        if replay and not self._known_message(msg_dict):
+            self._reject_replay(params, timer)
+            return ""
+        if self.deduplicator is None:
+            result = await self.async_dispatch_message(msg_dict, timer)
+        else:
+            result = await self._async_dispatch_once(msg_dict, timer)
+        result = self.pack_reply(result, b_encrypt, timer)
+        self._observe(message_label(msg_dict), timer)
+        return result
+
+    def _observe(self, label, timer):
+        if timer is not None:
+            self.metrics.observe(label, timer)
+
+    def _known_message(self, msg_dict):
+        """
+        随机数过滤器命中的请求是否携带去重器中已登记的消息。签名不包含消息内容，截获的请求参数可以搭配任意消息重放，
+        因此只有正在处理、已处理完成或处理失败的同一消息才继续处理：前两者使用已有的回复，处理失败的消息由微信服务器重试
+        """
+        key = self.deduplicator.message_key(msg_dict)
+        return key is not None and self.deduplicator.peek(key) is not None
+
+    def _reject_replay(self, params, timer):
+        """
+        拒绝重放的请求：随机数过滤器命中，并且没有消息去重器或者消息未在去重器中登记。
+        布隆过滤器误判的新消息也会被拒绝，误判率很低
+        """
+        log.warning("公众号'%s'收到重放的请求，参数为:%s", self.id, params)
+        self._observe("replay", timer)
+
+    def unpack_message(self, params, msgdata, timer=None):
+        """
+        解析消息请求数据，如果消息已加密则先解密
+        :param params: 消息请求参数
+        :param msgdata: 消息请求数据,格式为XML
+        :param timer: 记录各阶段耗时的StageTimer对象
+        :return: (消息数据字典, 消息是否已加密)
+        """
+        log_body(logging.DEBUG, "接收到微信服务器公众号'%s'请求:%s", self.id, msgdata)
         # 消息是否已加密，默认为未加密
         b_encrypt = False
-        log.debug("准备进入消息转字典的过程...")
         msg_dict = msgtodict(msgdata)
-        log.debug("解析后的消息类型为:" + msg_dict["MsgType"])
+        if timer is not None:
+            timer.mark(metrics.STAGE_PARSE)
         if "Encrypt" in msg_dict.keys():
             # 消息已加密
             b_encrypt = True
+            params = params or {}
             timestamp = params.get("timestamp")
             nonce = params.get("nonce")
             msg_signature = params.get("msg_signature")
             body = msg_dict["Encrypt"]
 
             decrypt_content = self.crypto.decrypt_msg(body, msg_signature, timestamp, nonce)
-            log.info("服务器请求已加密，加密后请求为:{0}".format(decrypt_content))
+            if timer is not None:
+                timer.mark(metrics.STAGE_DECRYPT)
+            log_body(logging.INFO, "服务器请求已加密，解密后请求为:%s", decrypt_content)
             msg_dict = msgtodict(decrypt_content)
+            if timer is not None:
+                timer.mark(metrics.STAGE_PARSE)
+        log.debug("解析后的消息类型为:%s", msg_dict.get("MsgType"))
+        return msg_dict, b_encrypt
 
+    def pack_reply(self, result, b_encrypt, timer=None):
+        """
+        生成回复微信服务器的响应信息
+        :param result: 未加密的回复信息
+        :param b_encrypt: 消息是否已加密
+        :param timer: 记录各阶段耗时的StageTimer对象
+        :return: 响应信息
+        """
+        # 如果是加密模式，则响应信息也需加密返回；success和空字符串无需加密
+        if b_encrypt and result and result != ACK_REPLY:
+            result = self.crypto.encrypt_msg(result)
+            if timer is not None:
+                timer.mark(metrics.STAGE_ENCRYPT)
+        log_body(logging.DEBUG, "响应微信服务器请求，回复为:%s", result)
+        return result
+
+    def dispatch_message(self, msg_dict, timer=None):
+        """
+        将消息数据解析为消息对象，并交给消息处理器处理
+        :param msg_dict: 解密后的消息数据字典
+        :param timer: 记录各阶段耗时的StageTimer对象
+        :return: 未加密的回复信息或空字符串
+        """
+        route_key, result = self._cached_reply(msg_dict, timer)
+        if result is not None:
+            return result
         # 解析获取输入的消息对象
         input_message = parse_message(msg_dict)
-        rv = MsgRecord(self.appid, self.kind, input_message, self.client)
+        rv = MsgRecord(self.appid, self.kind, input_message, None, self.session_store, self)
+        if timer is not None:
+            timer.mark(metrics.STAGE_MESSAGE)
+        if self.asynchronous and self.defer(self.handle, rv):
+            return ACK_REPLY
+        try:
+            result = self.handle(rv) or ""
+        finally:
+            rv.save_session()
+            if timer is not None:
+                timer.mark(metrics.STAGE_HANDLE)
+        if route_key is not None and rv.cacheable:
+            self.reply_cache.put(route_key, rv.handler, result, rv.openid)
+        return result
 
-        result = self.handle(rv) or ""
-        # 如果是加密模式，则响应信息也需加密返回
-        if b_encrypt:
-            result = self.crypto.encrypt_msg(result)
-        log.debug("响应微信服务器请求，回复为:{0}".format(result))
+    async def async_dispatch_message(self, msg_dict, timer=None):
+        """
+        以协程方式将消息数据解析为消息对象，并交给消息处理器处理
+        :param msg_dict: 解密后的消息数据字典
+        :param timer: 记录各阶段耗时的StageTimer对象
+        :return: 未加密的回复信息或空字符串
+        """
+        route_key, result = self._cached_reply(msg_dict, timer)
+        if result is not None:
+            return result
+        input_message = parse_message(msg_dict)
+        rv = MsgRecord(self.appid, self.kind, input_message, None, self.session_store, self)
+        if timer is not None:
+            timer.mark(metrics.STAGE_MESSAGE)
+        if self.asynchronous and self.defer(self.handle, rv):
+            return ACK_REPLY
+        try:
+            result = await self.async_handle(rv) or ""
+        finally:
+            rv.save_session()
+            if timer is not None:
+                timer.mark(metrics.STAGE_HANDLE)
+        if route_key is not None and rv.cacheable:
+            self.reply_cache.put(route_key, rv.handler, result, rv.openid)
+        return result
+
+    def _cached_reply(self, msg_dict, timer=None):
+        """
+        查找与用户无关的缓存回复
+        :return: (回复路由, 缓存的回复)，消息不支持缓存时回复路由为None，没有缓存时回复为None
+        """
+        if self.reply_cache is None or self.asynchronous:
+            return None, None
+        route_key = self.reply_cache.route_key(msg_dict)
+        if route_key is None:
+            return None, None
+        result = self.reply_cache.get(route_key, msg_dict.get("FromUserName"))
+        if result is not None and timer is not None:
+            timer.mark(metrics.STAGE_HANDLE)
+        return route_key, result
+
+    def invalidate_replies(self, msg_type=None, key=None):
+        """
+        菜单或回复内容修改后，清除缓存的回复
+        :param msg_type: 路由类型，text表示关键字回复，click表示菜单点击；为None时清除所有回复
+        :param key: 消息内容或菜单Key值；为None时清除该类型的所有回复
+        """
+        if self.reply_cache is not None:
+            self.reply_cache.invalidate(msg_type, key)
+
+    def update_menus(self, menu):
+        """
+        创建公众号的自定义菜单，并清除缓存的菜单点击回复
+        :param menu: WxMenu类型或者Json格式字符串
+        """
+        result = self.client.create_menus(menu)
+        self.invalidate_replies("click")
+        return result
+
+    def _dispatch_once(self, msg_dict, timer=None):
+        """
+        处理消息，微信服务器重试发送的消息直接返回缓存的回复或者等待正在处理的同一消息的回复
+        """
+        key = self.deduplicator.message_key(msg_dict)
+        if key is None:
+            return self.dispatch_message(msg_dict, timer)
+        entry, owner = self.deduplicator.begin(key)
+        if not owner:
+            log.info("公众号'%s'收到重复的消息%s，使用已有的回复", self.id, key)
+            result = self.deduplicator.wait(entry)
+            if timer is not None:
+                timer.mark(metrics.STAGE_HANDLE)
+            return result
+        try:
+            result = self.dispatch_message(msg_dict, timer)
+        except Exception:
+            self.deduplicator.fail(key, entry)
+            raise
+        self.deduplicator.complete(key, entry, result)
+        return result
+
+    async def _async_dispatch_once(self, msg_dict, timer=None):
+        """
+        以协程方式处理消息，微信服务器重试发送的消息直接返回缓存的回复或者等待正在处理的同一消息的回复
+        """
+        key = self.deduplicator.message_key(msg_dict)
+        if key is None:
+            return await self.async_dispatch_message(msg_dict, timer)
+        entry, owner = self.deduplicator.begin(key)
+        if not owner:
+            log.info("公众号'%s'收到重复的消息%s，使用已有的回复", self.id, key)
+            if entry.event.is_set():
+                result = self.deduplicator.wait(entry)
+            else:
+                # 等待过程会阻塞线程，交给线程池执行
+                result = await asyncio.get_running_loop().run_in_executor(None, self.deduplicator.wait, entry)
+            if timer is not None:
+                timer.mark(metrics.STAGE_HANDLE)
+            return result
+        try:
+            result = await self.async_dispatch_message(msg_dict, timer)
+        except Exception:
+            self.deduplicator.fail(key, entry)
+            raise
+        self.deduplicator.complete(key, entry, result)
         return result
 
     def oauth_url(self, url):
@@ -242,6 +1041,14 @@ class BaseWXService(object):
     def get_account(self, id):
         raise NotImplementedError("WeChat的子类没有实现get_account方法")
 
+    @contextmanager
+    def using_account(self, id):
+        """
+        获取公众号并在处理请求期间占用，子类可以据此推迟关闭被替换或淘汰的公众号
+        :param id: 公众号标识
+        """
+        yield self.get_account(id)
+
     # ----------------------------------------------------------------------
     # 微信服务器验证
 
@@ -267,56 +1074,506 @@ class BaseWXService(object):
         :return: 回传服务器的消息文本
         """
 
-        account = self.get_account(id)
-        return account.response_message(params, msgdata)
+        with self.using_account(id) as account:
+            return account.response_message(params, msgdata)
+
+    async def async_do_post(self, id, msgdata, params=None):
+        """
+        以协程方式处理微信服务器以POST方式发送的消息并作出响应
+        :param msgdata: 消息请求数据
+        :param params:  消息请求参数
+        :return: 回传服务器的消息文本
+        """
+
+        with self.using_account(id) as account:
+            return await account.async_response_message(params, msgdata)
+
+    def metrics_snapshot(self):
+        """
+        获取各公众号的消息处理耗时统计
+        :return: 公众号标识 -> 消息类型 -> 阶段 -> 统计信息的字典
+        """
+        raise NotImplementedError("WeChat的子类没有实现metrics_snapshot方法")
 
 
 # ---------------------------------------------------------------------------
 #   SimpleWxService
 # ---------------------------------------------------------------------------
 
-class SimpleWxService(BaseWXService):
+def _without(val, name):
+    return {k: v for k, v in val.items() if k != name}
+
+
+def _client_config(val):
+    """
+    决定API客户端的配置参数，这些参数不变时更新配置后可以继续使用原客户端及其访问令牌
+    """
+    return val["appid"], val["secret"], val.get("token_store"), bool(val.get("token_refresh"))
+
+
+def _account_state(account):
+    """
+    取出公众号对象中需要在淘汰或重建公众号后保留的状态，包括API客户端及其访问令牌、令牌存储、去重缓存、会话存储和处理耗时统计
+    """
+    return {"client": account._client, "token_store": account.token_store, "deduplicator": account.deduplicator,
+            "nonce_filter": account.nonce_filter, "session_store": account.session_store, "metrics": account.metrics}
+
+
+def _refresher_of(client):
+    """
+    :return: API客户端使用的TokenRefresher；客户端尚未创建或不在后台刷新令牌时返回None
+    """
+    return getattr(client, "refresher", None) if client is not None else None
+
+
+def _reusable_state(state, old_val, val):
+    """
+    按新的配置参数筛选可以继续使用的状态
+    :param state: 原公众号的状态
+    :param old_val: 原配置参数
+    :param val: 新配置参数
+    :return: 可以继续使用的状态
+    """
+    same = {
+        "client": _client_config(old_val) == _client_config(val),
+        "token_store": old_val.get("token_store") == val.get("token_store"),
+        "deduplicator": old_val.get("dedup", True) == val.get("dedup", True),
+        "nonce_filter": old_val.get("verify", True) == val.get("verify", True),
+        "session_store": old_val.get("session") == val.get("session"),
+        "metrics": True,
+    }
+    return {name: value for name, value in state.items() if same[name]}
+
+
+def _copy_config(val):
+    """
+    复制配置参数中的字典和列表，调用方之后修改配置参数不影响已保存的配置
+    """
+    if isinstance(val, dict):
+        return {k: _copy_config(v) for k, v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return [_copy_config(v) for v in val]
+    return val
+
+
+class SimpleWxService(BaseWXService, Lockable):
     """
     提供简单的微信服务，用于响应Web服务器的请求
-    通过配置文件来设置微信公众号，公众号需要通过配置文件来修改
+    通过配置参数来设置微信公众号，运行期间可以添加、修改和移除公众号，或者从配置文件重新加载。
+    公众号字典采用写时复制的方式修改，处理请求时读取公众号无需加锁。
+    公众号默认在首次收到请求时才创建，并可以按数量上限和空闲时间淘汰，被淘汰的公众号在下次收到请求时重新创建。
+    只淘汰没有请求在处理的公众号，淘汰时保留其访问令牌、去重缓存和会话存储，重新创建时继续使用
     """
 
-    def __init__(self, settings):
+    def __init__(self, settings, lazy=True, max_accounts=None, idle_timeout=None):
+        """
+        :param settings: 公众号标识 -> 公众号配置参数的字典
+        :param lazy: 是否在首次收到请求时才创建公众号，为False时立即创建所有公众号
+        :param max_accounts: 同时保留的公众号对象数量上限，超过时淘汰最久未收到请求的公众号；为None时不限制
+        :param idle_timeout: 公众号超过该时间没有收到请求时被淘汰，单位为秒，应大于会话的有效时间；为None时不淘汰
+        """
         BaseWXService.__init__(self)
+        Lockable.__init__(self)
+        self.lazy = lazy
+        self.max_accounts = max_accounts
+        self.idle_timeout = idle_timeout
+        # 公众号标识 -> 已创建的公众号对象，修改时整体替换，不在原字典上修改
         self.accounts = {}
+        # 公众号标识 -> 公众号配置参数，修改方式与accounts相同
+        self._configs = {}
+        # 公众号标识 -> 被淘汰的公众号的状态，只在持有锁时访问
+        self._states = {}
+        self._next_sweep = time.monotonic() + idle_timeout / 2.0 if idle_timeout else float("inf")
+        self._watcher = None
+        self._watch_stop = None
         set_logger()
         if settings is None or not isinstance(settings, dict): return
-        for key in settings.keys():
-            val = settings[key]
-            if val and isinstance(val, dict) and "appid" in val.keys():
-                # 设置消息管理器
-                handlers = []
-                if "handlers" in val.keys():
-                    clslist = []
-                    for cls in val["handlers"]:
-                        if cls in clslist:
-                            log.warn("公众号{0}消息处理器'{1}'重复设置")
-                            continue
-                        try:
-                            h = Activator.new_instance(cls.strip())
-                            if isinstance(h, Handler):
-                                handlers.append(h)
-                            else:
-                                log.error("公众号{0}消息处理器'{1}'不是MessageHandler类型，实例化异常。")
-                        except Exception as e:
-                            log.error("公众号{0}消息处理器'{1}'实例化失败，原因为:{2}".format(key, cls, e))
-                        clslist.append(cls)
-                account = WxAccount(
-                    id=key,
-                    appid=val["appid"],
-                    token=val["token"],
-                    secret=val["secret"],
-                    encoding_aes_key=val.get("encodingAESKey", ""),
-                    handler_list=handlers,
-                )
-                self.accounts[key] = account
+        self.reload(settings)
+
+    # ----------------------------------------------------------------------
+    # 公众号管理
+
+    @staticmethod
+    def is_account_config(val):
+        return bool(val) and isinstance(val, dict) and "appid" in val.keys()
+
+    def account_ids(self):
+        """
+        :return: 所有已配置的公众号标识，包括尚未创建的公众号
+        """
+        return list(self._configs.keys())
+
+    def add_account(self, key, val):
+        """
+        添加公众号，公众号已存在时按新的配置参数修改
+        :param key: 公众号标识
+        :param val: 公众号配置参数
+        :return: 公众号对象；延迟创建的公众号尚未创建时返回None
+        """
+        return self.update_account(key, val)
+
+    def update_account(self, key, val):
+        """
+        按新的配置参数修改公众号。只修改了消息处理器时，直接替换原公众号的处理器列表；
+        修改了其它参数时创建新的公众号对象，开发者ID和密码未变化时保留原有的API客户端及其访问令牌，
+        令牌存储、去重和会话配置未变化时保留原有的令牌存储、去重缓存和会话存储
+        :param key: 公众号标识
+        :param val: 公众号配置参数
+        :return: 公众号对象；延迟创建的公众号尚未创建时返回None
+        """
+        val = _copy_config(val)
+        self.acquire_lock()
+        try:
+            account = self._apply(key, val)
+            configs = dict(self._configs)
+            configs[key] = val
+            self._configs = configs
+            if account is not None:
+                accounts = dict(self.accounts)
+                accounts[key] = account
+                self.accounts = accounts
+            return account
+        finally:
+            self.release_lock()
+
+    def remove_account(self, key):
+        """
+        移除公众号，正在处理的请求仍使用原公众号对象完成处理
+        :param key: 公众号标识
+        :return: 被移除的公众号对象；公众号不存在或尚未创建时返回None
+        """
+        self.acquire_lock()
+        try:
+            if key not in self._configs:
+                return None
+            configs = dict(self._configs)
+            configs.pop(key)
+            self._configs = configs
+            accounts = dict(self.accounts)
+            account = accounts.pop(key, None)
+            self.accounts = accounts
+            state = self._states.pop(key, None)
+        finally:
+            self.release_lock()
+        if account is not None:
+            self._retire(account)
+        if state is not None:
+            self._close_state(key, state)
+        log.info("公众号'%s'已移除", key)
+        return account
+
+    def reload(self, settings):
+        """
+        按新的配置参数重新加载所有公众号，配置中没有的公众号被移除。配置参数可以来自配置文件或数据库
+        :param settings: 公众号标识 -> 公众号配置参数的字典
+        """
+        configs = {key: _copy_config(val) for key, val in settings.items() if self.is_account_config(val)}
+        self.acquire_lock()
+        try:
+            accounts = {}
+            for key, val in configs.items():
+                account = self._apply(key, val)
+                if account is not None:
+                    accounts[key] = account
+            removed = [(key, a) for key, a in self.accounts.items() if key not in configs]
+            parked = [(key, self._states.pop(key)) for key in list(self._states) if key not in configs]
+            self._configs = configs
+            self.accounts = accounts
+        finally:
+            self.release_lock()
+        for key, account in removed:
+            self._retire(account)
+            log.info("公众号'%s'已移除", key)
+        for key, state in parked:
+            self._close_state(key, state)
+            log.info("公众号'%s'已移除", key)
+
+    def evict_idle(self, now=None):
+        """
+        淘汰超过idle_timeout没有收到请求并且没有请求在处理的公众号
+        :return: 被淘汰的公众号标识列表
+        """
+        if not self.idle_timeout:
+            return []
+        now = now if now is not None else time.monotonic()
+        self._next_sweep = now + self.idle_timeout / 2.0
+        self.acquire_lock()
+        try:
+            evicted = [key for key, a in self.accounts.items()
+                       if now - a.last_used >= self.idle_timeout and a.retire(only_idle=True)]
+            if evicted:
+                accounts = dict(self.accounts)
+                for key in evicted:
+                    self._park(key, accounts.pop(key))
+                self.accounts = accounts
+        finally:
+            self.release_lock()
+        if evicted:
+            log.info("淘汰了%d个空闲的公众号:%s", len(evicted), ", ".join(evicted))
+        return evicted
+
+    def _materialize(self, id):
+        """
+        创建首次收到请求的公众号，公众号数量超过上限时淘汰最久未收到请求并且没有请求在处理的公众号
+        :return: 公众号对象；公众号未配置时返回None
+        """
+        self.acquire_lock()
+        try:
+            account = self.accounts.get(id)
+            if account is not None:
+                return account
+            val = self._configs.get(id)
+            if val is None:
+                return None
+            account = self.create_account(id, val, self._states.get(id))
+            self._states.pop(id, None)
+            accounts = dict(self.accounts)
+            accounts[id] = account
+            if self.max_accounts is not None:
+                excess = len(accounts) - max(self.max_accounts, 1)
+                for key in sorted((k for k in accounts if k != id), key=lambda k: accounts[k].last_used):
+                    if excess <= 0:
+                        break
+                    if accounts[key].retire(only_idle=True):
+                        self._park(key, accounts.pop(key))
+                        excess -= 1
+            self.accounts = accounts
+        finally:
+            self.release_lock()
+        log.debug("公众号'%s'已创建，当前公众号对象数量为%d", id, len(self.accounts))
+        return account
+
+    def load_file(self, path):
+        """
+        从JSON格式的配置文件重新加载所有公众号，文件内容与WX_SETTINGS的格式相同
+        :param path: 配置文件路径
+        """
+        with open(path, encoding="utf-8") as f:
+            settings = json.load(f)
+        if not isinstance(settings, dict):
+            raise ValueError("公众号配置文件%s的内容不是JSON对象" % path)
+        self.reload(settings)
+        log.info("已从%s重新加载公众号配置，公众号数量为%d", path, len(self.accounts))
+
+    def watch_file(self, path, interval=5.0):
+        """
+        在后台线程中定期检查配置文件，文件修改后重新加载所有公众号
+        :param path: 配置文件路径
+        :param interval: 检查的时间间隔，单位为秒
+        """
+        self.stop_watch()
+        stop = threading.Event()
+
+        def watch():
+            mtime = None
+            while True:
+                try:
+                    current = os.stat(path).st_mtime
+                    if current != mtime:
+                        if mtime is not None:
+                            self.load_file(path)
+                        mtime = current
+                except Exception as e:
+                    log.error("重新加载公众号配置文件%s失败，原因为:%s", path, e)
+                if stop.wait(interval):
+                    return
+
+        self._watch_stop = stop
+        self._watcher = threading.Thread(target=watch, name="weixin-settings-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watch(self):
+        if self._watcher is not None:
+            self._watch_stop.set()
+            self._watcher.join()
+            self._watcher = None
+            self._watch_stop = None
+
+    def _apply(self, key, val):
+        """
+        根据配置参数创建或修改公众号，调用方需持有锁并负责更新配置参数字典
+        :return: 公众号对象；延迟创建的公众号尚未创建时返回None
+        """
+        old = self.accounts.get(key)
+        old_val = self._configs.get(key)
+        if old is None:
+            state = self._states.get(key)
+            if state is not None and _without(old_val, "handlers") != _without(val, "handlers"):
+                # 被淘汰的公众号的配置已修改，只保留按新配置可以继续使用的状态
+                kept = _reusable_state(state, old_val, val)
+                self._close_state(key, state, kept)
+                self._states[key] = kept
+            return None if self.lazy else self.create_account(key, val, self._states.pop(key, None))
+        if old_val == val:
+            return old
+        if _without(old_val, "handlers") == _without(val, "handlers"):
+            # 只修改了消息处理器，替换处理器列表即可，API客户端和各类缓存保持不变
+            old.handler_list = self.create_handlers(key, val)
+            log.info("公众号'%s'的消息处理器已更新", key)
+            return old
+        # 保留按新配置可以继续使用的API客户端及其访问令牌、去重缓存和会话存储，原客户端尚未创建时不创建
+        kept = _reusable_state(_account_state(old), old_val, val)
+        account = self.create_account(key, val, kept)
+        self._retire(old, kept, account)
+        log.info("公众号'%s'的配置已更新", key)
+        return account
+
+    def _park(self, key, account):
+        """
+        保留被淘汰的公众号的状态，调用方需持有锁。
+        API客户端停止后台刷新访问令牌，重新创建公众号时恢复刷新，期间调用API时按需刷新
+        """
+        state = _account_state(account)
+        refresher = _refresher_of(state["client"])
+        if refresher is not None:
+            refresher.unregister(state["client"])
+        self._states[key] = state
+
+    def _retire(self, old, kept=None, successor=None):
+        """
+        停用原公众号对象，正在处理的请求全部完成后才关闭新公众号不再使用的存储。
+        在此之前接替的新公众号也视为有请求在处理，不会被淘汰或关闭与原公众号共用的存储
+        :param old: 原公众号对象
+        :param kept: 新公众号继续使用的状态，为None时关闭所有存储
+        :param successor: 接替原公众号的新公众号
+        """
+        state = _account_state(old)
+        held = successor is not None and successor.enter()
+
+        def idle():
+            try:
+                self._close_state(old.id, state, kept)
+            finally:
+                if held:
+                    successor.leave()
+
+        old.retire(idle)
+
+    @staticmethod
+    def _close_state(id, state, kept=None):
+        """
+        关闭不再使用的会话存储和令牌存储，释放数据库连接，不再使用的API客户端停止后台刷新访问令牌
+        """
+        client = state.get("client")
+        refresher = _refresher_of(client)
+        if refresher is not None and (kept is None or kept.get("client") is not client):
+            refresher.unregister(client)
+        for name in ("session_store", "token_store"):
+            store = state.get(name)
+            if store is None or (kept is not None and kept.get(name) is store):
+                continue
+            try:
+                store.close()
+            except Exception as e:
+                log.error("公众号'%s'的%s关闭失败，原因为:%s", id, "会话存储" if name == "session_store" else "令牌存储", e)
+
+    def create_account(self, key, val, state=None):
+        """
+        根据配置参数创建公众号对象
+        :param key: 公众号标识
+        :param val: 公众号配置参数
+        :param state: 继续使用的原公众号状态，为None时全部新建
+        :return: 公众号对象
+        """
+        state = state or {}
+        dedup = state["deduplicator"] if "deduplicator" in state else val.get("dedup", True)
+        if isinstance(dedup, dict):
+            dedup = MessageDeduplicator(**dedup)
+        verify = val.get("verify", True)
+        reply_cache = val.get("reply_cache", True)
+        if isinstance(reply_cache, dict):
+            reply_cache = ReplyCache(**reply_cache)
+        if "token_store" in state:
+            token_store = state["token_store"]
+        else:
+            token_store = create_token_store(val["token_store"]) if val.get("token_store") else None
+        if "session_store" in state:
+            session_store = state["session_store"]
+        else:
+            session_store = create_session_store(val.get("session"))
+        account = WxAccount(
+            id=key,
+            appid=val["appid"],
+            token=val["token"],
+            secret=val["secret"],
+            encoding_aes_key=val.get("encodingAESKey", ""),
+            handler_list=self.create_handlers(key, val),
+            dedup=dedup,
+            asynchronous=val.get("async", False),
+            session_store=session_store,
+            verify_requests=bool(verify),
+            metrics_enabled=bool(val.get("metrics", True)),
+            deadline_warning=val.get("deadline_warning", 4.0),
+            max_clock_skew=verify.get("max_clock_skew", 300) if isinstance(verify, dict) else 300,
+            reply_cache=reply_cache,
+            token_store=token_store,
+            token_refresher=default_token_refresher() if val.get("token_refresh") else None,
+        )
+        if "client" in state:
+            account.client = state["client"]
+            refresher = _refresher_of(state["client"])
+            if refresher is not None:
+                refresher.register(state["client"])
+        if "nonce_filter" in state:
+            account.nonce_filter = state["nonce_filter"]
+        if state.get("metrics") is not None and account.metrics is not None:
+            account.metrics = state["metrics"]
+        return account
+
+    def create_handlers(self, key, val):
+        """
+        根据配置参数创建公众号的消息处理器
+        :param key: 公众号标识
+        :param val: 公众号配置参数
+        :return: 消息处理器列表
+        """
+        handlers = []
+        if "handlers" in val.keys():
+            clslist = []
+            for cls in val["handlers"]:
+                if cls in clslist:
+                    log.warning("公众号%s消息处理器'%s'重复设置", key, cls)
+                    continue
+                try:
+                    h = Activator.new_instance(cls.strip())
+                    if isinstance(h, Handler):
+                        handlers.append(h)
+                    else:
+                        log.error("公众号%s消息处理器'%s'不是MessageHandler类型，实例化异常。", key, cls)
+                except Exception as e:
+                    log.error("公众号%s消息处理器'%s'实例化失败，原因为:%s", key, cls, e)
+                clslist.append(cls)
+        return handlers
 
     def get_account(self, id):
-        if id in self.accounts.keys():
-            return self.accounts[id]
-        return None
+        account = self.accounts.get(id)
+        if account is None:
+            account = self._materialize(id)
+            if account is None:
+                return None
+        now = time.monotonic()
+        account.last_used = now
+        if now >= self._next_sweep:
+            self.evict_idle(now)
+        return account
+
+    @contextmanager
+    def using_account(self, id):
+        """
+        获取公众号并在处理请求期间占用，被占用的公众号不会被淘汰，被替换或移除后等到请求完成才关闭存储
+        :param id: 公众号标识
+        """
+        while True:
+            account = self.get_account(id)
+            # 公众号在取得后被停用时重新获取
+            if account is None or account.enter():
+                break
+        try:
+            yield account
+        finally:
+            if account is not None:
+                account.leave()
+
+    def metrics_snapshot(self):
+        return {key: account.metrics.snapshot() for key, account in self.accounts.items()
+                if account.metrics is not None}
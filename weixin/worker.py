@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：在后台线程中处理耗时的消息
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from weixin.logger import log
+
+
+class WorkerPool(object):
+    """
+    有界的后台工作线程池。
+    等待处理的任务数量达到上限时拒绝新的任务，由调用方决定是否在当前线程中处理
+    """
+
+    def __init__(self, max_workers=4, max_pending=100):
+        """
+        :param max_workers: 工作线程数量
+        :param max_pending: 正在处理和等待处理的任务数量上限
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weixin-worker")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        提交后台任务
+        :param func: 任务函数
+        :return: 如果任务被接受，返回True；线程池已满时返回False
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        try:
+            self._executor.submit(self._run, func, *args, **kwargs)
+        except RuntimeError:
+            # 线程池已经关闭
+            self._slots.release()
+            return False
+        return True
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, func, *args, **kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            log.error("后台任务%s执行失败，原因为:%s", func, e)
+        finally:
+            self._slots.release()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    """
+    获取进程内共享的默认后台工作线程池，首次调用时创建
+    """
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = WorkerPool()
+    return _default_pool
+
+
+def set_default_pool(pool):
+    """
+    设置进程内共享的默认后台工作线程池
+    :param pool: WorkerPool对象
+    """
+    global _default_pool
+    with _default_pool_lock:
+        _default_pool = pool
@@ -0,0 +1,17 @@
+"""
+ASGI config for wxbot project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Requires Django 3.0 or later; async views are served from Django 3.1.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wxbot.settings")
+
+application = get_asgi_application()
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：模拟微信服务器向本地的/wechat/<id>/发送请求，用于容量规划
+# 创建日期：2026/10/18
+# 说明：python manage.py wxload scenario.json --concurrency 20 --rate 200
+#      场景文件为JSON格式，例如：
+#      {
+#          "url": "http://127.0.0.1:8000/wechat/main/",
+#          "account": "main",
+#          "encrypted": true,
+#          "duration": 30,
+#          "rate": 100,
+#          "concurrency": 20,
+#          "timeout": 5,
+#          "retries": 3,
+#          "users": 1000,
+#          "mix": {"text": 60, "image": 10, "location": 5, "event:subscribe": 5, "event:CLICK": 20}
+#      }
+#      公众号的令牌、开发者ID和消息加解密密钥从settings.WX_SETTINGS中读取，也可以在场景文件中指定
+# -------------------------------------------------------------------------
+
+import hashlib
+import itertools
+import json
+import random
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weixin.crypto import MessageCryptor
+from weixin.utils import rand_str
+from wxbot.management.traffic import TEMPLATES, CONTENTS, MIX
+
+# 随机数和echostr使用的字符
+_LETTERS = string.ascii_letters + string.digits
+
+DEFAULT_SCENARIO = {
+    "duration": 10,
+    "requests": None,
+    "rate": 0,
+    "concurrency": 10,
+    "timeout": 5,
+    "retries": 3,
+    "users": 1000,
+    "encrypted": False,
+    "verify": True,
+}
+
+
+class _Stats(object):
+    """
+    线程安全的请求结果统计
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.sent = 0
+        self.ok = 0
+        self.empty = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.failed = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+
+class Command(BaseCommand):
+    help = "模拟微信服务器向公众号的消息接口发送签名和加密的请求，并统计延迟、错误率和超时次数"
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", help="场景文件路径")
+        parser.add_argument("--url", help="消息接口地址，覆盖场景文件中的设置")
+        parser.add_argument("--concurrency", type=int, help="并发请求数")
+        parser.add_argument("--rate", type=float, help="每秒发送的请求数，0表示不限制")
+        parser.add_argument("--duration", type=float, help="持续时间，单位为秒")
+        parser.add_argument("--requests", type=int, help="发送的请求总数，指定后忽略持续时间")
+        parser.add_argument("--output", help="保存统计结果的JSON文件")
+
+    def handle(self, *args, **options):
+        scenario = self.load_scenario(options)
+        self.stdout.write("向%s发送请求，并发数%d，速率%s" % (
+            scenario["url"], scenario["concurrency"], scenario["rate"] or "不限"))
+        if scenario["verify"] and not self.verify_server(scenario):
+            raise CommandError("服务器验证失败，请检查URL和令牌")
+
+        stats = _Stats()
+        start = time.perf_counter()
+        self.run(scenario, stats)
+        elapsed = time.perf_counter() - start
+        result = self.summarize(stats, elapsed)
+        self.print_result(result)
+        if options.get("output"):
+            with open(options["output"], "w", encoding="utf-8") as f:
+                # 不保存令牌和密钥
+                saved = {k: v for k, v in scenario.items() if k not in ("token", "encodingAESKey")}
+                json.dump(dict(result, scenario=saved), f, ensure_ascii=False, indent=2)
+
+    # ----------------------------------------------------------------------
+    # 场景
+
+    def load_scenario(self, options):
+        try:
+            with open(options["scenario"], encoding="utf-8") as f:
+                scenario = dict(DEFAULT_SCENARIO, **json.load(f))
+        except (IOError, ValueError) as e:
+            raise CommandError("无法读取场景文件%s:%s" % (options["scenario"], e))
+        for name in ("url", "concurrency", "rate", "duration", "requests"):
+            if options.get(name) is not None:
+                scenario[name] = options[name]
+        if "url" not in scenario:
+            raise CommandError("场景文件中没有指定url")
+
+        account = settings.WX_SETTINGS.get(scenario.get("account"), {})
+        for key in ("appid", "token", "encodingAESKey"):
+            scenario.setdefault(key, account.get(key))
+        if not scenario["token"]:
+            raise CommandError("没有找到公众号的令牌，请在场景文件中指定token或account")
+        scenario.setdefault("mix", dict(MIX))
+        return scenario
+
+    @staticmethod
+    def sign(token, timestamp, nonce, *args):
+        return hashlib.sha1("".join(sorted((token, timestamp, nonce) + args)).encode("utf-8")).hexdigest()
+
+    def verify_server(self, scenario):
+        """
+        模拟微信服务器的GET验证请求
+        """
+        timestamp = str(int(time.time()))
+        nonce = rand_str(10, _LETTERS)
+        echostr = rand_str(16, _LETTERS)
+        params = {"signature": self.sign(scenario["token"], timestamp, nonce), "timestamp": timestamp,
+                  "nonce": nonce, "echostr": echostr}
+        try:
+            r = requests.get(scenario["url"], params=params, timeout=scenario["timeout"])
+        except requests.RequestException as e:
+            self.stderr.write("服务器验证请求失败:%s" % e)
+            return False
+        return r.status_code == 200 and r.text == echostr
+
+    def make_request(self, scenario, cryptor, rnd, seq):
+        """
+        生成一个与微信服务器格式相同的POST请求
+        :return: (请求参数, 请求数据)
+        """
+        kinds = scenario["_kinds"]
+        kind = rnd.choice(kinds)
+        openid = "loadtest-openid-%d" % rnd.randrange(scenario["users"])
+        now = int(time.time())
+        xml = TEMPLATES[kind].format(openid=openid, ts=now, msgid=now * 100000 + seq % 100000,
+                                     content=rnd.choice(CONTENTS))
+        timestamp = str(now)
+        nonce = rand_str(10, _LETTERS)
+        params = {"signature": self.sign(scenario["token"], timestamp, nonce), "timestamp": timestamp,
+                  "nonce": nonce, "openid": openid}
+        if cryptor is not None:
+            envelope = cryptor.encrypt_msg(xml, nonce, timestamp)
+            encrypt = envelope.split("<Encrypt><![CDATA[", 1)[1].split("]]>", 1)[0]
+            xml = "<xml><ToUserName><![CDATA[gh_loadtest]]></ToUserName>" \
+                  "<Encrypt><![CDATA[%s]]></Encrypt></xml>" % encrypt
+            params["encrypt_type"] = "aes"
+            params["msg_signature"] = self.sign(scenario["token"], timestamp, nonce, encrypt)
+        return params, xml.encode("utf-8")
+
+    # ----------------------------------------------------------------------
+    # 发送
+
+    def run(self, scenario, stats):
+        cryptor = None
+        if scenario["encrypted"]:
+            cryptor = MessageCryptor(scenario["appid"], scenario["token"], scenario["encodingAESKey"])
+        scenario["_kinds"] = [k for k, weight in scenario["mix"].items() for _ in range(int(weight))]
+        rnd = random.Random(scenario.get("seed"))
+        local = threading.local()
+        slots = threading.BoundedSemaphore(scenario["concurrency"])
+        interval = 1.0 / scenario["rate"] if scenario["rate"] else 0
+        total = scenario["requests"]
+        deadline = time.perf_counter() + scenario["duration"]
+
+        def send(params, body):
+            try:
+                session = getattr(local, "session", None)
+                if session is None:
+                    session = local.session = requests.Session()
+                self.deliver(session, scenario, params, body, stats)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=scenario["concurrency"]) as executor:
+            next_at = time.perf_counter()
+            for seq in itertools.count():
+                if total is not None and seq >= total:
+                    break
+                if total is None and time.perf_counter() >= deadline:
+                    break
+                if interval:
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_at += interval
+                params, body = self.make_request(scenario, cryptor, rnd, seq)
+                slots.acquire()
+                executor.submit(send, params, body)
+        scenario.pop("_kinds")
+
+    def deliver(self, session, scenario, params, body, stats):
+        """
+        按微信服务器的方式发送请求：5秒内没有响应时断开连接，以相同的请求重新发送，最多重试retries次
+        """
+        stats.add(sent=1)
+        start = time.perf_counter()
+        for attempt in range(scenario["retries"] + 1):
+            if attempt:
+                stats.add(retries=1)
+            try:
+                r = session.post(scenario["url"], params=params, data=body, timeout=scenario["timeout"],
+                                 headers={"Content-Type": "text/xml"})
+            except requests.Timeout:
+                stats.add(timeouts=1)
+                continue
+            except requests.RequestException:
+                stats.add(errors=1)
+                continue
+            if r.status_code != 200:
+                stats.add(errors=1)
+                continue
+            stats.latency(time.perf_counter() - start)
+            stats.add(ok=1, empty=0 if r.content else 1)
+            return
+        stats.add(failed=1)
+
+    # ----------------------------------------------------------------------
+    # 统计
+
+    @staticmethod
+    def summarize(stats, elapsed):
+        latencies = sorted(stats.latencies)
+
+        def pct(q):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        attempts = stats.sent + stats.retries
+        return {
+            "elapsed": elapsed,
+            "sent": stats.sent,
+            "ok": stats.ok,
+            "empty_replies": stats.empty,
+            "failed": stats.failed,
+            "errors": stats.errors,
+            "timeouts": stats.timeouts,
+            "retries": stats.retries,
+            "error_rate": (stats.errors + stats.timeouts) / attempts if attempts else 0.0,
+            "throughput": stats.ok / elapsed if elapsed else 0.0,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99),
+                           "max": latencies[-1] * 1000 if latencies else 0.0},
+        }
+
+    def print_result(self, result):
+        self.stdout.write("耗时%.1f秒，发送%d条消息，成功%d条(空回复%d条)，最终失败%d条" % (
+            result["elapsed"], result["sent"], result["ok"], result["empty_replies"], result["failed"]))
+        self.stdout.write("重试%d次，超时%d次，错误%d次，错误率%.2f%%" % (
+            result["retries"], result["timeouts"], result["errors"], result["error_rate"] * 100))
+        self.stdout.write("吞吐量%.1f msg/s，延迟p50 %.1fms，p95 %.1fms，p99 %.1fms，最大%.1fms" % (
+            result["throughput"], result["latency_ms"]["p50"], result["latency_ms"]["p95"],
+            result["latency_ms"]["p99"], result["latency_ms"]["max"]))
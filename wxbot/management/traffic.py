@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------
+# 文件目的：模拟微信服务器推送的消息样本，供wxload压测命令和基准测试生成请求，不随weixin库发布
+# 创建日期：2026/10/18
+# -------------------------------------------------------------------------
+
+# 各类消息的比例
+MIX = (
+    ("text", 60),
+    ("image", 12),
+    ("location", 8),
+    ("event:subscribe", 5),
+    ("event:CLICK", 15),
+)
+
+TEMPLATES = {
+    "text": r"<xml>"
+            r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+            r"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+            r"<CreateTime>{ts}</CreateTime>"
+            r"<MsgType><![CDATA[text]]></MsgType>"
+            r"<Content><![CDATA[{content}]]></Content>"
+            r"<MsgId>{msgid}</MsgId>"
+            r"</xml>",
+    "image": r"<xml>"
+             r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+             r"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+             r"<CreateTime>{ts}</CreateTime>"
+             r"<MsgType><![CDATA[image]]></MsgType>"
+             r"<PicUrl><![CDATA[http://mmbiz.qpic.cn/mmbiz_jpg/{msgid}/0]]></PicUrl>"
+             r"<MediaId><![CDATA[media_{msgid}]]></MediaId>"
+             r"<MsgId>{msgid}</MsgId>"
+             r"</xml>",
+    "location": r"<xml>"
+                r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+                r"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+                r"<CreateTime>{ts}</CreateTime>"
+                r"<MsgType><![CDATA[location]]></MsgType>"
+                r"<Location_X>23.134521</Location_X>"
+                r"<Location_Y>113.358803</Location_Y>"
+                r"<Scale>20</Scale>"
+                r"<Label><![CDATA[位置信息]]></Label>"
+                r"<MsgId>{msgid}</MsgId>"
+                r"</xml>",
+    "event:subscribe": r"<xml>"
+                       r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+                       r"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+                       r"<CreateTime>{ts}</CreateTime>"
+                       r"<MsgType><![CDATA[event]]></MsgType>"
+                       r"<Event><![CDATA[subscribe]]></Event>"
+                       r"<EventKey><![CDATA[]]></EventKey>"
+                       r"</xml>",
+    "event:CLICK": r"<xml>"
+                   r"<ToUserName><![CDATA[gh_153407c191e4]]></ToUserName>"
+                   r"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+                   r"<CreateTime>{ts}</CreateTime>"
+                   r"<MsgType><![CDATA[event]]></MsgType>"
+                   r"<Event><![CDATA[CLICK]]></Event>"
+                   r"<EventKey><![CDATA[MENU_{content}]]></EventKey>"
+                   r"</xml>",
+}
+
+# 文本消息的内容和菜单事件的Key值
+CONTENTS = ("你好", "帮助", "查询订单 20180114", "今天天气怎么样", "hello world", "1")
@@ -181,6 +181,11 @@ LOGGING = {
 }
 
 # 微信配置
+# 多个工作进程部署时，为公众号设置共享的访问令牌存储，只有一个进程调用微信接口刷新令牌，例如：
+#   "token_store": {"backend": "file", "directory": "/var/run/wxbot/tokens"}
+#   "token_store": {"backend": "sqlite", "path": "/var/run/wxbot/wxbot.db"}
+#   "token_store": {"backend": "redis", "host": "127.0.0.1", "port": 6379}
+# "token_refresh": True时在后台线程中提前刷新访问令牌，调用API时不需要等待获取令牌
 WX_SETTINGS = {
     "main": {
         "appid": "wxff1ec8c09ae8c622",
@@ -190,3 +195,17 @@ WX_SETTINGS = {
         "type": 10,
     },
 }
+
+# 公众号配置文件，JSON格式，内容与WX_SETTINGS相同。设置后优先使用该文件，文件修改后自动重新加载公众号，无需重启服务
+WX_SETTINGS_FILE = None
+
+# 公众号服务参数：lazy为True时公众号在首次收到请求时才创建；max_accounts为同时保留的公众号对象数量上限；
+# idle_timeout为公众号空闲多少秒后被淘汰，被淘汰的公众号在下次收到请求时重新创建
+WX_SERVICE = {
+    "lazy": True,
+    "max_accounts": None,
+    "idle_timeout": None,
+}
+
+# 可以访问/wechat-metrics/等内部统计接口的客户端地址，按REMOTE_ADDR判断；已登录的员工账号也可以访问
+INTERNAL_IPS = ["127.0.0.1", "::1"]
@@ -10,18 +10,27 @@ Class-based views
     1. Add an import:  from other_app.views import Home
     2. Add a URL to urlpatterns:  url(r'^$', Home.as_view(), name='home')
 Including another URLconf
-    1. Import the include() function: from django.conf.urls import url, include
+    1. Import the include() function: import django
+from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import django
 from django.conf.urls import url
 from django.conf.urls.static import static
 from django.contrib import admin
 
 from .settings import STATIC_URL, STATIC_ROOT
-from .views import welcome_to_django, wx_process
+from .views import welcome_to_django, wx_process, wx_process_async, wx_metrics, \
+    wx_token_metrics
 
 urlpatterns = [
                   url(r'^$', welcome_to_django, name="index_view"),
                   url(r'^admin/', admin.site.urls),
-                  url(r'^wechat/(?P<id>[A-Za-z]+)/$', wx_process)
+                  url(r'^wechat/(?P<id>[A-Za-z]+)/$', wx_process),
+                  url(r'^wechat-metrics/$', wx_metrics),
+                  url(r'^wechat-metrics/tokens/$', wx_token_metrics),
               ] + static(STATIC_URL, document_root=STATIC_ROOT)
+
+# 协程视图需要Django 3.1以上版本，并通过wxbot.asgi部署
+if django.VERSION >= (3, 1):
+    urlpatterns.append(url(r'^wechat-async/(?P<id>[A-Za-z]+)/$', wx_process_async))
@@ -4,13 +4,17 @@
 # 创建日期：2018/1/13
 # -------------------------------------------------------------------------
 
+import functools
+import logging
+
 import django
-from django.http import HttpResponse, HttpResponseNotAllowed
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from weixin.logger import log
+from weixin.api.token import default_token_refresher
+from weixin.logger import log, log_body
 from weixin.wechat import SimpleWxService
-from .settings import WX_SETTINGS
+from .settings import WX_SETTINGS, WX_SETTINGS_FILE, WX_SERVICE, INTERNAL_IPS
 
 
 def get_ip(request):
@@ -30,7 +34,51 @@ def welcome_to_django(request):
     return HttpResponse("欢迎来到djano的编程世界，当前版本为：%s." % (django.__version__))
 
 
-wx_service = SimpleWxService(WX_SETTINGS)
+wx_service = SimpleWxService(WX_SETTINGS, **WX_SERVICE)
+if WX_SETTINGS_FILE:
+    wx_service.load_file(WX_SETTINGS_FILE)
+    wx_service.watch_file(WX_SETTINGS_FILE)
+
+
+def internal_only(view):
+    """
+    只允许INTERNAL_IPS中的地址或已登录的员工账号访问的视图。
+    X-Forwarded-For可以被客户端伪造，因此只按REMOTE_ADDR判断地址
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user = getattr(request, "user", None)
+        if request.META.get("REMOTE_ADDR") in INTERNAL_IPS or (user is not None and user.is_staff):
+            return view(request, *args, **kwargs)
+        log.warning("拒绝了来自%s的内部接口请求:%s", request.META.get("REMOTE_ADDR"), request.path)
+        return HttpResponseForbidden()
+
+    return wrapper
+
+
+@internal_only
+def wx_metrics(request):
+    """
+    以JSON格式输出各公众号消息处理各阶段的耗时统计
+    :param request: HTTP请求
+    :return: 公众号标识 -> 消息类型 -> 阶段 -> {count, avg_ms, p50_ms, p95_ms, p99_ms, max_ms}
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(['GET'])
+    return JsonResponse(wx_service.metrics_snapshot(), json_dumps_params={"ensure_ascii": False})
+
+
+@internal_only
+def wx_token_metrics(request):
+    """
+    以JSON格式输出后台刷新访问令牌的统计
+    :param request: HTTP请求
+    :return: {refreshes, failures, latency, accounts: 开发者ID -> {refreshes, failures, last_error, expires_in}}
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(['GET'])
+    return JsonResponse(default_token_refresher().snapshot(), json_dumps_params={"ensure_ascii": False})
 
 
 @csrf_exempt
@@ -47,10 +95,10 @@ def wx_process(request, id):
             # 请求消息为字节的，使用utf-8编码格式先转为字符串
             if isinstance(rec, bytes):
                 rec = rec.decode()
-            log.info("收到来自%s的公众号(标识为:%s)的请求消息:%s" % (get_ip(request), id, rec))
+            log_body(logging.INFO, "收到来自%s的公众号(标识为:%s)的请求消息:%s", get_ip(request), id, rec)
 
             result = wx_service.do_post(id, rec, request.GET)
-            log.info("响应公众号(标识为:%s)的服务器请求，回复为:%s", (id, result))
+            log_body(logging.INFO, "响应公众号(标识为:%s)的服务器请求，回复为:%s", id, result)
             return HttpResponse(result)
         elif request.method == "GET":
             try:
@@ -65,11 +113,45 @@ def wx_process(request, id):
             except ValueError:
                 return HttpResponse("wxbot")
 
-            log.info("收到来自'{0}'的公众号(标识为:{1})的服务验证请求，参数为:echostr={2},signature={3},timestamp={4},nonce={5}".
-                     format(get_ip(request), id, echostr, signature, timestamp, nonce))
+            log.info("收到来自'%s'的公众号(标识为:%s)的服务验证请求，参数为:echostr=%s,signature=%s,timestamp=%s,nonce=%s",
+                     get_ip(request), id, echostr, signature, timestamp, nonce)
             return HttpResponse(wx_service.do_get(id, echostr, signature, timestamp, nonce))
         else:
             return HttpResponseNotAllowed(['GET', 'POST'])
     except Exception as e:
         log.error(e)
 
+
+async def wx_process_async(request, id):
+    """
+    以协程方式处理来自微信服务器的请求，需要Django 3.1以上版本并部署在ASGI服务器中。
+    协程类型的消息处理器直接在事件循环中执行，不再占用Web服务器的工作线程
+    :param request: HTTP请求
+    :param id: 公众号标识
+    :return: 应答的微信消息或者为空
+    """
+    try:
+        if request.method == "POST":
+            rec = request.body
+            # 请求消息为字节的，使用utf-8编码格式先转为字符串
+            if isinstance(rec, bytes):
+                rec = rec.decode()
+            log_body(logging.INFO, "收到来自%s的公众号(标识为:%s)的请求消息:%s", get_ip(request), id, rec)
+
+            result = await wx_service.async_do_post(id, rec, request.GET)
+            log_body(logging.INFO, "响应公众号(标识为:%s)的服务器请求，回复为:%s", id, result)
+            return HttpResponse(result)
+        elif request.method == "GET":
+            # 服务器验证只需计算一次签名，直接在事件循环中处理
+            return HttpResponse(wx_service.do_get(id, request.GET.get('echostr'), request.GET.get('signature'),
+                                                  request.GET.get('timestamp'), request.GET.get('nonce')))
+        else:
+            return HttpResponseNotAllowed(['GET', 'POST'])
+    except Exception as e:
+        log.error(e)
+        return HttpResponse("")
+
+
+# Django 5.0之前的csrf_exempt把视图包装为同步函数，Django不再将其识别为协程视图，因此直接标记免除CSRF校验
+wx_process_async.csrf_exempt = True
+